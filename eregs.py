@@ -1,29 +1,102 @@
+import ast
 import logging
 from importlib import import_module
 import os
 import pkgutil
 import sys
 
-import coloredlogs
 import click
-import ipdb
+from click.utils import make_default_short_help
 import pyparsing
-import requests_cache   # @todo - replace with cache control
 
-from regparser import commands
-from regparser.commands.dependency_resolver import DependencyResolver
+from regparser import commands, metrics
+from regparser.commands.dependency_resolver import resolvers_for
 from regparser.index import dependency
 
 logger = logging.getLogger(__name__)
 DEFAULT_LOG_FORMAT = "%(asctime)s %(name)-40s %(message)s"
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """Subcommands are the modules of regparser.commands which define a
+    command of the same name. Importing them all pulls in the grammars, lxml,
+    GitPython, etc., so we only import the module of the command being run.
+    Help text is read from the modules' source instead"""
+    def __init__(self, *args, **kwargs):
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self._sources = None
+        self._docstrings = {}
+
+    def command_sources(self):
+        """Map each potential command name to its module's file"""
+        if self._sources is None:
+            self._sources = {
+                name: os.path.join(importer.path, name + '.py')
+                for importer, name, is_pkg
+                in pkgutil.iter_modules(commands.__path__) if not is_pkg}
+        return self._sources
+
+    def docstring(self, name):
+        """The docstring of the command defined in module `name` (or None,
+        if the module doesn't define a command)"""
+        if name not in self._docstrings:
+            with open(self.command_sources()[name]) as f:
+                module = ast.parse(f.read())
+            functions = [node for node in module.body
+                         if isinstance(node, ast.FunctionDef) and
+                         node.name == name and node.decorator_list]
+            self._docstrings[name] = (ast.get_docstring(functions[0]) or ''
+                                      if functions else None)
+        return self._docstrings[name]
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands) | set(
+            name for name in self.command_sources()
+            if self.docstring(name) is not None))
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.command_sources():
+            module = import_module('regparser.commands.{}'.format(name))
+            subcommand = getattr(module, name, None)
+            if isinstance(subcommand, click.Command):
+                if not isinstance(subcommand, click.Group):
+                    subcommand.callback = metrics.timed_function(
+                        'command', subcommand.name)(subcommand.callback)
+                self.add_command(subcommand)
+        return self.commands.get(name)
+
+    def format_commands(self, ctx, formatter):
+        rows = [(name, make_default_short_help(self.docstring(name) or ''))
+                for name in self.list_commands(ctx)]
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup)
 @click.option('--debug/--no-debug', default=False)
-def cli(debug):
+@click.option('--metrics-out', type=click.Path(dir_okay=False),
+              help="Write timings (per command, index entry, layer and "
+                   "preprocessor) and counters as JSON to this file")
+@click.option('--profile', metavar='STAGE',
+              help="Run the named stage (e.g. a command or layer class) "
+                   "under cProfile, writing the stats to STAGE.prof")
+@click.pass_context
+def cli(ctx, debug, metrics_out, profile):
+    # Imported here so that e.g. `eregs --help` needn't load them
+    import coloredlogs
+    from regparser import fetch
+    from regparser.tree.depth import derive
+
     log_level = logging.INFO
-    requests_cache.install_cache('fr_cache', expire_after=60*60*24*3)  # 3 days
+    fetch.fetcher.enable_cache()
+    derive.solution_cache.persist()
+    ctx.call_on_close(derive.solution_cache.evict)
+    if metrics_out or profile:
+        metrics.recorder.enable(profile)
+        ctx.call_on_close(lambda: write_metrics(metrics_out, profile))
     if debug:
+        import ipdb
         log_level = logging.DEBUG
         sys.excepthook = lambda t, v, tb: ipdb.post_mortem(tb)
     coloredlogs.install(
@@ -31,11 +104,16 @@ def cli(debug):
         fmt=os.getenv("COLOREDLOGS_LOG_FORMAT", DEFAULT_LOG_FORMAT))
 
 
-for _, command_name, _ in pkgutil.iter_modules(commands.__path__):
-    module = import_module('regparser.commands.{}'.format(command_name))
-    if hasattr(module, command_name):
-        subcommand = getattr(module, command_name)
-        cli.add_command(subcommand)
+def write_metrics(metrics_out, profile):
+    if metrics_out:
+        metrics.recorder.write(metrics_out)
+        logger.info("Wrote metrics to %s", metrics_out)
+    if profile:
+        prof_path = '{}.prof'.format(profile)
+        if metrics.recorder.dump_profile(prof_path):
+            logger.info("Wrote profile of %s to %s", profile, prof_path)
+        else:
+            logger.warning("No stage named %s was run", profile)
 
 
 def run_or_resolve(cmd, prev_dependency=None):
@@ -47,9 +125,7 @@ def run_or_resolve(cmd, prev_dependency=None):
     try:
         cmd()
     except dependency.Missing as e:
-        resolvers = [resolver(e.dependency)
-                     for resolver in DependencyResolver.__subclasses__()]
-        resolvers = [r for r in resolvers if r.has_resolution()]
+        resolvers = resolvers_for(e.dependency)
         if e.dependency == prev_dependency or len(resolvers) != 1:
             raise e
         else:
@@ -1,12 +1,21 @@
+from collections import Counter
+import gzip
+import json
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import os.path
 import shutil
+import threading
+import time
+import zlib
 
 from git import Repo
 from git.exc import InvalidGitRepositoryError
 import requests
+from requests.adapters import HTTPAdapter
 
+from regparser import metrics
 from regparser.tree.struct import Node, NodeEncoder
 from regparser.notice.encoder import AmendmentEncoder
 import settings
@@ -39,18 +48,122 @@ class FSWriteContent:
             out.write(text)
 
 
+def gzip_compress(data):
+    """Compress a string into the gzip format"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Uploader(object):
+    """Sends JSON documents to an HTTP API. Connections are pooled (via a
+    shared session) and, if `threads` > 1, requests are sent concurrently
+    from a bounded thread pool. Failed requests (connection errors and 5xx
+    responses) are retried with exponential backoff. Keeps track of
+    throughput and failures (including unexpected errors, which would
+    otherwise be lost in a worker thread); call `finish` to wait for
+    outstanding requests and retrieve a summary"""
+    STATUS_TO_RETRY = (500, 502, 503, 504)
+
+    def __init__(self, threads=1, compress=False, retries=3, backoff=0.5,
+                 timeout=60):
+        self.threads = max(threads, 1)
+        self.compress = compress
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.threads,
+                              pool_maxsize=self.threads)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._pool = ThreadPool(self.threads) if self.threads > 1 else None
+        # Limit the number of encoded documents waiting to be sent
+        self._in_flight = threading.BoundedSemaphore(self.threads * 2)
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self.documents, self.bytes_sent, self.failures = 0, 0, []
+
+    def post(self, url, python_obj):
+        """Encode and (eventually) send the provided object"""
+        body = AmendmentNodeEncoder().encode(python_obj)
+        if self._pool:
+            self._in_flight.acquire()
+            self._pool.apply_async(self._send, (url, body))
+        else:
+            self._send(url, body)
+
+    def _send(self, url, body):
+        try:
+            headers = {'content-type': 'application/json'}
+            if self.compress:
+                body = gzip_compress(body)
+                headers['content-encoding'] = 'gzip'
+
+            error = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                try:
+                    metrics.count('http.requests')
+                    response = self.session.post(
+                        url, data=body, headers=headers, timeout=self.timeout)
+                    if response.status_code not in self.STATUS_TO_RETRY:
+                        response.raise_for_status()
+                        error = None
+                        break
+                    error = 'HTTP {}'.format(response.status_code)
+                except requests.exceptions.HTTPError as exc:
+                    error = 'HTTP {}'.format(exc.response.status_code)
+                    break
+                except requests.exceptions.RequestException as exc:
+                    error = repr(exc)
+                logger.debug("Retrying %s (%s)", url, error)
+
+            with self._lock:
+                if error:
+                    logger.error("Failed to write %s: %s", url, error)
+                    self.failures.append((url, error))
+                else:
+                    self.documents += 1
+                    self.bytes_sent += len(body)
+        except Exception as exc:
+            logger.exception("Failed to write %s", url)
+            with self._lock:
+                self.failures.append((url, repr(exc)))
+        finally:
+            if self._pool:
+                self._in_flight.release()
+
+    def finish(self):
+        """Wait for any outstanding requests. Returns a summary dict"""
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        elapsed = time.time() - self._start
+        return {'documents': self.documents, 'bytes': self.bytes_sent,
+                'seconds': elapsed, 'failures': list(self.failures)}
+
+    def abort(self):
+        """Drop any outstanding requests"""
+        if self._pool:
+            self._pool.terminate()
+            self._pool = None
+
+
 class APIWriteContent:
     """This writer writes the contents to the specified API"""
-    def __init__(self, *path_parts):
+    def __init__(self, *path_parts, **kwargs):
         self.path = "/".join(path_parts)
+        self.uploader = kwargs.get('uploader') or Uploader()
 
     def write(self, python_obj):
-        """Write the object (as json) to the API"""
+        """Write the object (as json) to the API. Depending on the uploader,
+        this may happen asynchronously"""
         logger.debug("Writing %s", self.path)
-        requests.post(
-            self.path,
-            data=AmendmentNodeEncoder().encode(python_obj),
-            headers={'content-type': 'application/json'})
+        self.uploader.post(self.path, python_obj)
 
 
 class GitWriteContent:
@@ -126,10 +239,108 @@ class GitWriteContent:
             repo.index.commit(version_id)
 
 
+class Archive(object):
+    """Streams all documents into a single gzipped NDJSON file. Each line is
+    a compact JSON object with the document's `path` (e.g.
+    "regulation/1000/v2") and `data`. The final line is a manifest,
+    `{"manifest": {...}}`, with document counts per type, so that consumers
+    can verify they have read a complete archive. Writes go to a temporary
+    file, created on the first write and moved into place by `finish`.
+    Should a write fail, the temporary file is removed (as it is by
+    `abort`)"""
+    FORMAT_VERSION = 1
+    EXTENSION = '.ndjson.gz'
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + '.tmp'
+        self._file = None
+        self._encoder = AmendmentNodeEncoder(sort_keys=True,
+                                             separators=(',', ':'))
+        self._start = time.time()
+        self.counts, self.bytes_written = Counter(), 0
+
+    def _open(self):
+        if self._file is None:
+            dir_path = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+            self._file = gzip.open(self._tmp_path, 'wb')
+
+    def write(self, path, python_obj):
+        try:
+            line = self._encoder.encode({'path': path, 'data': python_obj})
+            line += '\n'
+            self._open()
+            self._file.write(line)
+        except:
+            self.abort()
+            raise
+        self.counts[path.split('/')[0]] += 1
+        self.bytes_written += len(line)
+
+    def finish(self):
+        """Write the manifest and move the archive into place. Returns a
+        summary dict"""
+        manifest = {'format': self.FORMAT_VERSION,
+                    'documents': sum(self.counts.values()),
+                    'counts': dict(self.counts)}
+        try:
+            self._open()
+            self._file.write(json.dumps({'manifest': manifest}) + '\n')
+            self._file.close()
+            os.rename(self._tmp_path, self.path)
+        except:
+            self.abort()
+            raise
+        return {'documents': manifest['documents'],
+                'bytes': self.bytes_written,
+                'seconds': time.time() - self._start, 'failures': []}
+
+    def abort(self):
+        """Close and remove the partially written archive"""
+        try:
+            if self._file and not self._file.closed:
+                self._file.close()
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+def read_archive(path):
+    """Generator of (path, data) pairs from an Archive. Raises a ValueError
+    if the archive is incomplete"""
+    counts = Counter()
+    with gzip.open(path, 'rb') as archive_file:
+        for line in archive_file:
+            record = json.loads(line)
+            if 'manifest' in record:
+                if dict(counts) != record['manifest']['counts']:
+                    raise ValueError("Archive doesn't match its manifest")
+                return
+            counts[record['path'].split('/')[0]] += 1
+            yield record['path'], record['data']
+    raise ValueError("Archive is missing its manifest")
+
+
+class ArchiveWriteContent:
+    """This writer appends the contents to an Archive"""
+    def __init__(self, *path_parts, **kwargs):
+        self.path = "/".join(path_parts[1:])
+        self.archive = kwargs['archive']
+
+    def write(self, python_obj):
+        logger.debug("Archiving %s", self.path)
+        self.archive.write(self.path, python_obj)
+
+
 class Client:
-    """A Client for writing regulation(s) and meta data."""
+    """A Client for writing regulation(s) and meta data. When writing to an
+    API, `threads` and `compress` configure the Uploader. Bases ending in
+    `.ndjson.gz` are written as a single Archive. Call `finish` when done (or
+    `abort` if giving up part way through)"""
 
-    def __init__(self, base=None):
+    def __init__(self, base=None, threads=1, compress=False):
         if base is None and settings.API_BASE:
             base = settings.API_BASE
         elif base is None and getattr(settings, 'GIT_OUTPUT_DIR', ''):
@@ -139,9 +350,17 @@ class Client:
         elif base.startswith('file://'):
             base = base[len('file://'):]
 
+        self.writer_kwargs, self.sink = {}, None
         if base.startswith('http://') or base.startswith('https://'):
             self.writer_class = APIWriteContent
             self.base = base    # keep the protocol, etc.
+            self.sink = Uploader(threads, compress)
+            self.writer_kwargs['uploader'] = self.sink
+        elif base.endswith(Archive.EXTENSION):
+            self.writer_class = ArchiveWriteContent
+            self.base = base
+            self.sink = Archive(base)
+            self.writer_kwargs['archive'] = self.sink
         elif base.startswith('git://'):
             self.writer_class = GitWriteContent
             self.base = base[len('git://'):]
@@ -149,19 +368,31 @@ class Client:
             self.writer_class = FSWriteContent
             self.base = base
 
+    def _writer(self, *path_parts):
+        return self.writer_class(self.base, *path_parts, **self.writer_kwargs)
+
     def regulation(self, label, doc_number):
-        return self.writer_class(self.base, "regulation", label, doc_number)
+        return self._writer("regulation", label, doc_number)
 
     def layer(self, layer_name, doc_type, doc_id):
-        return self.writer_class(self.base, "layer", layer_name, doc_type,
-                                 doc_id)
+        return self._writer("layer", layer_name, doc_type, doc_id)
 
     def notice(self, doc_number):
-        return self.writer_class(self.base, "notice", doc_number)
+        return self._writer("notice", doc_number)
 
     def diff(self, label, old_version, new_version):
-        return self.writer_class(self.base, "diff", label, old_version,
-                                 new_version)
+        return self._writer("diff", label, old_version, new_version)
 
     def preamble(self, doc_number):
-        return self.writer_class(self.base, "preamble", doc_number)
+        return self._writer("preamble", doc_number)
+
+    def finish(self):
+        """Wait for any outstanding writes. Returns a summary if writing to
+        an API or Archive"""
+        if self.sink:
+            return self.sink.finish()
+
+    def abort(self):
+        """Discard any outstanding writes (and any partial Archive)"""
+        if self.sink:
+            self.sink.abort()
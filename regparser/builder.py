@@ -7,7 +7,7 @@ import re
 
 from lxml import etree
 
-from regparser import api_writer, content
+from regparser import api_writer, content, metrics
 from regparser.federalregister import fetch_notice_json, fetch_notices
 from regparser.history.notices import (
     applicable as applicable_notices, group_by_eff_date)
@@ -29,7 +29,6 @@ class Builder(object):
         self.cfr_part = cfr_part
         self.doc_number = doc_number
         self.checkpointer = checkpointer or NullCheckpointer()
-        self.writer = api_writer.Client()
 
         # @todo - we probably shouldn't make an API call in the constructor
         self.eff_notices = self.checkpointer.checkpoint(
@@ -43,11 +42,17 @@ class Builder(object):
             self.notices.extend(notice_group)
 
     def write_notices(self):
-        for notice in self.notices:
-            #  No need to carry this around
-            if 'meta' in notice:
-                del notice['meta']
-            self.writer.notice(notice['document_number']).write(notice)
+        writer = api_writer.Client()
+        try:
+            for notice in self.notices:
+                #  No need to carry this around
+                if 'meta' in notice:
+                    del notice['meta']
+                writer.notice(notice['document_number']).write(notice)
+        except:
+            writer.abort()
+            raise
+        return writer.finish()
 
     def revision_generator(self, reg_tree):
         """Given an initial regulation tree, this will emit (and checkpoint)
@@ -239,7 +244,8 @@ def tree_and_builder(filename, title, checkpoint_path=None, doc_number=None):
         raise ValueError("Building from text input is no longer supported")
 
     for preprocessor in class_paths_to_classes(settings.PREPROCESSORS):
-        preprocessor().transform(reg_xml)
+        with metrics.timed('preprocessor', preprocessor.__name__):
+            preprocessor().transform(reg_xml)
 
     reg_tree = checkpointer.checkpoint(
         "init-tree-" + file_digest,
@@ -0,0 +1,623 @@
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import date
+from functools import partial
+import gc
+import glob
+import json
+from multiprocessing import Pool
+import os
+import subprocess
+import sys
+from timeit import default_timer
+
+import click
+from lxml import etree
+
+from regparser.builder import merge_changes
+from regparser.commands.diffs import ordered_version_ids
+from regparser.commands.layers import LAYER_CLASSES
+from regparser.diff import tree as diff_tree
+from regparser.history.versions import Version
+from regparser.index import entry
+from regparser.layer import graphics
+from regparser.metrics import rss
+from regparser.notice import compiler
+from regparser.plugins import class_paths_to_classes
+from regparser.test_utils import synthetic
+from regparser.tree.depth import derive, markers as mtypes
+from regparser.tree import struct
+from regparser.tree.struct import FrozenNode, Node
+from regparser.tree.xml_parser import reg_text
+from regparser.tree.xml_parser.reg_text import RegtextParagraphProcessor
+import settings
+
+
+def best_time(fn, repeat, setup=None):
+    """Run fn `repeat` times, returning the fastest time and the (last)
+    result. If provided, `setup` is called (untimed) before each run and its
+    result passed to fn. As with timeit, garbage collection is paused while
+    timing"""
+    best, result = None, None
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        gc.collect()
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = default_timer()
+            result = fn(*args)
+            elapsed = default_timer() - start
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def report(name, reference_time, optimized_time):
+    speedup = reference_time / optimized_time if optimized_time else 0
+    click.echo("{}: reference {:.4f}s, optimized {:.4f}s ({:.1f}x)".format(
+        name, reference_time, optimized_time, speedup))
+
+
+def load_reference():
+    """The original (reference) implementations live with the tests, as
+    nothing else needs them; only import them when comparing"""
+    from tests import reference
+    return reference
+
+
+@click.group()
+def benchmark():
+    """Compare optimized implementations against their reference versions,
+    using data in the index, or time the parser's stages (see `suite`)"""
+
+
+@benchmark.command()
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+@click.option('--all-pairs', is_flag=True, default=False,
+              help="Diff every pair of versions rather than adjacent ones")
+def diffs(cfr_title, cfr_part, repeat, all_pairs):
+    """Time tree diffs between the known versions of a regulation"""
+    reference = load_reference()
+    tree_dir = entry.FrozenTree(cfr_title, cfr_part)
+    version_ids = ordered_version_ids(cfr_title, cfr_part, tree_dir)
+    if len(version_ids) < 2:
+        raise click.UsageError("Need at least two trees in the index")
+    trees = {version_id: (tree_dir / version_id).read()
+             for version_id in version_ids}
+    if all_pairs:
+        pairs = [(lhs, rhs) for lhs in version_ids for rhs in version_ids]
+    else:
+        pairs = zip(version_ids, version_ids[1:])
+
+    def run(changes_between):
+        return [changes_between(trees[lhs], trees[rhs]) for lhs, rhs in pairs]
+
+    reference_time, expected = best_time(
+        lambda: run(reference.changes_between), repeat)
+    optimized_time, actual = best_time(
+        lambda: run(diff_tree.changes_between), repeat)
+    report("diff.tree.changes_between ({} pairs)".format(len(pairs)),
+           reference_time, optimized_time)
+    if expected != actual:
+        raise click.ClickException("Results differ between implementations")
+
+
+@benchmark.command('compile')
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+def compile_(cfr_title, cfr_part, repeat):
+    """Time compiling each version of a regulation from its preceding tree
+    and the changes in the associated rule, both copying the tree and
+    sharing its unchanged structure"""
+    reference = load_reference()
+    tree_dir = entry.Tree(cfr_title, cfr_part)
+    tree_ids = set(tree_dir)
+    rule_ids = set(entry.RuleChanges())
+    version_ids = list(entry.Version(cfr_title, cfr_part))
+    pairs = [(prev, curr) for prev, curr in zip(version_ids, version_ids[1:])
+             if prev in tree_ids and curr in rule_ids]
+    if not pairs:
+        raise click.UsageError("Need trees and parsed rules in the index")
+    inputs = [((tree_dir / prev).read(),
+               merge_changes(curr, entry.RuleChanges(curr).read().get(
+                   'changes', {})))
+              for prev, curr in pairs]
+    num_changes = sum(len(changes) for _, changes in inputs)
+
+    def run(compile_regulation):
+        return [compile_regulation(tree, changes) for tree, changes in inputs]
+
+    reference_time, expected = best_time(
+        lambda: run(reference.compile_regulation), repeat)
+    mismatched = []
+    for mode, share_structure in (('copying', False), ('sharing', True)):
+        optimized_time, actual = best_time(
+            lambda: run(partial(compiler.compile_regulation,
+                                share_structure=share_structure)), repeat)
+        report("notice.compiler.compile_regulation, {} ({} rules, {} "
+               "labels)".format(mode, len(pairs), num_changes),
+               reference_time, optimized_time)
+        if expected != actual:
+            mismatched.append(mode)
+    if mismatched:
+        raise click.ClickException(
+            "Results differ between implementations: " +
+            ", ".join(mismatched))
+
+
+def deep_size(roots, node_classes):
+    """Total size (in bytes) of the provided objects and everything they
+    reference. Shared (e.g. interned) objects are counted once. Returns that
+    total and the number of nodes (instances of `node_classes`)
+    encountered"""
+    seen, total, num_nodes = set(), 0, 0
+    to_visit = list(roots)
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, (list, tuple)):
+            to_visit.extend(obj)
+        elif isinstance(obj, dict):
+            to_visit.extend(obj.keys())
+            to_visit.extend(obj.values())
+        elif isinstance(obj, node_classes):
+            num_nodes += 1
+            if hasattr(obj, '__dict__'):
+                to_visit.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                to_visit.extend(getattr(obj, slot)
+                                for slot in getattr(cls, '__slots__', ())
+                                if hasattr(obj, slot))
+    return total, num_nodes
+
+
+def _reference_decode_hook(d):
+    if set(d.keys()) == struct.FullNodeEncoder.FIELDS:
+        params = dict(d)
+        tagged_text, source_xml = params.pop('tagged_text'), params.pop(
+            'source_xml')
+        node = load_reference().Node(**params)
+        if tagged_text:
+            node.tagged_text = tagged_text
+        if source_xml:
+            node.source_xml = etree.fromstring(source_xml)
+        return node
+    return d
+
+
+_DECODE_HOOKS = {'reference.Node': _reference_decode_hook,
+                 'Node': struct.full_node_decode_hook,
+                 'FrozenNode': struct.frozen_node_decode_hook}
+
+
+def _measure_trees(args):
+    """Run in a fresh process: decode the trees, returning the number of
+    nodes, their deep size and the growth in RSS"""
+    representation, json_trees = args
+    reference = load_reference()    # imported before measuring
+    before = rss()
+    trees = [json.loads(json_tree, object_hook=_DECODE_HOOKS[representation])
+             for json_tree in json_trees]
+    size, num_nodes = deep_size(trees, (Node, FrozenNode, reference.Node))
+    return num_nodes, size, rss() - before
+
+
+@benchmark.command()
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+def memory(cfr_title, cfr_part):
+    """Measure the memory needed to hold all of the known versions of a
+    regulation, for each node representation"""
+    tree_dir = entry.Tree(cfr_title, cfr_part)
+    json_trees = []
+    for version_id in tree_dir:
+        with open(str(tree_dir / version_id)) as f:
+            json_trees.append(f.read())
+    if not json_trees:
+        raise click.UsageError("No trees in the index")
+
+    for representation in sorted(_DECODE_HOOKS, reverse=True):
+        pool = Pool(1)  # a fresh process, so RSS is comparable
+        try:
+            num_nodes, size, rss_growth = pool.apply(
+                _measure_trees, [(representation, json_trees)])
+        finally:
+            pool.terminate()
+        click.echo("{}: {} nodes, {:.1f} bytes/node, {:.1f}MB deep size, "
+                   "{:.1f}MB RSS growth".format(
+                       representation, num_nodes,
+                       float(size) / max(num_nodes, 1), size / 1024.0 ** 2,
+                       rss_growth / 1024.0 ** 2))
+
+
+def section_marker_lists(tree):
+    """Reconstruct the paragraph marker lists the parser would have seen for
+    each section of a regulation tree. Markers are emphasized at the depths
+    where regulation text emphasizes them"""
+    marker_lists = []
+
+    def paragraph_markers(node):
+        for child in node.children:
+            depth = len(child.label) - 3
+            if child.is_markerless():
+                yield mtypes.MARKERLESS
+            elif depth >= 4:
+                yield mtypes.emphasize(child.label[-1])
+            else:
+                yield child.label[-1]
+            for marker in paragraph_markers(child):
+                yield marker
+
+    def walk(node):
+        if node.is_section() and node.node_type == Node.REGTEXT:
+            marker_list = list(paragraph_markers(node))
+            if marker_list:
+                marker_lists.append(marker_list)
+        else:
+            for child in node.children:
+                walk(child)
+    walk(tree)
+    return marker_lists
+
+
+@benchmark.command()
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+def depths(cfr_title, cfr_part, repeat):
+    """Time paragraph depth derivation over the section marker lists of the
+    known versions of a regulation"""
+    reference = load_reference()
+    tree_dir = entry.Tree(cfr_title, cfr_part)
+    marker_lists = [marker_list for version_id in tree_dir
+                    for marker_list in section_marker_lists(
+                        (tree_dir / version_id).read())]
+    if not marker_lists:
+        raise click.UsageError("No regulation text trees in the index")
+    constraints = RegtextParagraphProcessor().additional_constraints()
+
+    def run(derive_depths):
+        return [[tuple(par.depth for par in solution)
+                 for solution in derive_depths(marker_list, constraints)]
+                for marker_list in marker_lists]
+
+    def run_optimized():
+        derive.solution_cache = derive.SolutionCache()  # start cold
+        return run(derive.derive_depths)
+
+    original_cache = derive.solution_cache
+    try:
+        reference_time, expected = best_time(
+            lambda: run(reference.derive_depths), repeat)
+        optimized_time, actual = best_time(run_optimized, repeat)
+        cache = derive.solution_cache
+    finally:
+        derive.solution_cache = original_cache
+    report("tree.depth.derive_depths ({} marker lists)".format(
+        len(marker_lists)), reference_time, optimized_time)
+    click.echo("Solution cache: {} hits, {} misses".format(
+        cache.hits, cache.misses))
+    if expected != actual:
+        raise click.ClickException("Results differ between implementations")
+
+
+@benchmark.command()
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+def traversal(cfr_title, cfr_part, repeat):
+    """Time walking, searching and joining the text of the known versions of
+    a regulation"""
+    reference = load_reference()
+    tree_dir = entry.Tree(cfr_title, cfr_part)
+    trees = [(tree_dir / version_id).read() for version_id in tree_dir]
+    if not trees:
+        raise click.UsageError("No trees in the index")
+    # The last node in pre-order is the worst case for a search; the root's
+    # first child the best
+    last_labels = [list(struct.iter_nodes(tree))[-1].label_id()
+                   for tree in trees]
+    first_labels = [(tree.children or [tree])[0].label_id()
+                    for tree in trees]
+    num_nodes = sum(len(list(struct.iter_nodes(tree))) for tree in trees)
+
+    suites = [
+        ('walk', lambda module: [module.walk(tree, Node.label_id)
+                                 for tree in trees]),
+        ('find (last node)', lambda module: [
+            module.find(tree, label).label_id()
+            for tree, label in zip(trees, last_labels)]),
+        ('find (first child)', lambda module: [
+            module.find(tree, label).label_id()
+            for tree, label in zip(trees, first_labels)]),
+        ('join_text', lambda module: [module.join_text(tree)
+                                      for tree in trees]),
+    ]
+    mismatched = []
+    for name, run in suites:
+        reference_time, expected = best_time(lambda: run(reference), repeat)
+        optimized_time, actual = best_time(lambda: run(struct), repeat)
+        report("tree.struct.{} ({} nodes)".format(name, num_nodes),
+               reference_time, optimized_time)
+        if expected != actual:
+            mismatched.append(name)
+    if mismatched:
+        raise click.ClickException(
+            "Results differ between implementations: " +
+            ", ".join(mismatched))
+
+
+@benchmark.command()
+@click.argument('cfr_title', type=int)
+@click.argument('cfr_part', type=int)
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+def treeify(cfr_title, cfr_part, repeat):
+    """Time rebuilding a regulation's tree from a flat list of its nodes (and
+    merging duplicates from that list), doubling the number of nodes each
+    step to show how the implementations scale"""
+    reference = load_reference()
+    tree_dir = entry.Tree(cfr_title, cfr_part)
+    version_ids = list(tree_dir)
+    if not version_ids:
+        raise click.UsageError("No trees in the index")
+    # Pre-order, so every prefix of this list is itself a valid input. We
+    # skip the root, as callers generally treeify many roots at once
+    flat = [(node.text, node.label, node.node_type) for node in
+            struct.iter_nodes((tree_dir / version_ids[-1]).read())][1:]
+    if not flat:
+        raise click.UsageError("Tree has no children")
+
+    def run(fn, size):
+        nodes = [Node(text, label=label, node_type=node_type)
+                 for text, label, node_type in flat[:size]]
+        start = default_timer()
+        roots = fn(nodes)
+        elapsed = default_timer() - start
+        return elapsed, [struct.walk(root, Node.label_id) for root in roots]
+
+    def best(fn, size):
+        timings = [run(fn, size) for _ in range(repeat)]
+        return min(elapsed for elapsed, _ in timings), timings[0][1]
+
+    mismatched = []
+    size = 1
+    while True:
+        size = min(size * 2, len(flat))
+        for name in ('treeify', 'merge_duplicates'):
+            reference_time, expected = best(getattr(reference, name), size)
+            optimized_time, actual = best(getattr(struct, name), size)
+            report("tree.struct.{} ({} nodes)".format(name, size),
+                   reference_time, optimized_time)
+            if expected != actual:
+                mismatched.append("{} ({} nodes)".format(name, size))
+        if size == len(flat):
+            break
+    if mismatched:
+        raise click.ClickException(
+            "Results differ between implementations: " +
+            ", ".join(mismatched))
+
+
+# Abridged annual editions of real regulations, checked in so that `suite`
+# can time them without an index or network
+FIXTURES_DIR = os.path.join(os.path.dirname(synthetic.__file__), 'fixtures')
+# Regressions smaller than this (in seconds) are indistinguishable from noise
+MIN_REGRESSION = 0.005
+# Run in a fresh interpreter: imports everything needed before a command (or
+# `eregs --help`) can run. ru_maxrss is in kilobytes
+STARTUP_CODE = (
+    "import resource, sys, time; "
+    "rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+    "before, start = rss(), time.time(); import eregs; "
+    "sys.stdout.write('%f %d' % (time.time() - start, "
+    "(rss() - before) * 1024))")
+
+
+def time_startup(repeat):
+    """Time starting `eregs`, each run in a fresh interpreter. Returns the
+    fastest run's {seconds, rss_growth}"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        path for path in sys.path if path))
+    runs = [subprocess.check_output([sys.executable, '-c', STARTUP_CODE],
+                                    env=env).split()
+            for _ in range(repeat)]
+    seconds, rss_growth = min((float(seconds), int(rss_growth))
+                              for seconds, rss_growth in runs)
+    return {'seconds': seconds, 'rss_growth': rss_growth}
+
+
+def offline_resolve_gid(gid, overrides=None):
+    """Stands in for graphics.resolve_gid so that the suite never probes the
+    image server: the first url gid_to_url would try, without a thumbnail"""
+    return settings.DEFAULT_IMAGE_URL % gid, None
+
+
+def run_suite(xmls, num_amendments, repeat, seed=0):
+    """Time each stage of the parser over the provided regulation XML, after
+    timing startup. Returns an OrderedDict of stage name -> {seconds,
+    rss_growth}. Each stage starts with a cold depth-solution cache"""
+    results = OrderedDict([('startup', time_startup(repeat))])
+
+    def stage(name, fn, setup=None):
+        before = rss()
+        seconds, result = best_time(fn, repeat, setup)
+        results[name] = {'seconds': seconds,
+                         'rss_growth': max(rss() - before, 0)}
+        return result
+
+    def cold_cache(value=None):
+        derive.solution_cache = derive.SolutionCache()
+        return value
+
+    preprocessors = class_paths_to_classes(settings.PREPROCESSORS)
+
+    def preprocess(docs):
+        for doc in docs:
+            for preprocessor in preprocessors:
+                preprocessor().transform(doc)
+        return docs
+
+    original_cache = derive.solution_cache
+    try:
+        docs = stage('preprocess', preprocess,
+                     lambda: cold_cache([deepcopy(xml) for xml in xmls]))
+        trees = stage('build_tree',
+                      lambda copies: [reg_text.build_tree(doc)
+                                      for doc in copies],
+                      lambda: cold_cache([deepcopy(doc) for doc in docs]))
+
+        # Later stages read trees from the index, so see them as they'd be
+        # after a round trip through it
+        tree_entry = entry.Tree(12, 'synthetic', 'synthetic')
+        trees = [tree_entry.deserialize(tree_entry.serialize(tree))
+                 for tree in trees]
+        marker_lists = [marker_list for tree in trees
+                        for marker_list in section_marker_lists(tree)]
+        constraints = RegtextParagraphProcessor().additional_constraints()
+        stage('derive_depths',
+              lambda _: [derive.derive_depths(marker_list, constraints)
+                         for marker_list in marker_lists], cold_cache)
+    finally:
+        derive.solution_cache = original_cache
+
+    version = Version('synthetic', date(2000, 1, 1), date(2000, 1, 1))
+    # Images are resolved offline, bypassing the image url cache
+    original_graphics = graphics.resolve_gid, settings.GRAPHICS_CACHE_TTL
+    graphics.resolve_gid = offline_resolve_gid
+    settings.GRAPHICS_CACHE_TTL = 0
+    try:
+        for layer_name, layer_class in sorted(LAYER_CLASSES['cfr'].items()):
+            stage('layers.' + layer_name, lambda: [
+                layer_class(tree, cfr_title=12, version=version).build()
+                for tree in trees])
+    finally:
+        graphics.resolve_gid, settings.GRAPHICS_CACHE_TTL = original_graphics
+
+    changes = [synthetic.amendments(tree, num_amendments, seed)
+               for tree in trees]
+    stage('compile_regulation.copying', lambda: [
+        compiler.compile_regulation(tree, tree_changes)
+        for tree, tree_changes in zip(trees, changes)])
+    compiled = stage('compile_regulation', lambda: [
+        compiler.compile_regulation(tree, tree_changes, share_structure=True)
+        for tree, tree_changes in zip(trees, changes)])
+
+    pairs = [(FrozenNode.from_node(lhs), FrozenNode.from_node(rhs))
+             for lhs, rhs in zip(trees, compiled)]
+    stage('changes_between', lambda: [
+        dict(diff_tree.changes_between(lhs, rhs)) for lhs, rhs in pairs])
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Describe each stage relative to its baseline timing. Returns those
+    descriptions and the names of stages which are more than `threshold`
+    (a fraction) slower"""
+    lines, regressed = [], []
+    for name, result in results.items():
+        line = "{}: {:.4f}s, {:+.1f}MB RSS".format(
+            name, result['seconds'], result['rss_growth'] / 1024.0 ** 2)
+        if name in baseline:
+            previous = baseline[name]['seconds']
+            change = (result['seconds'] - previous) / previous if previous \
+                else 0
+            line += " (baseline {:.4f}s, {:+.0%})".format(previous, change)
+            if (result['seconds'] > previous * (1 + threshold) and
+                    result['seconds'] - previous > MIN_REGRESSION):
+                regressed.append(name)
+                line += " REGRESSION"
+        elif baseline:
+            line += " (new)"
+        lines.append(line)
+    return lines, regressed
+
+
+@benchmark.command()
+@click.option('--sections', type=int, default=20,
+              help="Number of sections in the synthetic regulation")
+@click.option('--depth', type=int, default=4,
+              help="Maximum paragraph depth (1-6)")
+@click.option('--breadth', type=int, default=4,
+              help="Maximum number of paragraphs per level (up to 8)")
+@click.option('--interps', type=int, default=10,
+              help="Number of sections with interpretations")
+@click.option('--appendices', type=int, default=2,
+              help="Number of appendices")
+@click.option('--amendments', type=int, default=50,
+              help="Number of changes to compile")
+@click.option('--seed', type=int, default=0,
+              help="Seed for the synthetic regulation and its amendments")
+@click.option('--xml', 'xml_files', type=click.File('rb'), multiple=True,
+              help="Use this regulation XML (e.g. an annual edition) rather "
+                   "than a synthetic regulation. May be repeated")
+@click.option('--fixtures', is_flag=True, default=False,
+              help="Use the real regulation XML checked in with the parser "
+                   "rather than a synthetic regulation")
+@click.option('--repeat', type=int, default=3,
+              help="Number of runs; the fastest is reported")
+@click.option('--baseline', type=click.Path(dir_okay=False),
+              help="JSON file of previous timings to compare against")
+@click.option('--save-baseline', is_flag=True, default=False,
+              help="Write these timings to the --baseline file rather than "
+                   "comparing against it")
+@click.option('--threshold', type=float, default=0.25,
+              help="Fail if any stage is this fraction slower than its "
+                   "baseline")
+def suite(sections, depth, breadth, interps, appendices, amendments, seed,
+          xml_files, fixtures, repeat, baseline, save_baseline, threshold):
+    """Time each stage of the parser: starting up, preprocessing, building
+    the tree, deriving paragraph depths, each layer, compiling amendments
+    and diffing. Uses a deterministic, synthetic regulation (or the provided
+    XML) and never touches the network. With a baseline, fails if any stage
+    has regressed beyond the threshold"""
+    xmls, params = [], {}
+    if xml_files:
+        xmls.extend(etree.fromstring(xml_file.read())
+                    for xml_file in xml_files)
+        params['xml'] = sorted(xml_file.name for xml_file in xml_files)
+    if fixtures:
+        paths = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.xml')))
+        xmls.extend(etree.parse(path).getroot() for path in paths)
+        params['fixtures'] = [os.path.basename(path) for path in paths]
+    if not xmls:
+        params = {'sections': sections, 'depth': depth, 'breadth': breadth,
+                  'interps': interps, 'appendices': appendices}
+        xmls = [synthetic.regulation_xml(seed=seed, **params)]
+    params.update(amendments=amendments, seed=seed)
+
+    results = run_suite(xmls, amendments, repeat, seed)
+
+    previous = {}
+    if baseline and save_baseline:
+        with open(baseline, 'w') as f:
+            json.dump({'params': params, 'stages': results}, f, indent=2,
+                      sort_keys=True)
+    elif baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored['params'] != params:
+            raise click.UsageError(
+                "Baseline was recorded with different parameters: "
+                "{}".format(json.dumps(stored['params'], sort_keys=True)))
+        previous = stored['stages']
+
+    lines, regressed = compare_to_baseline(results, previous, threshold)
+    click.echo("\n".join(lines))
+    if regressed:
+        raise click.ClickException(
+            "Slower than the baseline: " + ", ".join(regressed))
@@ -4,8 +4,9 @@ import shutil
 import click
 
 from regparser.index import entry
+import settings
 
-
+# Written by requests_cache, which we used to cache HTTP requests
 SQLITE_CACHE = 'fr_cache.sqlite'
 
 
@@ -31,5 +32,7 @@ def clear(path, http_cache):
         else:
             click.echo("Warning: path does not exist: " + path)
 
+    if http_cache and os.path.exists(settings.HTTP_CACHE_DIR):
+        shutil.rmtree(settings.HTTP_CACHE_DIR)
     if http_cache and os.path.exists(SQLITE_CACHE):
         os.remove(SQLITE_CACHE)
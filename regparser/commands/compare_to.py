@@ -4,7 +4,6 @@ import logging
 
 import click
 import requests
-import requests_cache
 from json_delta import udiff
 from six.moves import urllib
 
@@ -92,9 +91,5 @@ def compare_to(api_base, paths, prompt):
     if not api_base.endswith("/"):
         api_base += "/"
 
-    # @todo: ugly to uninstall the cache after installing it in eregs.py.
-    # Remove the globalness
-    requests_cache.uninstall_cache()
-
     pairs = local_and_remote_generator(api_base, paths)
     return any([compare(local, remote, prompt) for local, remote in pairs])
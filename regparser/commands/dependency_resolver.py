@@ -1,7 +1,11 @@
 import abc
+from importlib import import_module
 import os
+import pkgutil
 import re
 
+from regparser import commands
+
 
 class DependencyResolver(object):
     """Base class for objects which know how to "fix" missing dependencies."""
@@ -22,3 +26,14 @@ class DependencyResolver(object):
         """This will generally call a command in an effort to resolve a
         dependency"""
         raise NotImplementedError()
+
+
+def resolvers_for(dependency_path):
+    """Instances of each resolver which can handle this dependency. Resolvers
+    are defined alongside the commands they run, which may not have been
+    imported yet, so we import all of the command modules first"""
+    for _, command_name, _ in pkgutil.iter_modules(commands.__path__):
+        import_module('regparser.commands.{}'.format(command_name))
+    resolvers = [resolver(dependency_path)
+                 for resolver in DependencyResolver.__subclasses__()]
+    return [r for r in resolvers if r.has_resolution()]
@@ -1,3 +1,6 @@
+from collections import OrderedDict
+from multiprocessing import Pool
+
 import click
 import logging
 
@@ -7,28 +10,126 @@ from regparser.index import dependency, entry
 logger = logging.getLogger(__name__)
 
 
+class TreeCache(object):
+    """Reads trees from the index, holding on to only the `size` most
+    recently used"""
+    def __init__(self, tree_dir, size):
+        self.tree_dir = tree_dir
+        self.size = max(size, 2)    # we need to hold both sides of a diff
+        self._trees = OrderedDict()
+        self.reads = 0
+
+    def __getitem__(self, version_id):
+        if version_id in self._trees:
+            tree = self._trees.pop(version_id)
+        else:
+            tree = (self.tree_dir / version_id).read()
+            self.reads += 1
+            if len(self._trees) >= self.size:
+                self._trees.popitem(last=False)
+        self._trees[version_id] = tree
+        return tree
+
+
+def ordered_version_ids(cfr_title, cfr_part, tree_dir):
+    """Ids of the versions with a tree in `tree_dir`, in chronological (rather
+    than filename) order. Trees without a known version come last"""
+    tree_ids = set(tree_dir)
+    version_ids = [version_id
+                   for version_id in entry.Version(cfr_title, cfr_part)
+                   if version_id in tree_ids]
+    return version_ids + sorted(tree_ids - set(version_ids))
+
+
+def windowed_pairs(version_ids, window=None):
+    """All ordered pairs of versions, or only those within `window` positions
+    of each other (e.g. window=1 for adjacent versions)"""
+    return [(lhs, rhs)
+            for lhs_idx, lhs in enumerate(version_ids)
+            for rhs_idx, rhs in enumerate(version_ids)
+            if window is None or abs(lhs_idx - rhs_idx) <= window]
+
+
+def schedule(pairs, version_ids, cache_size):
+    """Order pairs to make the most of a TreeCache of the provided size. We
+    split the versions into blocks, each half the size of the cache, and
+    process all of the pairs between two blocks before moving on. The order
+    of blocks "snakes" so that consecutive block-pairs share a block"""
+    block_size = max(cache_size // 2, 1)
+    block_of = {version_id: idx // block_size
+                for idx, version_id in enumerate(version_ids)}
+
+    def sort_key(pair):
+        lhs_block, rhs_block = block_of[pair[0]], block_of[pair[1]]
+        if lhs_block % 2:
+            rhs_block = -rhs_block
+        return (lhs_block, rhs_block, pair)
+    return sorted(pairs, key=sort_key)
+
+
+def compute_diff(trees, lhs_id, rhs_id):
+    return dict(changes_between(trees[lhs_id], trees[rhs_id]))
+
+
+_worker_trees = []
+
+
+def _init_worker(tree_path, cache_size):
+    """Process-pool initializer: each worker has its own TreeCache"""
+    _worker_trees.append(TreeCache(entry.FrozenTree(*tree_path), cache_size))
+
+
+def _diff_in_worker(pair):
+    return compute_diff(_worker_trees[0], *pair)
+
+
+def _write_diffs(diff_dir, pairs, results):
+    for (lhs_id, rhs_id), result in zip(pairs, results):
+        (diff_dir / lhs_id / rhs_id).write(result)
+
+
 @click.command()
 @click.argument('cfr_title', type=int)
 @click.argument('cfr_part', type=int)
-def diffs(cfr_title, cfr_part):
+@click.option('--window', type=int,
+              help="Only diff versions within this many positions of each "
+                   "other (e.g. 1 for adjacent versions). Defaults to all")
+@click.option('--tree-cache', type=int, default=10,
+              help="Number of trees to hold in memory (per process)")
+@click.option('--workers', type=int, default=1,
+              help="Number of processes to compute diffs with")
+def diffs(cfr_title, cfr_part, window, tree_cache, workers):
     """Construct diffs between known trees."""
     logger.info("Build diffs - %s Part %s", cfr_title, cfr_part)
     tree_dir = entry.FrozenTree(cfr_title, cfr_part)
     diff_dir = entry.Diff(cfr_title, cfr_part)
-    pairs = [(lhs, rhs) for lhs in tree_dir for rhs in tree_dir]
+    version_ids = ordered_version_ids(cfr_title, cfr_part, tree_dir)
+    pairs = windowed_pairs(version_ids, window)
     deps = dependency.Graph()
-    for lhs_id, rhs_id in pairs:
-        deps.add(diff_dir / lhs_id / rhs_id, tree_dir / lhs_id)
-        deps.add(diff_dir / lhs_id / rhs_id, tree_dir / rhs_id)
+    with deps.batch():
+        for lhs_id, rhs_id in pairs:
+            deps.add(diff_dir / lhs_id / rhs_id, tree_dir / lhs_id)
+            deps.add(diff_dir / lhs_id / rhs_id, tree_dir / rhs_id)
 
-    trees = {}
+    stale = []
     for lhs_id, rhs_id in pairs:
         path = diff_dir / lhs_id / rhs_id
         deps.validate_for(path)
         if deps.is_stale(path):
-            if lhs_id not in trees:
-                trees[lhs_id] = (tree_dir / lhs_id).read()
-            if rhs_id not in trees:
-                trees[rhs_id] = (tree_dir / rhs_id).read()
+            stale.append((lhs_id, rhs_id))
+    stale = schedule(stale, version_ids, tree_cache)
 
-            path.write(dict(changes_between(trees[lhs_id], trees[rhs_id])))
+    if workers > 1 and stale:
+        pool = Pool(workers, _init_worker, (tree_dir.path, tree_cache))
+        try:
+            # Keep a block's worth of consecutive pairs in the same worker
+            chunksize = max(tree_cache // 2, 1) ** 2
+            _write_diffs(diff_dir, stale,
+                         pool.imap(_diff_in_worker, stale, chunksize))
+        finally:
+            pool.terminate()
+    else:
+        trees = TreeCache(tree_dir, tree_cache)
+        _write_diffs(diff_dir, stale, (compute_diff(trees, *pair)
+                                       for pair in stale))
+        logger.debug("Read %s trees for %s diffs", trees.reads, len(stale))
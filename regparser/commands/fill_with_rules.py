@@ -19,11 +19,12 @@ def dependencies(tree_path, version_ids, cfr_title, cfr_part):
             if curr not in existing_ids]
 
     deps = dependency.Graph()
-    for prev, curr in gaps:
-        deps.add(tree_path / curr, tree_path / prev)
-        deps.add(tree_path / curr, entry.RuleChanges(curr))
-        deps.add(tree_path / curr,
-                 entry.Version(cfr_title, cfr_part, curr))
+    with deps.batch():
+        for prev, curr in gaps:
+            deps.add(tree_path / curr, tree_path / prev)
+            deps.add(tree_path / curr, entry.RuleChanges(curr))
+            deps.add(tree_path / curr,
+                     entry.Version(cfr_title, cfr_part, curr))
     return deps
 
 
@@ -46,7 +47,8 @@ def process(tree_path, previous, version_id):
     prev_tree = (tree_path / previous).read()
     notice = entry.RuleChanges(version_id).read()
     changes = merge_changes(version_id, notice.get('changes', {}))
-    new_tree = compile_regulation(prev_tree, changes)
+    # prev_tree isn't used again, so the new tree can share its nodes
+    new_tree = compile_regulation(prev_tree, changes, share_structure=True)
     (tree_path / version_id).write(new_tree)
 
 
@@ -1,5 +1,4 @@
 import click
-import requests_cache
 from stevedore import extension
 from stevedore.exception import NoMatches
 
@@ -27,11 +26,12 @@ def get_stevedore_module_names(namespace):
 @click.command()
 def full_tests():
     import nose
+    from regparser import fetch
 
     mymods = ["", "tests"]  # nose essentially ignores the first arg to argv.
     mymods.extend(get_stevedore_module_names("eregs_ns.parser.test_suite"))
 
-    requests_cache.uninstall_cache()
+    fetch.fetcher.disable_cache()
 
     nose.run(argv=mymods)
 
@@ -0,0 +1,17 @@
+import click
+
+from regparser.fetch import Fetcher
+
+
+@click.command()
+def http_cache_stats():
+    """Summarize the HTTP cache: the number of cached responses and the
+    space used by them and by the large bodies stored alongside them. Per-run
+    hit rates are reported by `eregs --metrics-out`"""
+    fetcher = Fetcher()
+    fetcher.enable_cache()
+    stats = fetcher.stats()
+    click.echo("Responses: {} ({:,} bytes)".format(
+        stats['responses'], stats['responses_bytes']))
+    click.echo("Large bodies: {} ({:,} bytes)".format(
+        stats['blobs'], stats['blobs_bytes']))
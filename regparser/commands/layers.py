@@ -1,8 +1,13 @@
+from multiprocessing import Pool
+
 import click
 import logging
 
 from regparser.commands import utils
 from regparser.index import dependency, entry
+from regparser.layer.cache import LayerCache
+from regparser.layer.graphics import ImageUrlCache
+from regparser.layer.internal_citations import CitationCache
 from regparser.plugins import classes_by_shorthand
 import settings
 
@@ -22,12 +27,13 @@ def stale_layers(doc_entry, doc_type):
     particular doc_type"""
     deps = dependency.Graph()
     layer_dir = entry.Layer(doc_type, *doc_entry.path)
-    for layer_name in LAYER_CLASSES[doc_type]:
-        # Layers depend on their associated tree
-        deps.add(layer_dir / layer_name, doc_entry)
-    if doc_type == 'cfr':
-        # Meta layer also depends on the version info
-        deps.add(layer_dir / 'meta', entry.Version(*doc_entry.path))
+    with deps.batch():
+        for layer_name in LAYER_CLASSES[doc_type]:
+            # Layers depend on their associated tree
+            deps.add(layer_dir / layer_name, doc_entry)
+        if doc_type == 'cfr':
+            # Meta layer also depends on the version info
+            deps.add(layer_dir / 'meta', entry.Version(*doc_entry.path))
 
     for layer_name in LAYER_CLASSES[doc_type]:
         layer_entry = layer_dir / layer_name
@@ -36,18 +42,73 @@ def stale_layers(doc_entry, doc_type):
             yield layer_name
 
 
-def process_cfr_layers(stale_names, cfr_title, version_entry):
+def build_cfr_layer(layer_name, tree, cfr_title, version, cache=None):
+    """Construct a single CFR layer's JSON-ready dict"""
+    return LAYER_CLASSES['cfr'][layer_name](
+        tree, cfr_title=int(cfr_title), version=version).build(cache)
+
+
+def process_cfr_layers(stale_names, cfr_title, version_entry, cache=None):
     """Build all of the stale layers for this version, writing them into the
     index. Assumes all dependencies have already been checked"""
     tree = entry.Tree(*version_entry.path).read()
     version = version_entry.read()
     layer_dir = entry.Layer.cfr(*version_entry.path)
     for layer_name in stale_names:
-        layer_json = LAYER_CLASSES['cfr'][layer_name](
-            tree, cfr_title=int(cfr_title), version=version).build()
+        layer_json = build_cfr_layer(layer_name, tree, cfr_title, version,
+                                     cache)
         (layer_dir / layer_name).write(layer_json)
 
 
+_worker_inputs = {}
+_worker_cache = []
+
+
+def _build_cfr_layer_unit(work_unit):
+    """Process-pool entry point. Builds one (version, layer) work unit and
+    returns the result to the parent, which is responsible for writing it.
+    Work units for the same version tend to arrive together, so we hold on to
+    the most recently read tree/version rather than re-reading them for each
+    layer. Also returns the cache hits and misses incurred"""
+    layer_name, version_path, use_cache = work_unit
+    if version_path not in _worker_inputs:
+        _worker_inputs.clear()
+        _worker_inputs[version_path] = (entry.Tree(*version_path).read(),
+                                        entry.Version(*version_path).read())
+    tree, version = _worker_inputs[version_path]
+    if use_cache and not _worker_cache:
+        _worker_cache.append(LayerCache())
+    cache = _worker_cache[0] if use_cache else None
+
+    hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+    layer_json = build_cfr_layer(layer_name, tree, version_path[0], version,
+                                 cache)
+    if cache:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return layer_json, hits, misses
+
+
+def process_cfr_layers_in_pool(work_units, workers, cache=None):
+    """Fan a list of (layer_name, version_path) pairs out to a pool of
+    worker processes. Results are written by this (the parent) process, in
+    the same order as the serial path would write them"""
+    pool = Pool(workers)
+    try:
+        results = pool.imap(
+            _build_cfr_layer_unit,
+            [(layer_name, version_path, cache is not None)
+             for layer_name, version_path in work_units])
+        for (layer_name, version_path), result in zip(work_units, results):
+            layer_json, hits, misses = result
+            if cache:
+                cache.hits += hits
+                cache.misses += misses
+            layer_dir = entry.Layer.cfr(*version_path)
+            (layer_dir / layer_name).write(layer_json)
+    finally:
+        pool.terminate()
+
+
 def process_preamble_layers(stale_names, preamble_entry):
     """Build all of the stale layers for this preamble, writing them into the
     index. Assumes all dependencies have already been checked"""
@@ -61,17 +122,34 @@ def process_preamble_layers(stale_names, preamble_entry):
 @click.command()
 @click.option('--cfr_title', type=int, help="Limit to one CFR title")
 @click.option('--cfr_part', type=int, help="Limit to one CFR part")
+@click.option('--workers', type=int, default=1,
+              help="Number of processes to build CFR layers with")
+@click.option('--cache/--no-cache', default=True,
+              help="Re-use layer results for unchanged paragraphs")
 # @todo - allow layers to be passed as a parameter
-def layers(cfr_title, cfr_part):
+def layers(cfr_title, cfr_part, workers, cache):
     """Build all layers for all known versions."""
     logger.info("Build layers - %s CFR %s", cfr_title, cfr_part)
 
+    cache = LayerCache() if cache else None
+    work_units = []
     for tree_entry in utils.relevant_paths(entry.Tree(), cfr_title, cfr_part):
         tree_title, tree_part, version_id = tree_entry.path
         version_entry = entry.Version(tree_title, tree_part, version_id)
         stale = stale_layers(tree_entry, 'cfr')
-        if stale:
-            process_cfr_layers(stale, tree_title, version_entry)
+        if workers > 1:
+            work_units.extend((layer_name, version_entry.path)
+                              for layer_name in stale)
+        elif stale:
+            process_cfr_layers(stale, tree_title, version_entry, cache)
+    if work_units:
+        process_cfr_layers_in_pool(work_units, workers, cache)
+    if cache:
+        logger.info("Layer cache: %s hits, %s misses", cache.hits,
+                    cache.misses)
+        cache.evict()
+        CitationCache().evict()
+    ImageUrlCache().evict()
 
     if cfr_title is None and cfr_part is None:
         preamble_dir = entry.Preamble()
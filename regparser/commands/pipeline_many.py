@@ -0,0 +1,291 @@
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.queues import SimpleQueue
+import os
+import logging
+import time
+from timeit import default_timer
+import traceback
+
+import click
+
+from regparser.commands.annual_editions import annual_editions
+from regparser.commands.current_version import current_version
+from regparser.commands.dependency_resolver import resolvers_for
+from regparser.commands.diffs import diffs
+from regparser.commands.fill_with_rules import fill_with_rules
+from regparser.commands.layers import layers
+from regparser.commands.sxs_layers import sxs_layers
+from regparser.commands.sync_xml import sync_xml
+from regparser.commands.versions import versions
+from regparser.commands.write_to import write_to
+from regparser.index import dependency
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = {command.name: command
+            for command in (annual_editions, current_version, diffs,
+                            fill_with_rules, layers, sxs_layers, sync_xml,
+                            versions, write_to)}
+# Stages of the pipeline for a single part, mapped to the stages they follow
+FULL_STAGES = OrderedDict([
+    ('versions', ()),
+    ('annual_editions', ('versions',)),
+    ('fill_with_rules', ('annual_editions',)),
+    ('layers', ('fill_with_rules',)),
+    # sxs_layers is required until we stop using SxS data for version info.
+    # It builds a layer for each tree, so must wait for all of them
+    ('sxs_layers', ('fill_with_rules',)),
+    ('diffs', ('fill_with_rules',)),
+    ('write_to', ('layers', 'sxs_layers', 'diffs')),
+])
+LATEST_STAGES = OrderedDict([
+    ('current_version', ()),
+    ('layers', ('current_version',)),
+    ('sxs_layers', ('current_version',)),
+    ('diffs', ('current_version',)),
+    ('write_to', ('layers', 'sxs_layers', 'diffs')),
+])
+SYNC = (None, 'sync_xml')   # shared by all of the parts
+# Seconds between checks on running tasks (and the processes running them)
+POLL_INTERVAL = 0.1
+
+
+def parse_part(text):
+    """Convert "12:1026" or "12 1026" into a (cfr_title, cfr_part) pair"""
+    fields = text.replace(':', ' ').split()
+    if len(fields) != 2 or not all(field.isdigit() for field in fields):
+        raise click.BadParameter(
+            "Expected TITLE:PART, e.g. 12:1026; got {!r}".format(text))
+    return int(fields[0]), int(fields[1])
+
+
+def build_tasks(parts, only_latest):
+    """Construct the task graph. Tasks are (part, stage) pairs, mapped to the
+    set of tasks which must succeed before they can run. Parts don't depend
+    on each other, except via the shared XML sync"""
+    stages = LATEST_STAGES if only_latest else FULL_STAGES
+    tasks = OrderedDict([(SYNC, set())])
+    for part in parts:
+        for stage, prereqs in stages.items():
+            tasks[(part, stage)] = set((part, prereq) for prereq in prereqs)
+            if not prereqs:
+                tasks[(part, stage)].add(SYNC)
+    return tasks
+
+
+def invoke_resolving(command, **params):
+    """Invoke a click command, resolving missing dependencies as they arise.
+    Mirrors the handling of the `eregs` entry point"""
+    prev_dependency = None
+    while True:
+        try:
+            with click.Context(command) as ctx:
+                return ctx.invoke(command, **params)
+        except dependency.Missing as e:
+            resolvers = resolvers_for(e.dependency)
+            if e.dependency == prev_dependency or len(resolvers) != 1:
+                raise
+            logger.info("Attempting to resolve dependency: %s", e.dependency)
+            resolvers[0].resolution()
+            prev_dependency = e.dependency
+
+
+def run_task(args):
+    """Run one stage, returning how long it took and an error message (or
+    None). Executed in the worker processes, so exceptions are logged and
+    reported rather than raised"""
+    stage, params = args
+    start = default_timer()
+    try:
+        invoke_resolving(COMMANDS[stage], **params)
+        error = None
+    except Exception as e:
+        logger.exception("Failed %s %r", stage, params)
+        error = traceback.format_exception_only(type(e), e)[-1].strip()
+    return default_timer() - start, error
+
+
+_started = []
+
+
+def _init_worker(started):
+    """Process-pool initializer: workers report the tasks they start"""
+    _started.append(started)
+
+
+def _run_in_worker(task, args):
+    _started[0].put((task, os.getpid()))
+    return run_task(args)
+
+
+class _WorkerMonitor(object):
+    """Tracks which pool process is running each task, so that tasks whose
+    process dies (e.g. killed for using too much memory) can be failed
+    rather than waited on forever"""
+    def __init__(self, pool, started):
+        self.pool = pool
+        self.started = started
+        self.pids = {}
+        self.suspects = set()
+
+    def lost(self, running):
+        """Tasks which have been running in a dead process for a full poll.
+        The grace period lets results sent just before a process exited
+        arrive"""
+        while not self.started.empty():
+            task, pid = self.started.get()
+            self.pids[task] = pid
+        # The pool replaces dead processes, but doesn't expose them
+        alive = set(process.pid for process in list(self.pool._pool)
+                    if process.is_alive())
+        dead = set(task for task in running
+                   if task in self.pids and self.pids[task] not in alive)
+        lost, self.suspects = dead & self.suspects, dead
+        return lost
+
+
+def run_dag(tasks, task_args, workers=1, serial=()):
+    """Run each task once all of the tasks it depends on have succeeded;
+    tasks which depend on a failed task are skipped. With more than one
+    worker, independent tasks run concurrently in a process pool. Tasks
+    whose stage is in `serial` never run alongside each other. Returns a
+    dictionary of task -> (seconds, error message or None)"""
+    remaining = OrderedDict((task, set(deps)) for task, deps in tasks.items())
+    results, running, finished = {}, {}, []
+    if workers > 1:
+        # Unbuffered, so workers' reports arrive even if they die mid-task
+        started = SimpleQueue()
+        pool = Pool(workers, _init_worker, (started,))
+        monitor = _WorkerMonitor(pool, started)
+    else:
+        pool = None
+
+    def skip_failed():
+        """Skip tasks which depend on a failed task, transitively"""
+        skipped = True
+        while skipped:
+            skipped = False
+            for task, deps in remaining.items():
+                failed = [dep for dep in deps
+                          if dep in results and results[dep][1]]
+                if failed:
+                    del remaining[task]
+                    results[task] = (0, "Skipped; {} failed".format(
+                        failed[0][1]))
+                    skipped = True
+
+    def startable(task):
+        return (all(dep in results for dep in remaining[task]) and
+                not (task[1] in serial and
+                     any(stage == task[1] for _, stage in running)))
+
+    try:
+        while remaining or running:
+            skip_failed()
+            if not remaining and not running:
+                break
+            for task in filter(startable, remaining.keys()):
+                if not startable(task):     # a serial stage just started
+                    continue
+                del remaining[task]
+                if pool:
+                    running[task] = (default_timer(), pool.apply_async(
+                        _run_in_worker, [task, task_args(task)]))
+                else:
+                    running[task] = None
+                    finished.append((task, run_task(task_args(task))))
+                    break   # run serially, re-evaluating what's ready
+            if not running:     # only possible with a cycle
+                raise ValueError("Unsatisfiable dependencies: {}".format(
+                    list(remaining)))
+            while not finished:
+                for task, (start, async_result) in running.items():
+                    if async_result.ready():
+                        finished.append((task, async_result.get()))
+                for task in monitor.lost(running):
+                    if not running[task][1].ready():
+                        finished.append((task, (
+                            default_timer() - running[task][0],
+                            "Worker process died")))
+                if not finished:
+                    time.sleep(POLL_INTERVAL)
+            for task, result in finished:
+                del running[task]
+                results[task] = result
+                if result[1]:
+                    logger.error("%s failed: %s", task, result[1])
+                else:
+                    logger.info("%s finished in %.1fs", task, result[0])
+            finished = []
+    finally:
+        if pool:
+            pool.terminate()
+    return results
+
+
+@click.command()
+@click.argument('output')
+@click.argument('parts', nargs=-1)
+@click.option('--parts-file', type=click.File(),
+              help="File listing TITLE:PART pairs, one per line")
+@click.option('--only-latest', is_flag=True, default=False,
+              help="Don't derive history; use the latest annual edition")
+@click.option('--xml-ttl', type=int, default=60*60,
+              help='Time to cache XML downloads, in seconds')
+@click.option('--workers', type=int, default=4,
+              help="Number of processes to run stages in")
+def pipeline_many(output, parts, parts_file, only_latest, xml_ttl, workers):
+    """Run the full pipeline for several regulations at once. PARTS are
+    TITLE:PART pairs, e.g. 12:1026. Stages for different parts (and
+    independent stages of the same part) run concurrently. A failure only
+    stops the stages which depend on it; all failures are reported at the
+    end. See `pipeline` for the OUTPUT options"""
+    part_list = [parse_part(part) for part in parts]
+    if parts_file:
+        part_list.extend(parse_part(line) for line in parts_file
+                         if line.split('#')[0].strip())
+    part_list = list(OrderedDict.fromkeys(part_list))
+    if not part_list:
+        raise click.UsageError("No parts provided")
+
+    def task_args(task):
+        part, stage = task
+        if part is None:
+            return stage, {'xml_ttl': xml_ttl}
+        params = {'cfr_title': part[0], 'cfr_part': part[1]}
+        if stage == 'write_to':
+            params['output'] = output
+        return stage, params
+
+    # Writes to a git repository can't be interleaved
+    serial = ('write_to',) if output.startswith('git://') else ()
+    start = default_timer()
+    results = run_dag(build_tasks(part_list, only_latest), task_args,
+                      workers, serial)
+
+    click.echo(results_report(part_list, results, default_timer() - start))
+    failed = set(part for (part, _), (_, error) in results.items()
+                 if error and part is not None)
+    if failed:
+        raise click.ClickException("{} of {} parts failed".format(
+            len(failed), len(part_list)))
+
+
+def results_report(parts, results, elapsed):
+    """Human readable summary of the time spent on each part and any
+    failures"""
+    lines = []
+    for part in [None] + parts:
+        part_results = [(stage, result) for (task_part, stage), result
+                        in sorted(results.items()) if task_part == part]
+        name = 'shared' if part is None else '{} CFR {}'.format(*part)
+        seconds = sum(result[0] for _, result in part_results)
+        errors = [(stage, result[1]) for stage, result in part_results
+                  if result[1]]
+        status = 'ok' if not errors else 'failed'
+        lines.append("{}: {} ({:.1f}s)".format(name, status, seconds))
+        lines.extend("  {}: {}".format(stage, error)
+                     for stage, error in errors)
+    lines.append("Total: {:.1f}s".format(elapsed))
+    return "\n".join(lines)
@@ -1,6 +1,7 @@
 import click
 import logging
 
+from regparser import federalregister
 from regparser.index import dependency, entry
 from regparser.layer.section_by_section import SectionBySection
 
@@ -17,16 +18,29 @@ def previous_sxs(cfr_title, cfr_part, stop_version):
             break
 
 
+def prefetch_meta_data(cfr_title, cfr_part):
+    """SxS are fetched one notice at a time, as dependencies are resolved.
+    Request the meta data for all of the missing ones up front, in batches,
+    so that each needn't make its own request"""
+    sxs_dir = entry.SxS()
+    missing = [version_id for version_id in entry.Version(cfr_title, cfr_part)
+               if version_id not in sxs_dir]
+    if missing:
+        federalregister.meta_data_many(
+            missing, federalregister.FULL_NOTICE_FIELDS)
+
+
 def is_stale(cfr_title, cfr_part, version_id):
     """Modify and process dependency graph related to a single SxS layer"""
     deps = dependency.Graph()
     layer_entry = entry.Layer(cfr_title, cfr_part, version_id, 'analyses')
 
-    # Layers depend on their associated tree
-    deps.add(layer_entry, entry.Tree(cfr_title, cfr_part, version_id))
-    # And on all notices which came before
-    for sxs_entry in previous_sxs(cfr_title, cfr_part, version_id):
-        deps.add(layer_entry, sxs_entry)
+    with deps.batch():
+        # Layers depend on their associated tree
+        deps.add(layer_entry, entry.Tree(cfr_title, cfr_part, version_id))
+        # And on all notices which came before
+        for sxs_entry in previous_sxs(cfr_title, cfr_part, version_id):
+            deps.add(layer_entry, sxs_entry)
 
     deps.validate_for(layer_entry)
     return deps.is_stale(layer_entry)
@@ -39,6 +53,7 @@ def sxs_layers(cfr_title, cfr_part):
     """Build SxS layers for all known versions."""
     logger.info("Build SxS layers - %s CFR %s", cfr_title, cfr_part)
 
+    prefetch_meta_data(cfr_title, cfr_part)
     tree_dir = entry.Tree(cfr_title, cfr_part)
     for version_id in tree_dir:
         if is_stale(cfr_title, cfr_part, version_id):
@@ -67,7 +67,11 @@ def write_preambles(client):
 @click.argument('output')
 @click.option('--cfr_title', type=int, help="Limit to one CFR title")
 @click.option('--cfr_part', type=int, help="Limit to one CFR part")
-def write_to(output, cfr_title, cfr_part):
+@click.option('--threads', type=int, default=1,
+              help="Number of concurrent requests when sending to an API")
+@click.option('--gzip', is_flag=True, default=False,
+              help="Compress request bodies when sending to an API")
+def write_to(output, cfr_title, cfr_part, threads, gzip):
     """Export data. Sends all data in the index to an external source.
 
     \b
@@ -75,13 +79,29 @@ def write_to(output, cfr_title, cfr_part):
     * directory (if it does not exist, it will be created)
     * uri (the base url of an instance of regulations-core)
     * a directory prefixed with "git://". This will export to a git
-      repository"""
+      repository
+    * a file name ending in ".ndjson.gz". Everything will be written to this
+      single archive"""
     logger.info("Export output - %s CFR %s, Destination: %s",
                 cfr_title, cfr_part, output)
-    client = Client(output)
-    write_trees(client, cfr_title, cfr_part)
-    write_layers(client, cfr_title, cfr_part)
-    write_notices(client, cfr_title, cfr_part)
-    write_diffs(client, cfr_title, cfr_part)
-    if cfr_title is None and cfr_part is None:
-        write_preambles(client)
+    client = Client(output, threads=threads, compress=gzip)
+    try:
+        write_trees(client, cfr_title, cfr_part)
+        write_layers(client, cfr_title, cfr_part)
+        write_notices(client, cfr_title, cfr_part)
+        write_diffs(client, cfr_title, cfr_part)
+        if cfr_title is None and cfr_part is None:
+            write_preambles(client)
+    except:
+        client.abort()
+        raise
+
+    summary = client.finish()
+    if summary:
+        rate = summary['documents'] / max(summary['seconds'], 0.001)
+        logger.info("Wrote %s documents (%s bytes) in %.1fs (%.1f docs/s)",
+                    summary['documents'], summary['bytes'],
+                    summary['seconds'], rate)
+        if summary['failures']:
+            raise click.ClickException("Failed to write {} documents".format(
+                len(summary['failures'])))
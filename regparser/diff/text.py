@@ -1,7 +1,10 @@
+from bisect import bisect_left
+from collections import Counter
 import difflib
 import re
 
 from regparser.layer.graphics import Graphics
+import settings
 
 
 INSERT = 'insert'
@@ -9,21 +12,23 @@ DELETE = 'delete'
 REPLACE = 'replace'
 EQUAL = 'equal'
 
+# Graphics markers may contain spaces, but should be treated as one word. We
+# match them first so that we skip over any spaces within
+_SPLIT_REGEX = re.compile(ur'(?:{})|(?P<space>\s+)'.format(
+    Graphics.gid.pattern))
+
 
 def deconstruct_text(text):
     """ Split the text into a list of words, but avoid graphics markers """
-    excludes = [(m.start(), m.end()) for m in Graphics.gid.finditer(text)]
-    spaces = [(m.start(), m.end()) for m in re.finditer(r'\s+', text)]
-    spaces = [(s[0], s[1]) for s in spaces
-              if not any(e[0] <= s[0] and e[1] >= s[1] for e in excludes)]
-
     last_space, words = 0, []
-    for s in spaces:
-        words.append(text[last_space:s[0]])
+    for match in _SPLIT_REGEX.finditer(text):
+        if match.group('space') is None:    # a graphics marker
+            continue
+        words.append(text[last_space:match.start()])
         # Also add the space as a word
-        words.append(text[s[0]:s[1]])
+        words.append(match.group())
         # Update position
-        last_space = s[1]
+        last_space = match.end()
     # Add the last bit of text (unless we've already grabbed it)
     if last_space != len(text):
         words.append(text[last_space:])
@@ -37,62 +42,187 @@ def reconstruct_text(text_list):
     return ''.join(text_list)
 
 
-def convert_insert(ins_op, old_text_list, new_text_list):
+def word_offsets(text_list):
+    """Character offsets of each word in the reconstructed text (plus the
+    total length at the end). Calculating these once lets us convert word
+    indices into character offsets in constant time"""
+    offsets, total = [0], 0
+    for word in text_list:
+        total += len(word)
+        offsets.append(total)
+    return offsets
+
+
+def _char_offset(offsets, word_idx):
+    """Mirror slicing semantics; indices past the end are clamped"""
+    return offsets[min(word_idx, len(offsets) - 1)]
+
+
+def convert_insert(ins_op, old_text_list, new_text_list, old_offsets=None):
     """ The insert operation returned by difflib assumes we have access to both
     texts. We re-write the op, so that we don't make the same assumption. """
-
-    char_offset_start = len(reconstruct_text(old_text_list[0:ins_op[1]]))
+    if old_offsets is None:
+        old_offsets = word_offsets(old_text_list)
     return (
         INSERT,
-        char_offset_start,
+        _char_offset(old_offsets, ins_op[1]),
         reconstruct_text(new_text_list[ins_op[3]:ins_op[4]]))
 
 
-def convert_delete(op, old_text_list):
+def convert_delete(op, old_text_list, old_offsets=None):
     """ Convert the delete opcode from a word based offset, to a character
     based offset. """
-
+    if old_offsets is None:
+        old_offsets = word_offsets(old_text_list)
     opcode, s, e = op
-    prefix = reconstruct_text(old_text_list[0:s])
-    prefix_length = len(prefix)
-    text = reconstruct_text(old_text_list[s:e])
-    text_length = len(text)
+    return (opcode, _char_offset(old_offsets, s), _char_offset(old_offsets, e))
 
-    char_offset_start = prefix_length
-    char_offset_end = prefix_length + text_length
 
-    return (opcode, char_offset_start, char_offset_end)
-
-
-def convert_opcode(op, new_text_list, old_text_list):
+def convert_opcode(op, new_text_list, old_text_list, old_offsets=None):
     """ We want to express changes as inserts and deletes only. """
+    if old_offsets is None:
+        old_offsets = word_offsets(old_text_list)
     code = op[0]
     if code == INSERT:
-        return convert_insert(op, old_text_list, new_text_list)
+        return convert_insert(op, old_text_list, new_text_list, old_offsets)
     elif code == DELETE:
         # Deletes have an extra set of co-ordinates which
         # we don't need.
-        return convert_delete((DELETE, op[1], op[2]), old_text_list)
+        return convert_delete((DELETE, op[1], op[2]), old_text_list,
+                              old_offsets)
     elif code == REPLACE:
-        del_op = convert_delete((DELETE, op[1], op[2]), old_text_list)
+        del_op = convert_delete((DELETE, op[1], op[2]), old_text_list,
+                                old_offsets)
         add_op = convert_insert(
-            (INSERT, op[1], op[1], op[3], op[4]), old_text_list, new_text_list)
+            (INSERT, op[1], op[1], op[3], op[4]), old_text_list, new_text_list,
+            old_offsets)
         return [del_op, add_op]
 
 
-def get_opcodes(old_text, new_text):
+def _is_junk(word):
+    return word in " \t\n"
+
+
+def difflib_opcodes(old_words, new_words):
+    """Word-level opcodes, as computed by difflib"""
+    return difflib.SequenceMatcher(
+        _is_junk, old_words, new_words).get_opcodes()
+
+
+def _unique_lcs(a, alo, ahi, b, blo, bhi):
+    """Find the longest common subsequence of the (non-junk) words which
+    appear exactly once in each of a[alo:ahi] and b[blo:bhi]. Returns a list
+    of index pairs"""
+    a_counts = Counter(a[alo:ahi])
+    b_counts = Counter(b[blo:bhi])
+    b_positions = {b[j]: j for j in range(blo, bhi)
+                   if b_counts[b[j]] == 1}
+    pairs = [(i, b_positions[a[i]]) for i in range(alo, ahi)
+             if a_counts[a[i]] == 1 and a[i] in b_positions and
+             not _is_junk(a[i])]
+
+    # Patience sort on the positions in b
+    tops, top_idxs, back_pointers = [], [], []
+    for idx, (_, j) in enumerate(pairs):
+        pile = bisect_left(tops, j)
+        back_pointers.append(top_idxs[pile - 1] if pile else None)
+        if pile == len(tops):
+            tops.append(j)
+            top_idxs.append(idx)
+        else:
+            tops[pile] = j
+            top_idxs[pile] = idx
+
+    result, idx = [], top_idxs[-1] if top_idxs else None
+    while idx is not None:
+        result.append(pairs[idx])
+        idx = back_pointers[idx]
+    return list(reversed(result))
+
+
+def _patience_blocks(a, alo, ahi, b, blo, bhi, blocks):
+    """Append matching blocks, in order, as (i, j, size) triples. Matches
+    common prefixes and suffixes, then anchors on unique common words,
+    recursing between anchors. Falls back to difflib when there are no
+    anchors"""
+    prefix_a, prefix_b = alo, blo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo, blo = alo + 1, blo + 1
+    if alo > prefix_a:
+        blocks.append((prefix_a, prefix_b, alo - prefix_a))
+
+    suffix_end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi, bhi = ahi - 1, bhi - 1
+
+    if alo < ahi and blo < bhi:
+        anchors = _unique_lcs(a, alo, ahi, b, blo, bhi)
+        if anchors:
+            for i, j in anchors:
+                _patience_blocks(a, alo, i, b, blo, j, blocks)
+                blocks.append((i, j, 1))
+                alo, blo = i + 1, j + 1
+            _patience_blocks(a, alo, ahi, b, blo, bhi, blocks)
+        else:
+            matcher = difflib.SequenceMatcher(
+                _is_junk, a[alo:ahi], b[blo:bhi], autojunk=False)
+            for i, j, size in matcher.get_matching_blocks()[:-1]:
+                blocks.append((alo + i, blo + j, size))
+
+    if suffix_end > ahi:
+        blocks.append((ahi, bhi, suffix_end - ahi))
+
+
+def patience_opcodes(old_words, new_words):
+    """Word-level opcodes, as computed by the "patience diff" algorithm.
+    This tends to produce more readable diffs than difflib for long
+    paragraphs (e.g. tables and appendices), where difflib's heuristics treat
+    common words as junk"""
+    blocks = []
+    _patience_blocks(old_words, 0, len(old_words),
+                     new_words, 0, len(new_words), blocks)
+
+    # Merge adjacent blocks
+    merged = []
+    for i, j, size in blocks:
+        if merged:
+            prev_i, prev_j, prev_size = merged[-1]
+            if prev_i + prev_size == i and prev_j + prev_size == j:
+                merged[-1] = (prev_i, prev_j, prev_size + size)
+                continue
+        merged.append((i, j, size))
+    merged.append((len(old_words), len(new_words), 0))
+
+    # Same conversion as difflib.SequenceMatcher.get_opcodes
+    opcodes, i, j = [], 0, 0
+    for ai, bj, size in merged:
+        if i < ai and j < bj:
+            opcodes.append((REPLACE, i, ai, j, bj))
+        elif i < ai:
+            opcodes.append((DELETE, i, ai, j, bj))
+        elif j < bj:
+            opcodes.append((INSERT, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append((EQUAL, ai, i, bj, j))
+    return opcodes
+
+
+MATCHERS = {'difflib': difflib_opcodes, 'patience': patience_opcodes}
+
+
+def get_opcodes(old_text, new_text, matcher=None):
     """ Get the operation codes that convert old_text into
-    new_text. """
+    new_text. `matcher` is a function which computes word-level opcodes;
+    defaults to the one named by settings.DIFF_TEXT_MATCHER"""
+    if matcher is None:
+        matcher = MATCHERS[settings.DIFF_TEXT_MATCHER]
 
     old_word_list = deconstruct_text(old_text)
     new_word_list = deconstruct_text(new_text)
-
-    seqm = difflib.SequenceMatcher(
-        lambda x: x in " \t\n",
-        old_word_list,
-        new_word_list)
+    old_offsets = word_offsets(old_word_list)
 
     opcodes = [
-        convert_opcode(op, new_word_list, old_word_list)
-        for op in seqm.get_opcodes() if op[0] != EQUAL]
+        convert_opcode(op, new_word_list, old_word_list, old_offsets)
+        for op in matcher(old_word_list, new_word_list) if op[0] != EQUAL]
     return opcodes
@@ -1,3 +1,4 @@
+from collections import defaultdict
 import difflib
 
 from regparser.diff.text import get_opcodes, INSERT, DELETE, REPLACE, EQUAL
@@ -55,12 +56,17 @@ def _local_changes(lhs, rhs):
 def _new_in_rhs(lhs_list, rhs_list):
     """Compare the lhs and rhs lists to see if the rhs contains elements not
     in the lhs"""
-    added = []
-    lhs_codes = tuple(map(lambda n: n.label_id, lhs_list))
-    for node in rhs_list:
-        if node.label_id not in lhs_codes:
-            added.append(node)
-    return added
+    lhs_codes = set(n.label_id for n in lhs_list)
+    return [node for node in rhs_list if node.label_id not in lhs_codes]
+
+
+def _by_label(nodes):
+    """Index a list of nodes by their label_id, retaining order. Labels
+    *should* be unique among siblings, but we don't rely on that"""
+    indexed = defaultdict(list)
+    for node in nodes:
+        indexed[node.label_id].append(node)
+    return indexed
 
 
 def _data_for_add(node):
@@ -107,15 +113,19 @@ def changes_between(lhs, rhs):
                     possibly_moved[grandchild.label_id], grandchild))
                 del possibly_moved[grandchild.label_id]
             else:   # Not moved; recursively add all of it's children
-                changes.extend(struct.walk(grandchild, _data_for_add))
+                changes.extend(map(_data_for_add,
+                                   struct.iter_nodes(grandchild)))
 
     # Remaining nodes weren't moved; they were *re*moved
     for removed in possibly_moved.values():
-        changes.extend(struct.walk(removed, _data_for_delete))
+        changes.extend(map(_data_for_delete, struct.iter_nodes(removed)))
 
-    # Recurse on modified children. Again, this does *not* track reordering
+    # Recurse on modified children. Again, this does *not* track reordering.
+    # Children with matching hashes are unchanged (Merkle tree), so there's no
+    # need to descend into them
+    rhs_by_label = _by_label(rhs.children)
     for lhs_child in lhs.children:
-        for rhs_child in rhs.children:
-            if lhs_child.label_id == rhs_child.label_id:
+        for rhs_child in rhs_by_label.get(lhs_child.label_id, ()):
+            if lhs_child.hash != rhs_child.hash:
                 changes.extend(changes_between(lhs_child, rhs_child))
     return changes
@@ -1,6 +1,7 @@
 import logging
-import requests
+from multiprocessing.pool import ThreadPool
 
+from regparser import fetch
 from regparser.notice.build import build_notice
 
 '''
@@ -10,35 +11,94 @@ See https://www.federalregister.gov/developers/api/v1 - GET "search" method
 FR_BASE = "https://www.federalregister.gov"
 API_BASE = FR_BASE + "/api/v1/"
 FULL_NOTICE_FIELDS = [
-    "abstract", "action", "agency_names", "cfr_references", "citation",
-    "comments_close_on", "dates", "document_number", "effective_on",
-    "end_page", "full_text_xml_url", "html_url", "publication_date",
-    "regulation_id_numbers", "start_page", "type", "volume"]
+    "abstract", "action", "agencies", "agency_names", "cfr_references",
+    "citation", "comments_close_on", "dates", "document_number",
+    "effective_on", "end_page", "full_text_xml_url", "html_url",
+    "publication_date", "regulation_id_numbers", "start_page", "type",
+    "volume"]
+PER_PAGE = 1000         # the most the API allows
+BATCH_SIZE = 20         # documents per meta data request; keeps URLs short
+WORKERS = 4
 logger = logging.getLogger(__name__)
 
 
+class Memo(object):
+    """Search results and document meta data, remembered for the rest of the
+    process so that commands run in sequence (e.g. by `pipeline`, or when
+    resolving dependencies) don't repeat identical requests. Search results
+    double as meta data for the documents they contain"""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.searches = {}
+        self.documents = {}
+
+    def remember(self, results):
+        for result in results:
+            if 'document_number' in result:
+                self.documents.setdefault(
+                    result['document_number'], {}).update(result)
+
+    def known_fields(self, document_number, fields):
+        """The requested `fields` of a document, if we have all of them"""
+        known = self.documents.get(document_number, {})
+        if fields and all(field in known for field in fields):
+            return {field: known[field] for field in fields}
+
+
+memo = Memo()
+
+
+def _map(fn, args):
+    """Call `fn` on each of `args`, concurrently if there are several"""
+    if len(args) > 1 and WORKERS > 1:
+        pool = ThreadPool(min(WORKERS, len(args)))
+        try:
+            return pool.map(fn, args)
+        finally:
+            pool.terminate()
+    return [fn(arg) for arg in args]
+
+
+def _search(url, params):
+    """All results of a search. After the first page, we know how many pages
+    there are, so we request the rest concurrently. Should that count be
+    absent, we fall back to following each page's `next_page_url`"""
+    pages = [fetch.get(url, params=params).json()]
+    page_count = pages[0].get('total_pages', 1)
+    pages.extend(_map(
+        lambda page: fetch.get(url, params=dict(params, page=page)).json(),
+        range(2, page_count + 1)))
+    while pages[-1].get('next_page_url'):
+        pages.append(fetch.get(pages[-1]['next_page_url']).json())
+    return [result for page in pages for result in page.get('results', [])]
+
+
 def fetch_notice_json(cfr_title, cfr_part, only_final=False,
                       max_effective_date=None):
-    """Search through all articles associated with this part. Right now,
-    limited to 1000; could use paging to fix this in the future."""
+    """Search through all articles associated with this part, following
+    pagination. Results are memoized; the list is a copy, but its entries are
+    shared between callers"""
     params = {
         "conditions[cfr][title]": cfr_title,
         "conditions[cfr][part]": cfr_part,
-        "per_page": 1000,
+        "per_page": PER_PAGE,
         "order": "oldest",
         "fields[]": FULL_NOTICE_FIELDS}
     if only_final:
         params["conditions[type][]"] = 'RULE'
     if max_effective_date:
         params["conditions[effective_date][lte]"] = max_effective_date
-    url = API_BASE + "articles"
-    logger.info("Fetching notices - URL: %s Params: %r", url, params)
-    response = requests.get(url, params=params).json()
-    logger.debug("Fetching notices response - %r", response)
-    if 'results' in response:
-        return response['results']
-    else:
-        return []
+    key = tuple(sorted((name, str(value)) for name, value in params.items()))
+    if key not in memo.searches:
+        url = API_BASE + "articles"
+        logger.info("Fetching notices - URL: %s Params: %r", url, params)
+        results = _search(url, params)
+        logger.debug("Fetching notices response - %r", results)
+        memo.searches[key] = results
+        memo.remember(results)
+    return list(memo.searches[key])
 
 
 def fetch_notices(cfr_title, cfr_part, only_final=False):
@@ -52,10 +112,56 @@ def fetch_notices(cfr_title, cfr_part, only_final=False):
 def meta_data(document_number, fields=None):
     """Return the requested meta data for a specific Federal Register
     document. Accounts for a bad document number by throwing an exception"""
+    known = memo.known_fields(document_number, fields)
+    if known is not None:
+        return known
     url = "{}articles/{}".format(API_BASE, document_number)
     params = {}     # default fields are generally good
     if fields:
         params["fields[]"] = fields
-    response = requests.get(url, params=params)
+    response = fetch.get(url, params=params)
     response.raise_for_status()
-    return response.json()
+    result = response.json()
+    if fields:
+        memo.remember([dict(result, document_number=document_number)])
+    return result
+
+
+def _fetch_batch(document_numbers, fields):
+    """One request for several documents' meta data. Failures are logged
+    rather than raised; `meta_data` will report them"""
+    url = "{}articles/{}".format(API_BASE, ','.join(document_numbers))
+    response = fetch.get(url, params={"fields[]": fields})
+    if not response.ok:
+        logger.warning("Couldn't fetch meta data for %s: %s",
+                       document_numbers, response.status_code)
+        return []
+    result = response.json()
+    # A single document isn't wrapped in a list of results
+    return result.get('results', [result])
+
+
+def meta_data_many(document_numbers, fields):
+    """Return the requested meta data for several Federal Register documents,
+    as a dictionary keyed by document number. Documents are requested
+    BATCH_SIZE at a time, concurrently; those which can't be found are left
+    out"""
+    found, to_fetch = {}, []
+    for document_number in document_numbers:
+        known = memo.known_fields(document_number, fields)
+        if known is not None:
+            found[document_number] = known
+        elif document_number not in to_fetch:
+            to_fetch.append(document_number)
+
+    batch_fields = sorted(set(fields) | {'document_number'})
+    batches = [to_fetch[idx:idx + BATCH_SIZE]
+               for idx in range(0, len(to_fetch), BATCH_SIZE)]
+    for results in _map(lambda batch: _fetch_batch(batch, batch_fields),
+                        batches):
+        memo.remember(results)
+    for document_number in to_fetch:
+        known = memo.known_fields(document_number, fields)
+        if known is not None:
+            found[document_number] = known
+    return found
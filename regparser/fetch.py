@@ -0,0 +1,259 @@
+"""HTTP GETs for the Federal Register, GPO, etc. Once `enable_cache` has been
+called (as `eregs` does), successful responses are kept on disk, outside of
+the index, and reused for as long as settings.HTTP_CACHE_TTLS allows for
+their domain. After that, they're revalidated with a conditional GET
+(ETag/Last-Modified), so unchanged documents aren't downloaded again. Bodies
+larger than BLOB_THRESHOLD (e.g. annual editions) are stored as files named
+by their content's hash rather than inline"""
+import base64
+from collections import defaultdict
+import hashlib
+import itertools
+import logging
+import os
+import tempfile
+import time
+from urlparse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from regparser import metrics
+from regparser.index.cache import DiskCache, digest
+import settings
+
+BLOB_THRESHOLD = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+POOL_SIZE = 16
+# The body is stored decoded, so these no longer apply
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+logger = logging.getLogger(__name__)
+
+
+def _makedirs(dirname):
+    if not os.path.exists(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:     # another process beat us to it
+            pass
+
+
+def disk_usage(root):
+    """Number of files and total bytes beneath `root`"""
+    files, size = 0, 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, filename))
+    return files, size
+
+
+def ttl_for(url):
+    """Seconds for which a response from `url` is fresh. The most specific
+    domain in settings.HTTP_CACHE_TTLS wins; the None key applies to
+    everything else"""
+    labels = (urlparse(url).hostname or '').split('.')
+    for idx in range(len(labels)):
+        domain = '.'.join(labels[idx:])
+        if domain in settings.HTTP_CACHE_TTLS:
+            return settings.HTTP_CACHE_TTLS[domain]
+    return settings.HTTP_CACHE_TTLS.get(None, 0)
+
+
+class BlobStore(object):
+    """Files named by the SHA-256 of their contents, so identical bodies are
+    only stored once. Writes are atomic, so processes can share a store"""
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def write(self, chunks):
+        """Store the concatenation of `chunks`; returns its key"""
+        _makedirs(self.root)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        hasher = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except:
+            os.remove(tmp_path)
+            raise
+        key = hasher.hexdigest()
+        _makedirs(os.path.dirname(self.path(key)))
+        os.rename(tmp_path, self.path(key))
+        return key
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+
+class Fetcher(object):
+    """Performs (and, if enabled, caches) GET requests. Connections are
+    pooled per process, as they can't be shared across a fork"""
+    def __init__(self):
+        self.responses, self.blobs = None, None
+        self._sessions = {}
+        self.reset_stats()
+
+    @property
+    def cache_enabled(self):
+        return self.responses is not None
+
+    def enable_cache(self, root=None):
+        """Cache responses within `root`, by default
+        settings.HTTP_CACHE_DIR"""
+        root = root or settings.HTTP_CACHE_DIR
+        self.responses = DiskCache('responses', root=root)
+        self.blobs = BlobStore(os.path.join(root, 'blobs'))
+
+    def disable_cache(self):
+        self.responses, self.blobs = None, None
+
+    def reset_stats(self):
+        self.counters = defaultdict(int)
+
+    def _count(self, outcome):
+        self.counters[outcome] += 1
+        metrics.count('http.' + outcome)
+
+    def _send(self, url, **kwargs):
+        """GET from the server (rather than the cache)"""
+        metrics.count('http.requests')
+        return self.session().get(url, **kwargs)
+
+    def session(self):
+        pid = os.getpid()
+        if pid not in self._sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE,
+                                  pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._sessions = {pid: session}
+        return self._sessions[pid]
+
+    def get(self, url, params=None, stream=False):
+        """Like requests.get. Only successful responses are cached. With
+        `stream`, the body isn't read into memory until it's accessed"""
+        if not self.cache_enabled:
+            self._count('uncached')
+            return self._send(url, params=params, stream=stream)
+
+        url = requests.Request('GET', url, params=params).prepare().url
+        key = digest('GET', url)
+        entry = self._lookup(key)
+        if entry and time.time() - entry['fetched'] < ttl_for(url):
+            self._count('fresh')
+            return self._response(entry, stream)
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = self._send(url, headers=headers, stream=True)
+        except requests.RequestException:
+            if entry is None:
+                raise
+            logger.warning("Could not revalidate %s; using cached copy", url)
+            self._count('stale')
+            return self._response(entry, stream)
+
+        if entry and response.status_code == requests.codes.not_modified:
+            response.close()
+            entry.update(self._validators(response.headers, entry))
+            entry['fetched'] = time.time()
+            self.responses[key] = entry
+            self._count('revalidated')
+        elif response.status_code == requests.codes.ok:
+            entry = self._store(key, url, response)
+            self._count('downloaded')
+        else:
+            self._count('uncached')
+            if not stream:
+                response.content
+            return response
+        return self._response(entry, stream)
+
+    def _lookup(self, key):
+        """The cached entry for `key`, if present and complete"""
+        try:
+            entry = self.responses[key]
+        except KeyError:
+            return None
+        if 'blob' in entry and entry['blob'] not in self.blobs:
+            return None
+        return entry
+
+    @staticmethod
+    def _validators(headers, default=None):
+        default = default or {}
+        return {'etag': headers.get('ETag', default.get('etag')),
+                'last_modified': headers.get('Last-Modified',
+                                             default.get('last_modified'))}
+
+    def _store(self, key, url, response):
+        """Save a successful response, reading its body in chunks so that
+        large bodies needn't be held in memory"""
+        entry = self._validators(response.headers)
+        entry.update(
+            url=url, fetched=time.time(),
+            headers={name: value for name, value in response.headers.items()
+                     if name.lower() not in DROPPED_HEADERS})
+        chunks = response.iter_content(CHUNK_SIZE)
+        head, size = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > BLOB_THRESHOLD:
+                entry['blob'] = self.blobs.write(
+                    itertools.chain(head, chunks))
+                break
+        else:
+            entry['body'] = base64.b64encode(b''.join(head))
+        self.responses[key] = entry
+        return entry
+
+    def _response(self, entry, stream):
+        """Reconstruct a requests.Response from a cache entry"""
+        response = requests.Response()
+        response.status_code = requests.codes.ok
+        response.reason = 'OK'
+        response.url = entry['url']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.from_cache = True
+        if 'blob' in entry:
+            response.raw = self.blobs.open(entry['blob'])
+            if not stream:
+                with response.raw:
+                    response.content
+        else:
+            response._content = base64.b64decode(entry['body'])
+            response._content_consumed = True
+        return response
+
+    def stats(self):
+        """Counts of this process's requests by outcome ("fresh",
+        "revalidated", "downloaded", "stale" or "uncached") and the size of
+        the cache on disk"""
+        stats = dict(self.counters)
+        if self.cache_enabled:
+            for name, root in (('responses', self.responses.root),
+                               ('blobs', self.blobs.root)):
+                stats[name], stats[name + '_bytes'] = disk_usage(root)
+        return stats
+
+
+fetcher = Fetcher()
+get = fetcher.get
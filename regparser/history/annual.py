@@ -5,8 +5,7 @@ import logging
 import os
 import re
 
-import requests
-
+from regparser import fetch
 from regparser.federalregister import fetch_notice_json
 from regparser.history.delays import modify_effective_dates
 from regparser.index import xml_sync
@@ -46,7 +45,7 @@ class Volume(namedtuple('Volume', ['year', 'title', 'vol_num'])):
     def response(self):
         if self._response is None:
             logger.debug("GET %s", self.url)
-            self._response = requests.get(self.url, stream=True)
+            self._response = fetch.get(self.url, stream=True)
         return self._response
 
     @property
@@ -114,7 +113,7 @@ class Volume(namedtuple('Volume', ['year', 'title', 'vol_num'])):
                 with open(xml_path) as f:
                     return XMLWrapper(f.read(), xml_path)
         logger.debug("GET %s", url)
-        response = requests.get(url)
+        response = fetch.get(url)
         if response.status_code == 200:
             return XMLWrapper(response.content, url)
 
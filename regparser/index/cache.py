@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from regparser import metrics
+from . import ROOT
+
+
+logger = logging.getLogger(__name__)
+
+
+def digest(*parts):
+    """Combine several (unicode or byte) strings into a single hex key"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf-8')
+        hasher.update(part)
+        hasher.update('\0')
+    return hasher.hexdigest()
+
+
+class DiskCache(object):
+    """Content-addressed, JSON-valued store within the index. Each value is
+    its own file (written atomically, so multiple processes can share a
+    cache), which lets us evict the least recently used entries when the
+    namespace grows beyond `max_bytes`. Caches which should outlive the
+    index can be placed elsewhere by providing a `root`"""
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    # Values are written to temporary files before being renamed into place.
+    # Eviction leaves them alone unless they've been abandoned
+    TMP_PREFIX = '.tmp-'
+    TMP_MAX_AGE = 60 * 60
+
+    def __init__(self, namespace, max_bytes=None, root=None):
+        self.namespace = namespace
+        self.root = os.path.join(root or os.path.join(ROOT, 'cache'),
+                                 namespace)
+        self.max_bytes = max_bytes or self.DEFAULT_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def __getitem__(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (IOError, ValueError):
+            self.misses += 1
+            metrics.count('cache.{}.misses'.format(self.namespace))
+            raise KeyError(key)
+        try:
+            os.utime(path, None)    # mark as recently used
+        except OSError:     # evicted by another process since we read it
+            pass
+        self.hits += 1
+        metrics.count('cache.{}.hits'.format(self.namespace))
+        return value
+
+    def __setitem__(self, key, value):
+        path = self._path(key)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:     # another process beat us to it
+                pass
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=self.TMP_PREFIX)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(value, f, separators=(',', ':'))
+        os.rename(tmp_path, path)
+
+    def evict(self):
+        """Delete the least recently used entries until we are within the
+        size cap. Returns the number of entries removed. Other processes may
+        be reading, writing and evicting at the same time, so entries can
+        disappear from under us"""
+        entries, total = [], 0
+        abandoned = time.time() - self.TMP_MAX_AGE
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if (filename.startswith(self.TMP_PREFIX) and
+                        stat.st_mtime > abandoned):
+                    continue    # still being written
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+            total -= size
+        if removed:
+            logger.info("Evicted %s entries from %s", removed, self.root)
+        return removed
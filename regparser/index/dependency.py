@@ -1,9 +1,9 @@
+from contextlib import contextmanager
 import logging
 import os
+import sqlite3
 from time import time
 
-import networkx
-
 from . import ROOT
 
 
@@ -21,78 +21,142 @@ class Missing(Exception):
 
 class Graph(object):
     """Track dependencies between input and output files, storing them in
-    `dependencies.gml` for later retrieval. This lets us know that an output
-    with dependencies needs to be updated if those dependencies have been
-    updated"""
+    `dependencies.sqlite` for later retrieval. This lets us know that an
+    output with dependencies needs to be updated if those dependencies have
+    been updated.
+
+    Staleness is computed lazily, only for the requested entry and its
+    ancestors. Modification times of existing files are cached for the life
+    of this object (see `rebuild` to reset)"""
+    DB_FILE = os.path.join(ROOT, "dependencies.sqlite")
+    # Previous versions stored the graph as GML; we import it if present
     GML_FILE = os.path.join(ROOT, "dependencies.gml")
 
     def __init__(self):
         if not os.path.exists(ROOT):
             os.makedirs(ROOT)
 
-        if os.path.exists(self.GML_FILE):
-            self._graph = networkx.read_gml(self.GML_FILE)
-        else:
-            self._graph = networkx.DiGraph()
+        is_new = not os.path.exists(self.DB_FILE)
+        self._db = sqlite3.connect(self.DB_FILE, timeout=60)
+        self._db.text_factory = str
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS edges ("
+            "input TEXT NOT NULL, output TEXT NOT NULL, "
+            "PRIMARY KEY (input, output))")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS edges_output ON edges (output)")
+        self._db.commit()
+        self._batch_depth = 0
+        self._predecessors = {}
         self.rebuild()
 
+        if is_new and os.path.exists(self.GML_FILE):
+            self._import_gml()
+
+    def _import_gml(self):
+        import networkx
+        graph = networkx.read_gml(self.GML_FILE)
+        logger.info("Importing dependencies from %s", self.GML_FILE)
+        with self.batch():
+            for input_entry, output_entry in graph.edges():
+                self.add(output_entry, input_entry)
+
+    @contextmanager
+    def batch(self):
+        """Within this context, edges added via `add` will be written in a
+        single transaction"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._db.commit()
+
     def add(self, output_entry, input_entry):
         """Add a dependency where output tuple relies on input_tuple"""
-        self._graph.add_edge(str(input_entry), str(output_entry))
-        self.rebuild()
-        networkx.write_gml(self._graph, self.GML_FILE)
+        output_entry, input_entry = str(output_entry), str(input_entry)
+        self._db.execute(
+            "INSERT OR IGNORE INTO edges (input, output) VALUES (?, ?)",
+            (input_entry, output_entry))
+        self._predecessors.pop(output_entry, None)
+        if not self._batch_depth:
+            self._db.commit()
 
     def __contains__(self, key):
         """Does the graph contain a particular node?"""
-        return key in self._graph
+        key = str(key)
+        return self._db.execute(
+            "SELECT 1 FROM edges WHERE input = ? OR output = ? LIMIT 1",
+            (key, key)).fetchone() is not None
 
     def node(self, filename):
-        """Get node attributes for a specific filename. If the node isn't
-        present, create it"""
-        filename = str(filename)
-        if filename not in self._graph:
-            self._graph.add_node(filename)
-        return self._graph.node[filename]
+        """Get node attributes (modtime, stale) for a specific filename"""
+        return dict(self._node_states(str(filename), {}))
 
     def dependencies(self, filename):
         """What does other nodes does this filename *directly* depend on?"""
         filename = str(filename)
-        if filename in self._graph:
-            return self._graph.predecessors(filename)
-        else:
-            return []
+        if filename not in self._predecessors:
+            self._predecessors[filename] = [row[0] for row in self._db.execute(
+                "SELECT input FROM edges WHERE output = ? ORDER BY rowid",
+                (filename,))]
+        return list(self._predecessors[filename])
 
     def rebuild(self):
-        """Scan the modification times of all the nodes in the graph to
-        determine what's been updated. We mark nodes "stale" if one of their
-        dependencies has been updated since the depending node was built. Use
-        topological sort to make sure we process dependencies first."""
-        for node in networkx.topological_sort(self._graph):
-            if os.path.exists(node):
-                modtime = os.path.getmtime(node)
-                stale = ''
-            else:
-                modtime = time()
-                stale = node
+        """Forget any cached modification times, so that changes to the
+        underlying files since will be accounted for"""
+        self._modtimes = {}
+
+    def _modtime(self, filename):
+        """Modification time of an existing file (cached), or None"""
+        if filename not in self._modtimes:
+            if not os.path.exists(filename):
+                # We don't cache missing files; they may be created later
+                return None
+            self._modtimes[filename] = os.path.getmtime(filename)
+        return self._modtimes[filename]
+
+    def _node_states(self, filename, states):
+        """Determine the modification time and "stale" reference for a node.
+        We mark nodes "stale" if one of their dependencies has been updated
+        since the depending node was built. Recursively calculates (and
+        memoizes in `states`) the same for dependencies first; they must be
+        processed before this node"""
+        if filename in states:
+            return states[filename]
+        states[filename] = {'modtime': 0, 'stale': ''}  # guard against cycles
+        dep_states = [(dependency, self._node_states(dependency, states))
+                      for dependency in self.dependencies(filename)]
+
+        modtime = self._modtime(filename)
+        if modtime is None:
+            modtime, stale = time(), filename
+        else:
+            stale = ''
 
-            # Check immediate dependencies (which were updated in a previous
-            # step)
-            for dependency in self.dependencies(node):
-                if self.node(dependency)['modtime'] > modtime:
-                    stale = dependency
-                else:
-                    stale = self.node(dependency)['stale'] or stale
+        for dependency, dep_state in dep_states:
+            if dep_state['modtime'] > modtime:
+                stale = dependency
+            else:
+                stale = dep_state['stale'] or stale
 
-            self.node(node).update(modtime=modtime, stale=stale)
+        states[filename] = {'modtime': modtime, 'stale': stale}
+        return states[filename]
 
     def validate_for(self, entry):
         """Raise an exception if a particular output has stale dependencies"""
         key = str(entry)
         logger.debug("Validating dependencies for %r", key)
+        states = {}
         for dependency in self.dependencies(key):
-            if self.node(dependency).get('stale'):
-                raise Missing(key, self.node(dependency)['stale'])
+            stale = self._node_states(dependency, states)['stale']
+            if stale:
+                raise Missing(key, stale)
 
     def is_stale(self, entry):
-        """Determine if a file needs to be rebuilt"""
-        return bool(self.node(str(entry)).get('stale'))
+        """Determine if a file needs to be rebuilt. Entries which aren't in
+        the graph (i.e. have no recorded dependencies or dependents) are
+        never considered stale, even if they don't exist"""
+        key = str(entry)
+        return key in self and bool(self._node_states(key, {})['stale'])
@@ -1,13 +1,13 @@
 import json
 import logging
 import os
+import tempfile
 
+from regparser import metrics
 from regparser.history.versions import Version as VersionStruct
 from regparser.notice.encoder import AmendmentEncoder
-from regparser.notice.xml import NoticeXML
 from regparser.tree.struct import (
     frozen_node_decode_hook, full_node_decode_hook, FullNodeEncoder)
-from regparser.tree.xml_parser.xml_wrapper import XMLWrapper
 from . import ROOT
 
 logger = logging.getLogger(__name__)
@@ -37,10 +37,19 @@ class Entry(object):
             os.makedirs(path)
 
     def write(self, content):
+        """Write to a temporary file, then move it into place, so that
+        concurrent readers (e.g. parallel pipelines sharing a notice) never
+        see a partially written entry"""
         self._create_parent_dir()
-        with open(str(self), "w") as f:
-            f.write(self.serialize(content))
-            logger.info("Wrote {}".format(str(self)))
+        path = str(self)
+        stage = '{}.write'.format(self.__class__.__name__)
+        with metrics.timed('index', stage):
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "w") as f:
+                f.write(self.serialize(content))
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        logger.info("Wrote {}".format(path))
 
     def serialize(self, content):
         """Default implementation; treat content as a string"""
@@ -48,8 +57,9 @@ class Entry(object):
 
     def read(self):
         self._create_parent_dir()
-        with open(str(self)) as f:
-            return self.deserialize(f.read())
+        with metrics.timed('index', '{}.read'.format(self.__class__.__name__)):
+            with open(str(self)) as f:
+                return self.deserialize(f.read())
 
     def deserialize(self, content):
         """Default implementation; treat the content as a string"""
@@ -77,6 +87,9 @@ class Notice(Entry):
         return content.xml_str()
 
     def deserialize(self, content):
+        # Deferred, as it pulls in the grammars (and lxml, GitPython, etc.),
+        # which many commands don't need
+        from regparser.notice.xml import NoticeXML
         return NoticeXML(content, str(self))
 
 
@@ -88,6 +101,7 @@ class Annual(Entry):
         return content.xml_str()
 
     def deserialize(self, content):
+        from regparser.tree.xml_parser.xml_wrapper import XMLWrapper
         return XMLWrapper(content, str(self))
 
 
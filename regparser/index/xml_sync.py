@@ -2,8 +2,6 @@ import logging
 import os
 import time
 
-import git
-
 import settings
 from . import ROOT
 
@@ -16,6 +14,7 @@ def sync(ttl):
     """
     :param ttl: Time to cache last pull, in seconds. Pass `None` to force pull.
     """
+    import git  # deferred; it's slow to import and rarely needed
     if os.path.isdir(GIT_DIR):
         logger.debug("Initting git repo at %s", GIT_DIR)
         repo = git.Repo.init(GIT_DIR)
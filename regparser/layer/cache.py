@@ -0,0 +1,62 @@
+import logging
+
+from regparser.index.cache import digest, DiskCache
+from regparser.tree.struct import FrozenNode
+
+
+logger = logging.getLogger(__name__)
+
+
+class LayerCache(DiskCache):
+    """Implements the `Layer.builder(cache=...)` hook. Results of
+    `Layer.process` are stored keyed by the layer's shorthand, its
+    `cache_context()` and the Merkle hash of the node being processed. As
+    consecutive versions of a regulation share the vast majority of their
+    nodes, only changed paragraphs need to be processed again.
+
+    Layers which return None from `cache_context()` are not cached. Note that
+    configuration (i.e. `settings`) is not part of the key; clear the cache
+    when modifying it"""
+    def __init__(self, max_bytes=None):
+        super(LayerCache, self).__init__('layer', max_bytes)
+        self._layer, self._context = None, None
+        self._node_hashes = {}  # id(node) -> (node, hash)
+
+    def _context_for(self, layer):
+        """Layers are built one at a time; only retain the most recent"""
+        if layer is not self._layer:
+            context = layer.cache_context()
+            if context is not None:
+                context = digest(layer.shorthand, context)
+            self._layer, self._context = layer, context
+        return self._context
+
+    def _hash_of(self, node):
+        """Nodes passed to layers are mutable, so we can't store their hash
+        on them. Instead, we calculate the hashes of a whole (sub)tree at
+        once, via FrozenNode, and hold on to that mapping until we see a node
+        which isn't in it (i.e. a new tree)"""
+        known = self._node_hashes.get(id(node))
+        if known is None or known[0] is not node:
+            self._node_hashes = {}
+            frozen_pairs = [(node, FrozenNode.from_node(node))]
+            while frozen_pairs:
+                struct_node, frozen = frozen_pairs.pop()
+                self._node_hashes[id(struct_node)] = (struct_node,
+                                                      frozen.hash)
+                frozen_pairs.extend(zip(struct_node.children,
+                                        frozen.children))
+        return self._node_hashes[id(node)][1]
+
+    def fetch_or_process(self, layer, node):
+        context = self._context_for(layer)
+        if context is None:
+            return layer.process(node)
+
+        key = digest(context, self._hash_of(node))
+        try:
+            return self[key]
+        except KeyError:
+            layer_element = layer.process(node)
+            self[key] = layer_element
+            return layer_element
@@ -8,6 +8,10 @@ class ExternalCitationParser(Layer):
     `external_types` for specific types of external citations"""
     shorthand = 'external-citations'
 
+    def cache_context(self):
+        """Output depends only on the node"""
+        return ''
+
     def process(self, node):
         citations = [cite
                      for finder in external_types.ALL
@@ -1,11 +1,16 @@
 from collections import defaultdict
+import json
 import logging
+from multiprocessing.pool import ThreadPool
 import re
+import time
 
 import requests
 
 from regparser import content
+from regparser.index.cache import digest, DiskCache
 from regparser.layer.layer import Layer
+from regparser.tree.struct import iter_nodes
 import settings
 
 
@@ -23,10 +28,11 @@ def check_url(url):
         return url
 
 
-def gid_to_url(gid):
+def gid_to_url(gid, overrides=None):
     """Take a few guesses as to where this image may be. This will be
     simplified once FR.gov adds image data to their API"""
-    override = content.ImageOverrides().get(gid)
+    overrides = overrides or content.ImageOverrides()
+    override = overrides.get(gid)
     if override and check_url(override):
         return override
     elif override:
@@ -44,15 +50,100 @@ def gid_to_url(gid):
     return url  # last option
 
 
+def resolve_gid(gid, overrides=None):
+    """Find the (url, thumb_url) pair for a gid. thumb_url may be None"""
+    url = gid_to_url(gid, overrides)
+    return url, Graphics.check_for_thumb(url)
+
+
+class ImageUrlCache(DiskCache):
+    """Remembers the results of `resolve_gid` between runs, as the same
+    images appear in version after version. Entries expire after
+    `settings.GRAPHICS_CACHE_TTL` seconds (as images may be added to or
+    removed from the image server); a TTL of 0 disables the cache. Evicted
+    along with the layer cache, after building layers"""
+    def __init__(self, ttl=None):
+        super(ImageUrlCache, self).__init__('graphics')
+        if ttl is None:
+            ttl = settings.GRAPHICS_CACHE_TTL
+        self.ttl = ttl
+
+    @staticmethod
+    def key(gid, overrides):
+        override = overrides.get(gid) or ''
+        return digest(gid, override, settings.DEFAULT_IMAGE_URL)
+
+    def resolve_all(self, gids, workers=None):
+        """Return a dict of gid -> (url, thumb_url) for all of the provided
+        gids. Those which aren't in the cache (or have expired) are probed
+        concurrently"""
+        if workers is None:
+            workers = settings.GRAPHICS_WORKERS
+        overrides = content.ImageOverrides()
+        resolved, keys = {}, {}
+        for gid in set(gids):
+            keys[gid] = self.key(gid, overrides)
+            try:
+                cached = self[keys[gid]] if self.ttl else None
+            except KeyError:
+                cached = None
+            if cached and cached['checked'] + self.ttl > time.time():
+                resolved[gid] = (cached['url'], cached['thumb_url'])
+
+        to_probe = sorted(gid for gid in keys if gid not in resolved)
+
+        def probe(gid):
+            return resolve_gid(gid, overrides)
+
+        if len(to_probe) > 1 and workers > 1:
+            pool = ThreadPool(min(workers, len(to_probe)))
+            try:
+                results = pool.map(probe, to_probe)
+            finally:
+                pool.terminate()
+        else:
+            results = [probe(gid) for gid in to_probe]
+
+        now = time.time()
+        for gid, (url, thumb_url) in zip(to_probe, results):
+            resolved[gid] = (url, thumb_url)
+            if self.ttl:
+                self[keys[gid]] = {'url': url, 'thumb_url': thumb_url,
+                                   'checked': now}
+        logger.debug("Resolved %s image urls; %s from the cache",
+                     len(resolved), len(resolved) - len(to_probe))
+        return resolved
+
+
 class Graphics(Layer):
     gid = re.compile(ur'!\[(?P<alt>[\w\s]*)\]\((?P<gid>[a-zA-Z0-9.\-]+?)\)')
     ext = re.compile(r'\.(png|gif|jpg)$')
     shorthand = 'graphics'
 
-    def check_for_thumb(self, url):
-        thumb_url = self.ext.sub(r'.thumb\g<0>', url)
+    def __init__(self, tree, **context):
+        super(Graphics, self).__init__(tree, **context)
+        self.resolved = {}
+
+    def pre_process(self):
+        """Resolve all of the images in the tree up front, consulting the
+        ImageUrlCache and probing the remainder concurrently"""
+        gids = [match.group('gid') for node in iter_nodes(self.tree)
+                for match in Graphics.gid.finditer(node.text)]
+        self.resolved = ImageUrlCache().resolve_all(gids)
+
+    def cache_context(self):
+        """After pre-processing, results depend only on the resolved urls"""
+        return json.dumps(sorted(self.resolved.items()))
+
+    @classmethod
+    def check_for_thumb(cls, url):
+        thumb_url = cls.ext.sub(r'.thumb\g<0>', url)
         return check_url(thumb_url)
 
+    def _resolve(self, gid):
+        """Use the pre-processed result if present"""
+        return self.resolved.get(gid) or resolve_gid(gid)
+
     def process(self, node):
         """If this node has a marker for an image in it, note where to get
         that image."""
@@ -63,15 +154,13 @@ class Graphics(Layer):
         layer_el = []
         for text in matches_by_text:
             match = matches_by_text[text][0]
-            url = gid_to_url(match.group('gid'))
+            url, thumb_url = self._resolve(match.group('gid'))
             layer_el_vals = {
                 'text': match.group(0),
                 'url': url,
                 'alt': match.group('alt'),
                 'locations': list(range(len(matches_by_text[text])))
             }
-            thumb_url = self.check_for_thumb(url)
-
             if thumb_url:
                 layer_el_vals['thumb_url'] = thumb_url
             layer_el.append(layer_el_vals)
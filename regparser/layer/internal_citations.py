@@ -2,12 +2,47 @@
 import logging
 
 from regparser.citations import internal_citations, Label
+from regparser.index.cache import digest, DiskCache
 from regparser.layer.layer import Layer
-from regparser.tree.struct import walk
+from regparser.tree.struct import iter_nodes
 
 logger = logging.getLogger(__name__)
 
 
+def parse_citations(text, label, title):
+    """Run the citation grammar over this text, returning (start, end, label
+    list) triples"""
+    return [(c.start, c.end, c.label.to_list())
+            for c in internal_citations(text, label, require_marker=True,
+                                        title=title)]
+
+
+class CitationCache(DiskCache):
+    """The same paragraphs appear, unchanged, in version after version. This
+    remembers the citations found in each, keyed by the text and the context
+    it was parsed in (its label and the CFR title), so that only new text
+    needs to run through the citation grammar. Results are stored before they
+    are filtered by the labels known to a particular version. Clear the cache
+    when modifying the grammar"""
+    def __init__(self, max_bytes=None):
+        super(CitationCache, self).__init__('citations', max_bytes)
+
+    @staticmethod
+    def key(text, label, title):
+        return digest(text, repr(sorted(label.settings.items())),
+                      repr(label.schema), repr(title))
+
+    def parse(self, text, label, title):
+        """See parse_citations"""
+        key = self.key(text, label, title)
+        try:
+            return [tuple(citation) for citation in self[key]]
+        except KeyError:
+            citations = parse_citations(text, label, title)
+            self[key] = citations
+            return citations
+
+
 class InternalCitationParser(Layer):
     shorthand = 'internal-citations'
 
@@ -16,13 +51,27 @@ class InternalCitationParser(Layer):
         self.cfr_title = cfr_title
         self.known_citations = set()
         self.verify_citations = True
+        self.citation_cache = None
+
+    def build(self, cache=None):
+        """When layer results are cached, also re-use parsed citations. The
+        layer cache is keyed by all of the tree's labels, so it misses
+        whenever a version adds or removes a paragraph; the citation cache
+        does not"""
+        if cache is not None and self.citation_cache is None:
+            self.citation_cache = CitationCache()
+        return super(InternalCitationParser, self).build(cache)
 
     def pre_process(self):
         """As a preprocessing step, run through the entire tree, collecting
         all labels."""
-        def per_node(node):
-            self.known_citations.add(tuple(node.label))
-        walk(self.tree, per_node)
+        self.known_citations.update(tuple(node.label)
+                                    for node in iter_nodes(self.tree))
+
+    def cache_context(self):
+        """Citations are filtered by the set of labels in this tree"""
+        return repr((self.cfr_title, self.verify_citations,
+                     sorted(self.known_citations)))
 
     def process(self, node):
         citations_list = self.parse(node.text,
@@ -35,28 +84,26 @@ class InternalCitationParser(Layer):
         """Remove any citations to labels we have not seen before (i.e.
         those collected in the pre_processing stage)"""
         final = []
-        for c in citations:
-            if tuple(c.label.to_list()) in self.known_citations:
-                final.append(c)
+        for start, end, label in citations:
+            if tuple(label) in self.known_citations:
+                final.append((start, end, label))
             else:
                 logger.warning("Missing citation? %s %r",
-                               text[c.start:c.end], c.label)
+                               text[start:end], label)
                 logger.debug("Context: %s" % text)
         return final
 
     def parse(self, text, label, title=None):
         """ Parse the provided text, pulling out all the internal
         (self-referential) citations. """
-
-        def to_layer(pc):
-            return {'offsets': [(pc.start, pc.end)],
-                    'citation': pc.label.to_list()}
-
-        citations = internal_citations(text, label, require_marker=True,
-                                       title=title)
+        if self.citation_cache is not None:
+            citations = self.citation_cache.parse(text, label, title)
+        else:
+            citations = parse_citations(text, label, title)
         if self.verify_citations:
             citations = self.remove_missing_citations(citations, text)
-        all_citations = list(map(to_layer, citations))
+        all_citations = [{'offsets': [(start, end)], 'citation': cited}
+                         for start, end, cited in citations]
 
         return self.strip_whitespace(text, all_citations)
 
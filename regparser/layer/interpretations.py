@@ -18,10 +18,10 @@ class Interpretations(Layer):
 
     def pre_process(self):
         """Create a lookup table for each interpretation"""
-        def per_node(node):
+        for node in struct.iter_nodes(self.tree):
             if (node.node_type != struct.Node.INTERP or
                     node.label[-1] != struct.Node.INTERP_MARK):
-                return
+                continue
 
             #   Always add a connection based on the interp's label
             self.lookup_table[tuple(node.label[:-1])].append(node)
@@ -33,7 +33,13 @@ class Interpretations(Layer):
                 label = tuple(label[:-1])   # Remove Interp marker
                 if node not in self.lookup_table[label]:
                     self.lookup_table[label].append(node)
-        struct.walk(self.tree, per_node)
+
+    def cache_context(self):
+        """Output depends on the interpretations found in the tree"""
+        return repr(sorted(
+            (label, [n.label_id() for n in interps
+                     if not self.empty_interpretation(n)])
+            for label, interps in self.lookup_table.items()))
 
     def process(self, node):
         """Is there an interpretation associated with this node? If yes,
@@ -21,6 +21,10 @@ class KeyTerms(Layer):
     PATTERN = re.compile(ur'.*?<E T="03">([^<]*?)</E>.*?', re.UNICODE)
     shorthand = 'keyterms'
 
+    def cache_context(self):
+        """Output depends only on the node"""
+        return ''
+
     @staticmethod
     def process_node_text(node):
         """Take a paragraph, remove the marker, and extraneous whitespaces."""
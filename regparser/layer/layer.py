@@ -1,6 +1,8 @@
 import abc
 from collections import defaultdict, namedtuple
 
+from regparser import metrics
+
 
 SearchReplace = namedtuple('SearchReplace',
                            ['text', 'locations', 'representative'])
@@ -24,6 +26,14 @@ class Layer(object):
         """ Take the whole tree and do any pre-processing """
         pass
 
+    def cache_context(self):
+        """Results of `process` may be cached (see `regparser.layer.cache`)
+        keyed by the node's contents. Layers which are safe to cache must
+        return a string here describing any other state `process` relies on
+        (e.g. data collected during `pre_process`). The default, None,
+        indicates this layer should not be cached"""
+        return None
+
     @abc.abstractproperty
     def shorthand(self):
         """Unique identifier for this layer"""
@@ -49,8 +59,9 @@ class Layer(object):
             self.builder(c, cache)
 
     def build(self, cache=None):
-        self.pre_process()
-        self.builder(self.tree, cache)
+        with metrics.timed('layer', self.__class__.__name__):
+            self.pre_process()
+            self.builder(self.tree, cache)
         return self.layer
 
     @staticmethod
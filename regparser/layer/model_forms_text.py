@@ -34,8 +34,7 @@ class ModelFormText(Layer):
 
     def pre_process(self):
         # mark the nodes that are part of a model forms section
-
-        def per_node(node):
+        for node in struct.iter_nodes(self.tree):
             if self.is_appendix(node):
                 if self.is_model_form(node):
                     self.model_forms_sections.append(node.label_id())
@@ -43,8 +42,6 @@ class ModelFormText(Layer):
                 elif self.is_model_form_child(node):
                     self.model_forms_nodes[node.label_id()] = True
 
-        struct.walk(self.tree, per_node)
-
     def process(self, node):
         label = node.label_id()
         if label in self.model_forms_nodes and self.model_forms_nodes[label]:
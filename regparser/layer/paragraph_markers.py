@@ -32,6 +32,10 @@ def marker_of(node):
 class ParagraphMarkers(Layer):
     shorthand = 'paragraph-markers'
 
+    def cache_context(self):
+        """Output depends only on the node"""
+        return ''
+
     def process(self, node):
         """Look for any leading paragraph markers."""
         marker = marker_of(node)
@@ -5,6 +5,7 @@ from pyparsing import Optional, Suppress, Word
 
 from regparser.grammar.utils import QuickSearchable
 from regparser.layer.layer import Layer
+from regparser.tree.struct import iter_nodes
 
 logger = logging.getLogger(__name__)
 
@@ -33,8 +34,8 @@ class InternalCitations(Layer):
     def pre_process(self):
         """As a preprocessing step, run through the entire tree, collecting
         all labels"""
-        labels = self.tree.walk(lambda node: tuple(node.label))
-        self.known_citations = set(labels)
+        self.known_citations = set(tuple(node.label)
+                                   for node in iter_nodes(self.tree))
 
     def process(self, node):
         """Find citations to elements within this preamble"""
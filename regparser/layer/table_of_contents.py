@@ -6,6 +6,10 @@ from regparser.tree.struct import Node
 class TableOfContentsLayer(Layer):
     shorthand = 'toc'
 
+    def cache_context(self):
+        """Output depends only on the node and its children"""
+        return ''
+
     @staticmethod
     def _relevant_nodes(node):
         """Empty parts are not displayed, so we'll skip them to find their
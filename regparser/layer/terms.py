@@ -1,5 +1,5 @@
 # vim: set fileencoding=utf-8
-from collections import defaultdict
+from collections import defaultdict, deque
 import re
 
 import inflection
@@ -21,6 +21,71 @@ import settings
 MAX_TERM_LENGTH = 100
 
 
+def is_word_char(char):
+    """Matches the regex `\w` (without the UNICODE flag)"""
+    return char == '_' or (ord(char) < 128 and char.isalnum())
+
+
+def at_word_boundary(text, idx):
+    """Would the regex `\b` (without the UNICODE flag) match at this index
+    of the text?"""
+    before = idx > 0 and is_word_char(text[idx - 1])
+    after = idx < len(text) and is_word_char(text[idx])
+    return before != after
+
+
+class TermAutomaton(object):
+    """Aho-Corasick automaton for a set of (non-empty) terms, letting us find
+    every occurrence of all of the terms with a single pass over a text"""
+    def __init__(self, terms):
+        self._goto, self._fail, self._output = [{}], [0], [[]]
+        for term in set(terms):
+            if term:
+                self._add(term)
+        self._link()
+
+    def _add(self, term):
+        state = 0
+        for char in term:
+            if char not in self._goto[state]:
+                self._goto[state][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = self._goto[state][char]
+        self._output[state].append(term)
+
+    def _link(self):
+        """Breadth-first, point each state at the longest proper suffix of
+        its prefix which is also a prefix of some term"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == next_state:  # children of the root
+                    fail = 0
+                self._fail[next_state] = fail
+                self._output[next_state] = (self._output[next_state] +
+                                            self._output[fail])
+
+    def find_all(self, text):
+        """Yield (term, start, end) for every occurrence of every term,
+        including overlapping occurrences, ordered by end"""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for idx, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for term in output[state]:
+                yield term, idx + 1 - len(term), idx + 1
+
+
 class ParentStack(PriorityStack):
     """Used to keep track of the parents while processing nodes to find
     terms. This is needed as the definition may need to find its scope in
@@ -45,6 +110,10 @@ class Terms(Layer):
         #   scope -> List[(term, definition_ref)]
         self.scoped_terms = defaultdict(list)
         self.scope_finder = ScopeFinder()
+        self._inflections = {}  # term -> (singular, plural)
+        self._word_regexes = {}  # term -> compiled regex; see _word_matches
+        # scopes -> (applicable terms, TermAutomaton); see _scope_index
+        self._scope_indexes = {}
 
     def look_for_defs(self, node, stack=None):
         """Check a node and recursively check its children for terms which are
@@ -68,6 +137,7 @@ class Terms(Layer):
         """
         self.scope_finder.add_subparts(self.tree)
         self.look_for_defs(self.tree)
+        self._scope_indexes = {}
 
         referenced = self.layer['referenced']
         for scope in self.scoped_terms:
@@ -82,6 +152,11 @@ class Terms(Layer):
                         'position': ref.position
                     }
 
+    def cache_context(self):
+        """Output depends on all of the definitions found in the tree"""
+        return repr(sorted((scope, sorted(refs, key=repr))
+                           for scope, refs in self.scoped_terms.items()))
+
     def applicable_terms(self, label):
         """Find all terms that might be applicable to nodes with this label.
         Note that we don't have to deal with subparts as subpart_scope simply
@@ -93,6 +168,29 @@ class Terms(Layer):
                 applicable_terms[ref.term] = ref    # overwrites
         return applicable_terms
 
+    def _scope_index(self, label):
+        """Nodes within the same scopes share the same applicable terms. For
+        each combination of scopes, we compute those terms and an automaton
+        over all of their singular and plural forms only once. Only valid
+        after pre_processing"""
+        scopes = tuple(tuple(label[:length])
+                       for length in range(1, len(label) + 1)
+                       if tuple(label[:length]) in self.scoped_terms)
+        if scopes not in self._scope_indexes:
+            applicable_terms = self.applicable_terms(label)
+            automaton = TermAutomaton(
+                form for term in applicable_terms
+                for form in self._inflect(term))
+            self._scope_indexes[scopes] = (applicable_terms, automaton)
+        return self._scope_indexes[scopes]
+
+    def _inflect(self, term):
+        """Memoized singular and plural forms of a term"""
+        if term not in self._inflections:
+            self._inflections[term] = (inflection.singularize(term),
+                                       inflection.pluralize(term))
+        return self._inflections[term]
+
     def is_exclusion(self, term, node):
         """Some definitions are exceptions/exclusions of a previously
         defined term. At the moment, we do not want to include these as they
@@ -100,8 +198,10 @@ class Terms(Layer):
         which are inside an instance of the IGNORE_DEFINITIONS_IN setting"""
         applicable_terms = self.applicable_terms(node.label)
         if term in applicable_terms:
+            text = node.text.lower()
             regex = 'the term .?' + re.escape(term) + '.? does not include'
-            if re.search(regex, node.text.lower()):
+            # Check for the fixed portion before compiling a regex
+            if 'does not include' in text and re.search(regex, text):
                 return True
             for start, end in self.ignored_offsets(node.label[0], node.text):
                 if term in node.text[start:end]:
@@ -121,16 +221,20 @@ class Terms(Layer):
             # list reference
             references.extend(finder.find(node))
 
-        references = [r for r in references if len(r.term) <= MAX_TERM_LENGTH]
-
-        return (
-            [r for r in references if not self.is_exclusion(r.term, node)],
-            [r for r in references if self.is_exclusion(r.term, node)])
+        included, excluded = [], []
+        for ref in references:
+            if len(ref.term) > MAX_TERM_LENGTH:
+                continue
+            elif self.is_exclusion(ref.term, node):
+                excluded.append(ref)
+            else:
+                included.append(ref)
+        return included, excluded
 
     def process(self, node):
         """Determine which (if any) definitions would apply to this node,
         then find if any of those terms appear in this node"""
-        applicable_terms = self.applicable_terms(node.label)
+        applicable_terms, automaton = self._scope_index(node.label)
 
         layer_el = []
         #   Remove any definitions defined in this paragraph
@@ -140,7 +244,8 @@ class Terms(Layer):
 
         exclusions = self.excluded_offsets(node)
 
-        matches = self.calculate_offsets(node.text, term_list, exclusions)
+        matches = self.calculate_offsets(node.text, term_list, exclusions,
+                                         automaton=automaton)
         matches = sorted(matches, key=lambda(term, r, o): term)
         for term, ref, offsets in matches:
             layer_el.append({
@@ -152,15 +257,15 @@ class Terms(Layer):
     def _word_matches(self, term, text):
         """Return the start and end indexes of the term within the text,
         accounting for word boundaries"""
-        # @todo - this is rather slow -- probably want to memoize the results
-        regex = re.escape(term)
-        if self.STARTS_WITH_WORDCHAR.match(term):
-            regex = r'\b' + regex
-        if self.ENDS_WITH_WORDCHAR.match(term):
-            regex += r'\b'
-        regex = re.compile(regex)
+        if term not in self._word_regexes:
+            regex = re.escape(term)
+            if self.STARTS_WITH_WORDCHAR.match(term):
+                regex = r'\b' + regex
+            if self.ENDS_WITH_WORDCHAR.match(term):
+                regex += r'\b'
+            self._word_regexes[term] = re.compile(regex)
         return [(match.start(), match.end())
-                for match in regex.finditer(text)]
+                for match in self._word_regexes[term].finditer(text)]
 
     def ignored_offsets(self, cfr_part, text):
         """Return a list of offsets corresponding to the presence of an
@@ -185,31 +290,48 @@ class Terms(Layer):
         return exclusions
 
     def calculate_offsets(self, text, applicable_terms, exclusions=[],
-                          inclusions=[]):
+                          inclusions=[], automaton=None):
         """Search for defined terms in this text, including singular and
         plural forms of these terms, with a preference for all larger
-        (i.e. containing) terms."""
+        (i.e. containing) terms. The text is scanned once, for all terms,
+        with an automaton (built here if not provided) which must cover all
+        of the singular and plural forms"""
 
         # don't modify the original
         exclusions = list(exclusions)
         inclusions = list(inclusions)
 
         # add singulars and plurals to search terms
-        search_terms = set((inflection.singularize(t[0]), t[1])
+        search_terms = set((self._inflect(t[0])[0], t[1])
                            for t in applicable_terms)
-        search_terms |= set((inflection.pluralize(t[0]), t[1])
+        search_terms |= set((self._inflect(t[0])[1], t[1])
                             for t in applicable_terms)
 
         # longer terms first
         search_terms = sorted(search_terms, key=lambda x: len(x[0]),
                               reverse=True)
 
+        lowered = text.lower()
+        if automaton is None:
+            automaton = TermAutomaton(term for term, _ in search_terms)
+        occurrences = defaultdict(list)
+        for term, start, end in automaton.find_all(lowered):
+            if (at_word_boundary(lowered, start) and
+                    at_word_boundary(lowered, end)):
+                occurrences[term].append((start, end))
+
         matches = []
         for term, ref in search_terms:
-            re_term = ur'\b' + re.escape(term) + ur'\b'
-            offsets = [
-                (m.start(), m.end())
-                for m in re.finditer(re_term, text.lower())]
+            if term:
+                # Like re.finditer, skip occurrences overlapping the last
+                offsets, last_end = [], 0
+                for start, end in occurrences.get(term, []):
+                    if start >= last_end:
+                        offsets.append((start, end))
+                        last_end = end
+            else:
+                offsets = [(m.start(), m.end())
+                           for m in re.finditer(ur'\b\b', lowered)]
             safe_offsets = []
             for start, end in offsets:
                 #   Start is contained in an existing def
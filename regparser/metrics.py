@@ -0,0 +1,134 @@
+"""Optional, process-wide timings and counters. Disabled by default, in
+which case recording is (nearly) free; `eregs --metrics-out` and
+`eregs --profile` turn it on. Only the current process is measured, so work
+done in worker pools is attributed to the command which waited on it"""
+from collections import defaultdict
+from contextlib import contextmanager
+import cProfile
+import functools
+import json
+import os
+import resource
+import threading
+from timeit import default_timer
+
+
+def rss():
+    """Current resident set size of this process, in bytes"""
+    if os.path.exists('/proc/self/statm'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    return max_rss()
+
+
+def max_rss():
+    """Peak resident set size of this process, in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_time():
+    """User plus system CPU seconds consumed by this process"""
+    times = os.times()
+    return times[0] + times[1]
+
+
+class Recorder(object):
+    """Accumulates wall time, CPU time and memory growth for named stages,
+    grouped by category (e.g. "command", "layer"), as well as simple event
+    counters, which may be incremented from any thread. One stage may also be
+    run under cProfile"""
+    def __init__(self):
+        self.enabled = False
+        self.profile_name = None
+        self.profiler = None
+        self._profiling = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.timings = defaultdict(dict)
+        self.counters = defaultdict(int)
+
+    def enable(self, profile_name=None):
+        """Start recording. If `profile_name` is provided, stages with that
+        name will be profiled"""
+        self.enabled = True
+        if profile_name != self.profile_name:
+            self.profile_name = profile_name
+            self.profiler = cProfile.Profile() if profile_name else None
+
+    def disable(self):
+        """Stop recording"""
+        self.enabled = False
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += amount
+
+    @contextmanager
+    def timed(self, category, name):
+        """Record the resources used within this block as an instance of
+        stage `name`"""
+        if not self.enabled:
+            yield
+            return
+
+        profile = (self.profiler is not None and not self._profiling and
+                   name == self.profile_name)
+        if profile:
+            self._profiling = True
+            self.profiler.enable()
+        start_wall, start_cpu, start_rss = default_timer(), cpu_time(), rss()
+        try:
+            yield
+        finally:
+            wall = default_timer() - start_wall
+            cpu = cpu_time() - start_cpu
+            if profile:
+                self.profiler.disable()
+                self._profiling = False
+            stats = self.timings[category].setdefault(name, {
+                'count': 0, 'wall': 0.0, 'cpu': 0.0, 'rss_growth': 0,
+                'max_rss': 0})
+            stats['count'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['rss_growth'] += rss() - start_rss
+            stats['max_rss'] = max(stats['max_rss'], max_rss())
+
+    def timed_function(self, category, name=None):
+        """Decorator form of `timed`, defaulting to the function's name"""
+        def decorator(fn):
+            stage = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timed(category, stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def report(self):
+        """JSON-serializable summary of everything recorded"""
+        return {'timings': {category: dict(stages)
+                            for category, stages in self.timings.items()},
+                'counters': dict(self.counters),
+                'max_rss': max_rss()}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    def dump_profile(self, path):
+        """Write cProfile stats for the profiled stage, if it ran"""
+        if self.profiler is not None and self.profiler.getstats():
+            self.profiler.dump_stats(path)
+            return True
+        return False
+
+
+recorder = Recorder()
+timed = recorder.timed
+timed_function = recorder.timed_function
+count = recorder.count
@@ -3,7 +3,7 @@ import logging
 
 from lxml import etree
 
-from regparser.grammar import amdpar, tokens
+from regparser.grammar import tokens
 from regparser.tree.struct import Node
 from regparser.tree.xml_parser.tree_utils import get_node_text
 
@@ -19,6 +19,8 @@ def parse_amdpar(par, initial_context):
     for e in filter(lambda e: e.text, par.xpath('./E')):
         e.text = e.text.replace(' and ', ' ')
     text = get_node_text(par, add_spaces=True)
+    # The amendment grammar is large, so we only build it when needed
+    from regparser.grammar import amdpar
     tokenized = [t[0] for t, _, _ in amdpar.token_patterns.scanString(text)]
 
     tokenized = compress_context_in_tokenlists(tokenized)
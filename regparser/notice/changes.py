@@ -6,7 +6,6 @@ import logging
 import copy
 from collections import defaultdict
 
-from regparser.grammar import amdpar
 from regparser.grammar.tokens import Verb
 from regparser.layer.paragraph_markers import marker_of
 from regparser.tree import struct
@@ -20,7 +19,7 @@ def node_to_dict(node):
         node.child_labels = [c.label_id() for c in node.children]
 
     node_dict = {}
-    for k, v in node.__dict__.items():
+    for k, v in node.fields().items():
         if k not in ('children', 'source_xml'):
             node_dict[k] = v
     return node_dict
@@ -366,5 +365,7 @@ def new_subpart_added(amendment):
     """ Return True if label indicates that a new subpart was added """
     new_subpart = amendment.action == 'POST'
     label = amendment.original_label
+    # As in amdparser, only build the (large) amendment grammar when needed
+    from regparser.grammar import amdpar
     m = [t for t, _, _ in amdpar.subpart_label.scanString(label)]
     return (len(m) > 0 and new_subpart)
@@ -8,7 +8,7 @@ import itertools
 import logging
 
 from regparser.grammar.tokens import Verb
-from regparser.tree.struct import Node, find, find_parent
+from regparser.tree.struct import Node, find, find_parent, iter_nodes
 from regparser.tree.xml_parser import interpretations, reg_text
 from regparser.utils import roman_nums
 
@@ -135,11 +135,105 @@ def is_interp_placeholder(node):
 
 class RegulationTree(object):
     """ This encapsulates a regulation tree, and methods to change that tree.
+    To avoid searching the whole tree for each change, we maintain indexes
+    of label_id -> node and node -> parent. All modifications of children
+    must therefore go through `_set_children`. Labels shared by multiple
+    nodes are looked up by walking the tree, to retain the original
+    "first match" semantics.
+
+    By default, we work on a deep copy of the previous tree. If
+    `share_structure` is set, we instead copy nodes only when they (or their
+    descendants) are about to be modified (see `_own`); unchanged subtrees
+    are shared between the previous tree and the new one. In that case,
+    neither tree should be modified after compilation.
     """
 
-    def __init__(self, previous_tree):
-        self.tree = copy.deepcopy(previous_tree)
+    def __init__(self, previous_tree, share_structure=False):
         self._kept__by_parent = defaultdict(list)
+        self._nodes, self._parents, self._ambiguous = {}, {}, set()
+        if share_structure:
+            self.tree = previous_tree
+            self._previous = previous_tree  # keeps the shared ids alive
+            self._shared = set()
+            if previous_tree is not None:
+                self._shared.update(id(n) for n in iter_nodes(previous_tree))
+        else:
+            self.tree = copy.deepcopy(previous_tree)
+            self._shared = None
+        if self.tree is not None:
+            self._index(self.tree, None)
+
+    def _index(self, node, parent):
+        """Add this node and its descendants to the indexes"""
+        self._parents[id(node)] = parent
+        label_id = node.label_id()
+        existing = self._nodes.get(label_id)
+        if existing is not None and existing is not node:
+            self._ambiguous.add(label_id)
+        else:
+            self._nodes[label_id] = node
+        for child in node.children:
+            self._index(child, node)
+
+    def _unindex(self, node):
+        """Remove this node and its descendants from the indexes. Labels
+        which were ambiguous remain so (we'll fall back to searching)"""
+        self._parents.pop(id(node), None)
+        label_id = node.label_id()
+        if self._nodes.get(label_id) is node:
+            del self._nodes[label_id]
+        for child in node.children:
+            self._unindex(child)
+
+    def _own(self, node):
+        """When sharing structure with the previous tree, nodes from that
+        tree must be copied before they are modified. As the copy replaces
+        the original in its parent, the parent (and so on up to the root) is
+        also copied. Returns the node which may be modified"""
+        if self._shared is None or id(node) not in self._shared:
+            return node
+
+        copied = copy.copy(node)
+        copied.children = list(node.children)
+        if id(node) in self._parents:    # i.e. still in the tree
+            parent = self._parents[id(node)]
+            if parent is None:
+                self.tree = copied
+            else:
+                parent = self._own(parent)
+                parent.children = [copied if child is node else child
+                                   for child in parent.children]
+            del self._parents[id(node)]
+            self._parents[id(copied)] = parent
+            for child in copied.children:
+                self._parents[id(child)] = copied
+            label_id = node.label_id()
+            if self._nodes.get(label_id) is node:
+                self._nodes[label_id] = copied
+        return copied
+
+    def _set_children(self, parent, children):
+        """Replace the parent's children, updating the indexes. Returns the
+        parent, which may have been copied (see `_own`)"""
+        parent = self._own(parent)
+        old_ids = set(id(child) for child in parent.children)
+        new_ids = set(id(child) for child in children)
+        for child in parent.children:
+            if id(child) not in new_ids:
+                self._unindex(child)
+        for child in children:
+            if id(child) not in old_ids:
+                self._index(child, parent)
+        parent.children = children
+        return parent
+
+    def _parent_of(self, label_id):
+        """Find the parent of the node with this label, if present"""
+        if label_id in self._ambiguous:
+            return find_parent(self.tree, label_id)
+        node = self._nodes.get(label_id)
+        if node is not None:
+            return self._parents[id(node)]
 
     def keep(self, labels):
         """The 'KEEP' verb tells us that a node should not be removed
@@ -147,16 +241,16 @@ class RegulationTree(object):
         parent). "Keeping" those nodes makes sure they do not disappear when
         editing their parent"""
         for label in labels:
-            node = self.find_node(label)
+            node = self._own(self.find_node(label))
             parent_label = get_parent_label(node)
             self._kept__by_parent[parent_label].append(node)
 
     def get_parent(self, node):
         """ Get the parent of a node. Returns None if parent not found. """
-        parent = find_parent(self.tree, node)
+        parent = self._parent_of(node.label_id())
         if not parent:  # e.g. because the node doesn't exist in the tree yet
             parent_label_id = get_parent_label(node)
-            parent = find(self.tree, parent_label_id)
+            parent = self.find_node(parent_label_id)
         if not parent:
             logging.error("Could not find parent of %s. Misparsed amendment?",
                           node.label_id())
@@ -164,15 +258,9 @@ class RegulationTree(object):
 
     def add_to_root(self, node):
         """ Add a child to the root of the tree. """
-        self.tree.children.append(node)
-
-        for c in self.tree.children:
-            c.sortable = make_root_sortable(c.label, c.node_type)
-
-        self.tree.children.sort(key=lambda x: x.sortable)
-
-        for c in self.tree.children:
-            del c.sortable
+        children = self.tree.children + [node]
+        children.sort(key=lambda c: make_root_sortable(c.label, c.node_type))
+        self._set_children(self.tree, children)
 
     def add_child(self, children, node, order=None):
         """ Add a child to the children, and sort appropriately. This is used
@@ -217,11 +305,11 @@ class RegulationTree(object):
 
         parent = self.get_parent(node)
         other_children = [c for c in parent.children if c.label != node.label]
-        parent.children = other_children
+        self._set_children(parent, other_children)
 
     def delete(self, label_id):
         """ Delete the node with label_id from the tree. """
-        node = find(self.tree, label_id)
+        node = self.find_node(label_id)
         if node is None:
             logging.warning("Attempting to delete %s failed", label_id)
         else:
@@ -233,7 +321,7 @@ class RegulationTree(object):
         represented in the FR XML. We simply use that representation here
         instead of doing something else. """
 
-        existing_node = find(self.tree, label_id)
+        existing_node = self.find_node(label_id)
         if existing_node is None:
             self.add_node(node)
         else:
@@ -241,8 +329,9 @@ class RegulationTree(object):
 
     def move(self, origin, destination):
         """ Move a node from one part in the tree to another. """
-        origin = find(self.tree, origin)
+        origin = self.find_node(origin)
         self.delete_from_parent(origin)
+        origin = self._own(origin)
 
         origin = overwrite_marker(origin, destination[-1])
         origin.label = destination
@@ -258,22 +347,20 @@ class RegulationTree(object):
         if prev_idx:
             # replace existing element in place
             prev_idx = prev_idx[0]
-            parent.children = (parent.children[:prev_idx] + [node] +
+            self._set_children(parent, parent.children[:prev_idx] + [node] +
                                parent.children[prev_idx + 1:])
         else:
             # actually adding a new element
-            parent.children = self.add_child(parent.children, node,
-                                             getattr(parent, 'child_labels',
-                                                     []))
+            self._set_children(parent, self.add_child(
+                parent.children, node, getattr(parent, 'child_labels', [])))
 
         # Finally, we see if this node is the parent of any 'kept' children.
         # If so, add them back
         label_id = node.label_id()
         if label_id in self._kept__by_parent:
             for kept in self._kept__by_parent[label_id]:
-                node.children = self.add_child(node.children, kept,
-                                               getattr(node, 'child_labels',
-                                                       []))
+                self._set_children(node, self.add_child(
+                    node.children, kept, getattr(node, 'child_labels', [])))
 
     def create_empty_node(self, node_label):
         """ In rare cases, we need to flush out the tree by adding
@@ -289,8 +376,8 @@ class RegulationTree(object):
         parent = self.get_parent(node)
         if not parent:
             parent = self.create_empty_node(get_parent_label(node))
-        parent.children = self.add_child(parent.children, node,
-                                         getattr(parent, 'child_labels', []))
+        self._set_children(parent, self.add_child(
+            parent.children, node, getattr(parent, 'child_labels', [])))
         return node
 
     def contains(self, label):
@@ -301,15 +388,18 @@ class RegulationTree(object):
     def find_node(self, label):
         if isinstance(label, list):
             label = '-'.join(label)
-        return find(self.tree, label)
+        if label in self._ambiguous:
+            return find(self.tree, label)
+        return self._nodes.get(label)
 
     def add_node(self, node, parent_label=None):
         """ Add an entirely new node to the regulation tree. """
-        existing = find(self.tree, node.label_id())
+        existing = self.find_node(node.label_id())
         if existing and is_reserved_node(existing):
             logging.warning('Replacing reserved node: %s' % node.label_id())
             return self.replace_node_and_subtree(node)
         elif existing and is_interp_placeholder(existing):
+            existing = self._own(existing)
             existing.title = node.title
             existing.text = node.text
             if hasattr(node, 'tagged_text'):
@@ -348,9 +438,9 @@ class RegulationTree(object):
                 if (parent.children and
                         parent.children[0].node_type == Node.EMPTYPART):
                     parent = parent.children[0]
-                parent.children = self.add_child(
+                self._set_children(parent, self.add_child(
                     parent.children, node, getattr(parent, 'child_labels',
-                                                   []))
+                                                   [])))
 
     def insert_in_order(self, node):
         """Add a new node, but determine its position in its parent by looking
@@ -358,24 +448,25 @@ class RegulationTree(object):
         parent = self.get_parent(node)
         texts = [child.text for child in parent.children]
         insert_idx = bisect(texts, node.text)
-        parent.children.insert(insert_idx, node)
+        self._set_children(parent, parent.children[:insert_idx] + [node] +
+                           parent.children[insert_idx:])
 
     def replace_node_text(self, label, change):
         """ Replace just a node's text. """
 
-        node = find(self.tree, label)
+        node = self._own(self.find_node(label))
         node.text = change['node']['text']
 
     def replace_node_title(self, label, change):
         """ Replace just a node's title. """
 
-        node = find(self.tree, label)
+        node = self._own(self.find_node(label))
         node.title = change['node']['title']
 
     def replace_node_heading(self, label, change):
         """ A node's heading is it's keyterm. We handle this here, but not
         well, I think. """
-        node = find(self.tree, label)
+        node = self._own(self.find_node(label))
         node.text = replace_first_sentence(node.text, change['node']['text'])
 
         if hasattr(node, 'tagged_text') and 'tagged_text' in change['node']:
@@ -399,19 +490,24 @@ class RegulationTree(object):
                 label, subpart_label)
             return
 
-        destination = find(self.tree, '-'.join(subpart_label))
+        destination = self.find_node(subpart_label)
 
         if destination is None:
             destination = self.create_new_subpart(subpart_label)
 
-        subpart_with_node = find_parent(self.tree, label)
+        subpart_with_node = self._parent_of(label)
 
         if destination and subpart_with_node:
-            node = find(subpart_with_node, label)
+            node = self.find_node(label)
             other_children = [c for c in subpart_with_node.children
                               if c.label_id() != label]
-            subpart_with_node.children = other_children
-            destination.children = self.add_child(destination.children, node)
+            # Either subpart may be copied (see `_own`), so we track the
+            # copies rather than the originals
+            subpart_with_node = self._set_children(subpart_with_node,
+                                                   other_children)
+            destination = self.find_node(subpart_label)
+            self._set_children(destination,
+                               self.add_child(destination.children, node))
 
             if not subpart_with_node.children:
                 self.delete('-'.join(subpart_with_node.label))
@@ -503,13 +599,20 @@ def _needs_delay(reg, change):
     return False
 
 
-def compile_regulation(previous_tree, notice_changes):
+def compile_regulation(previous_tree, notice_changes, share_structure=False):
     """ Given a last full regulation tree, and the set of changes from the
-    next final notice, construct the next full regulation tree. """
-    reg = RegulationTree(previous_tree)
+    next final notice, construct the next full regulation tree. See
+    RegulationTree regarding `share_structure`. """
+    return apply_changes(RegulationTree(previous_tree, share_structure),
+                         notice_changes)
+
+
+def apply_changes(reg, notice_changes):
+    """Apply the notice's changes to a RegulationTree, returning the
+    modified tree"""
     labels = sort_labels(notice_changes.keys())
 
-    reg_part = previous_tree.label[0]
+    reg_part = reg.tree.label[0]
     labels = filter(lambda l: l.split('-')[0] == reg_part, labels)
 
     next_pass = [(label, change)
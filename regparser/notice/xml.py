@@ -6,8 +6,8 @@ import os
 from urlparse import urlparse
 
 from lxml import etree
-import requests
 
+from regparser import fetch
 from regparser.grammar.unified import notice_cfr_p
 from regparser.history.delays import delays_in_sentence
 from regparser.index import xml_sync
@@ -269,7 +269,7 @@ def notice_xmls_for_url(doc_num, notice_url):
                 yield NoticeXML(f.read(), local_notice_file).preprocess()
     else:
         logger.info("fetching notice xml for %s", notice_url)
-        content = requests.get(notice_url).content
+        content = fetch.get(notice_url).content
         yield NoticeXML(content, notice_url).preprocess()
 
 
@@ -0,0 +1,211 @@
+# vim: set encoding=utf-8
+"""Deterministic generators of synthetic regulations: annual-edition-style
+CFR XML (as consumed by xml_parser.reg_text.build_tree) at a configurable
+scale, and amendments to the resulting trees. The same parameters and seed
+always produce the same output, so timings are comparable between runs"""
+from collections import defaultdict
+import random
+
+from lxml import etree
+
+from regparser.tree import struct
+from regparser.tree.paragraph import p_levels
+from regparser.tree.struct import Node
+
+SECTIONS_PER_SUBPART = 10     # at least; there are only 26 subpart letters
+WORDS = ('account', 'amount', 'any', 'applicable', 'balance', 'consumer',
+         'credit', 'days', 'disclose', 'each', 'fee', 'for', 'if', 'in',
+         'notice', 'of', 'payment', 'period', 'person', 'provided', 'rate',
+         'required', 'shall', 'such', 'the', 'to', 'under', 'within',
+         'written')
+TERMS = ('billing cycle', 'covered account', 'finance charge', 'open-end plan',
+         'periodic statement', 'servicer', 'transaction', 'widget')
+
+
+class Generator(object):
+    """Builds the XML for one regulation. `depth` is the maximum paragraph
+    depth (1-6) and `breadth` the maximum number of paragraphs at each
+    level. Past eight, lower case markers would collide with roman numerals
+    (e.g. "(i)"), so breadth is capped"""
+    def __init__(self, cfr_part=1000, sections=20, depth=4, breadth=4,
+                 interps=10, appendices=2, seed=0):
+        self.cfr_part = str(cfr_part)
+        self.sections = max(sections, 2)    # scope & definitions
+        self.depth = min(max(depth, 1), len(p_levels))
+        self.breadth = min(max(breadth, 1), 8)
+        self.interps = min(interps, self.sections)
+        self.appendices = min(appendices, 26)
+        self.rng = random.Random(seed)
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def sentence(self, section_number):
+        """Random text, sprinkled with defined terms and citations so that
+        the layers have something to find"""
+        parts = [self.words(self.rng.randint(4, 12))]
+        roll = self.rng.random()
+        if roll < 0.3:
+            parts.append('the ' + self.rng.choice(TERMS))
+        elif roll < 0.45:
+            parts.append(u'as described in § {}.{}(a)'.format(
+                self.cfr_part, self.rng.randint(1, self.sections)))
+        elif roll < 0.55:
+            parts.append('under paragraph (a) of this section')
+        elif roll < 0.6:
+            parts.append('pursuant to 15 U.S.C. {}'.format(
+                1600 + section_number))
+        parts.append(self.words(self.rng.randint(2, 8)))
+        return ' '.join(parts) + '.'
+
+    def paragraph_outline(self, level=0):
+        """(level, index) pairs for the paragraphs of a section, in document
+        order"""
+        for idx in range(self.rng.randint(1, self.breadth)):
+            yield level, idx
+            if level + 1 < self.depth and self.rng.random() < 0.6:
+                for pair in self.paragraph_outline(level + 1):
+                    yield pair
+
+    def paragraph(self, section_number, level, idx, term=None):
+        if level >= 4:  # the emphasized levels
+            prefix = u'(<E T="03">{}</E>) '.format(p_levels[level - 3][idx])
+        else:
+            prefix = u'({}) '.format(p_levels[level][idx])
+        if term:
+            body = u'<E T="03">{}</E> means {}'.format(
+                term.capitalize(), self.sentence(section_number))
+        elif level == 0 and self.rng.random() < 0.3:
+            body = u'<E T="03">{}.</E> {}'.format(
+                self.words(2).capitalize(), self.sentence(section_number))
+        else:
+            body = self.sentence(section_number)
+        return etree.fromstring(u'<P>{}{}</P>'.format(prefix, body))
+
+    def section(self, number):
+        section = etree.Element('SECTION')
+        etree.SubElement(section, 'SECTNO').text = u'§ {}.{}'.format(
+            self.cfr_part, number)
+        subject = etree.SubElement(section, 'SUBJECT')
+        if number == 1:
+            subject.text = 'Authority, purpose, and scope.'
+        elif number == 2:
+            subject.text = 'Definitions.'
+        else:
+            subject.text = self.words(3).capitalize() + '.'
+
+        if number == 2:     # one top-level paragraph per defined term
+            for idx, term in enumerate(TERMS):
+                section.append(self.paragraph(number, 0, idx, term))
+        else:
+            for level, idx in self.paragraph_outline():
+                section.append(self.paragraph(number, level, idx))
+        return section
+
+    def interp_paragraphs(self, parent, number):
+        for idx in range(self.rng.randint(1, self.breadth)):
+            etree.SubElement(parent, 'P').text = u'{}. {}'.format(
+                idx + 1, self.sentence(number))
+            if self.depth > 1 and self.rng.random() < 0.5:
+                for sub_idx in range(self.rng.randint(1, self.breadth)):
+                    etree.SubElement(parent, 'P').text = u'{}. {}'.format(
+                        p_levels[2][sub_idx], self.sentence(number))
+
+    def supplement(self):
+        appendix = etree.Element('APPENDIX')
+        etree.SubElement(appendix, 'EAR').text = 'Pt. {}, Supp. I'.format(
+            self.cfr_part)
+        etree.SubElement(appendix, 'HD', SOURCE='HED').text = (
+            u'Supplement I to Part {}—Official Interpretations'.format(
+                self.cfr_part))
+        for number in range(1, self.interps + 1):
+            etree.SubElement(appendix, 'HD', SOURCE='HD2').text = (
+                u'Section {}.{}—{}'.format(
+                    self.cfr_part, number, self.words(3).capitalize()))
+            self.interp_paragraphs(appendix, number)
+            etree.SubElement(appendix, 'HD', SOURCE='HD2').text = (
+                u'{}(a) {}'.format(number, self.words(2).capitalize()))
+            self.interp_paragraphs(appendix, number)
+        return appendix
+
+    def appendix(self, letter):
+        appendix = etree.Element('APPENDIX')
+        etree.SubElement(appendix, 'EAR').text = 'Pt. {}, App. {}'.format(
+            self.cfr_part, letter)
+        etree.SubElement(appendix, 'HD', SOURCE='HED').text = (
+            u'Appendix {} to Part {}—{}'.format(
+                letter, self.cfr_part, self.words(3).capitalize()))
+        for _ in range(self.rng.randint(1, self.breadth)):
+            etree.SubElement(appendix, 'HD', SOURCE='HD1').text = (
+                self.words(3).capitalize())
+            for _ in range(self.rng.randint(1, self.breadth)):
+                etree.SubElement(appendix, 'P').text = self.sentence(0)
+        return appendix
+
+    def xml(self):
+        root = etree.Element('CFRGRANULE')
+        part = etree.SubElement(root, 'PART')
+        etree.SubElement(part, 'EAR').text = 'Pt. {}'.format(self.cfr_part)
+        etree.SubElement(part, 'HD', SOURCE='HED').text = (
+            u'PART {}—SYNTHETIC REGULATION'.format(self.cfr_part))
+        subpart = None
+        per_subpart = max(SECTIONS_PER_SUBPART, -(-self.sections // 26))
+        for number in range(1, self.sections + 1):
+            if (number - 1) % per_subpart == 0:
+                letter = chr(ord('A') + (number - 1) // per_subpart)
+                subpart = etree.SubElement(part, 'SUBPART')
+                etree.SubElement(subpart, 'HD', SOURCE='HED').text = (
+                    u'Subpart {}—{}'.format(
+                        letter, self.words(2).capitalize()))
+            subpart.append(self.section(number))
+        for idx in range(self.appendices):
+            part.append(self.appendix(chr(ord('A') + idx)))
+        if self.interps:
+            part.append(self.supplement())
+        # Real XML is pretty printed; the parser depends on that whitespace
+        return etree.fromstring(etree.tostring(root, pretty_print=True))
+
+
+def regulation_xml(**kwargs):
+    """See `Generator` for the parameters"""
+    return Generator(**kwargs).xml()
+
+
+def amendments(tree, count, seed=0):
+    """Generate (up to) `count` changes to the regulation text paragraphs of
+    `tree`, in the format compile_regulation expects: a mix of revised text,
+    added paragraphs and removed (leaf) paragraphs"""
+    rng = random.Random(seed)
+    paragraphs, sections = [], []
+    for node in struct.iter_nodes(tree):
+        if node.node_type != Node.REGTEXT:
+            continue
+        if node.is_section() and node.children:
+            sections.append(node)
+        elif len(node.label) > 2:
+            paragraphs.append(node)
+
+    changes, added = {}, defaultdict(int)
+    for node in rng.sample(paragraphs, min(count, len(paragraphs))):
+        roll = rng.random()
+        if roll < 0.25 and sections:
+            # Add a paragraph to the end of a section
+            section = rng.choice(sections)
+            new_idx = len(section.children) + added[section.label_id()]
+            if new_idx >= len(p_levels[0]):
+                continue
+            added[section.label_id()] += 1
+            marker = p_levels[0][new_idx]
+            label = section.label + [marker]
+            changes['-'.join(label)] = [{
+                'action': 'POST', 'node': {
+                    'text': u'({}) Added text.'.format(marker),
+                    'label': label, 'node_type': Node.REGTEXT}}]
+        elif roll < 0.4 and not node.children:
+            changes[node.label_id()] = [{'action': 'DELETE'}]
+        else:
+            changes[node.label_id()] = [{
+                'action': 'PUT', 'field': '[text]', 'node': {
+                    'text': node.text + u' Revised.', 'label': node.label,
+                    'node_type': node.node_type}}]
+    return changes
@@ -1,10 +1,16 @@
+import logging
+import types
+
 from constraint import Problem
 
-from regparser.tree.depth import markers, rules
-from regparser.tree.depth.pair_rules import pair_rules
+from regparser.index.cache import digest, DiskCache
+from regparser.tree.depth import markers, pair_rules, rules
 from regparser.tree.struct import Node
 
 
+logger = logging.getLogger(__name__)
+
+
 class ParAssignment(object):
     """A paragraph's type, index, depth assignment"""
     def __init__(self, typ, idx, depth):
@@ -79,20 +85,17 @@ def _decompress_markerless(assignment, marker_list):
     return result
 
 
-def derive_depths(original_markers, additional_constraints=[]):
-    """Use constraint programming to derive the paragraph depths associated
-    with a list of paragraph markers. Additional constraints (e.g. expected
-    marker types, etc.) can also be added. Such constraints are functions of
-    two parameters, the constraint function (problem.addConstraint) and a
-    list of all variables"""
-    if not original_markers:
-        return []
+def _build_problem(marker_list, additional_constraints, candidate=None):
+    """Construct the constraint problem associated with a (compressed) list
+    of paragraph markers. If a `candidate` solution (list of (type index,
+    idx, depth) triples) is provided, each variable may only take its value
+    from that solution"""
     problem = Problem()
-    marker_list = _compress_markerless(original_markers)
 
     # Depth in the tree, with an arbitrary limit of 10
-    problem.addVariables(["depth" + str(i) for i in range(len(marker_list))],
-                         range(10))
+    for idx in range(len(marker_list)):
+        problem.addVariable("depth" + str(idx),
+                            [candidate[idx][2]] if candidate else range(10))
 
     # Always start at depth 0
     problem.addConstraint(rules.must_be(0), ("depth0",))
@@ -109,6 +112,9 @@ def derive_depths(original_markers, additional_constraints=[]):
         typ_opts = [t for t in markers.types if marker in t]
         idx_opts = [i for t in typ_opts for i in range(len(t))
                     if t[i] == marker]
+        if candidate:
+            typ_opts = [markers.types[candidate[idx][0]]]
+            idx_opts = [candidate[idx][1]]
         problem.addVariable(type_var, typ_opts)
         problem.addVariable(idx_var, idx_opts)
 
@@ -117,7 +123,7 @@ def derive_depths(original_markers, additional_constraints=[]):
 
         if idx > 0:
             pairs = all_vars[3*(idx-1):]
-            problem.addConstraint(pair_rules, pairs)
+            problem.addConstraint(pair_rules.pair_rules, pairs)
 
         if idx > 1:
             pairs = all_vars[3*(idx-2):]
@@ -138,12 +144,180 @@ def derive_depths(original_markers, additional_constraints=[]):
 
     for constraint in additional_constraints:
         constraint(problem.addConstraint, all_vars)
+    return problem
+
+
+def _solve(marker_list, additional_constraints):
+    """All solutions for a (compressed) list of markers, as lists of
+    (type index, idx, depth) triples"""
+    problem = _build_problem(marker_list, additional_constraints)
+    return [[(_TYPE_INDEX[id(assignment['type{}'.format(i)])],
+              assignment['idx{}'.format(i)],
+              assignment['depth{}'.format(i)])
+             for i in range(len(marker_list))]
+            for assignment in problem.getSolutionIter()]
+
+
+_TYPE_INDEX = {id(typ): idx for idx, typ in enumerate(markers.types)}
+# Marker types which share no markers with any other type
+_UNAMBIGUOUS = {}
+for _marker_type in markers.types:
+    for _marker in _marker_type:
+        _UNAMBIGUOUS[_marker] = None if _marker in _UNAMBIGUOUS else (
+            _TYPE_INDEX[id(_marker_type)], _marker_type.index(_marker))
+for _marker in markers.stars + markers.markerless:
+    _UNAMBIGUOUS[_marker] = None
+
+
+def _fast_path(marker_list, additional_constraints):
+    """Many marker lists (e.g. "a, 1, 2, b, c") consist only of markers which
+    belong to a single type, each either continuing a sequence of an
+    ancestor (or sibling) without gaps or starting a new sequence. These have
+    exactly one solution, which we can find with a stack rather than a
+    search. We still verify that solution against the full set of
+    constraints (cheap, as every variable has a single value). Returns None
+    if the list doesn't fit this pattern"""
+    stack, solution = [], []
+    for marker in marker_list:
+        type_idx = _UNAMBIGUOUS.get(marker)
+        if type_idx is None:
+            return None
+        typ, idx = type_idx
+        depth = next((depth for depth, prev in enumerate(stack)
+                      if prev[0] == typ), None)
+        if depth is not None and stack[depth][1] + 1 == idx:
+            del stack[depth:]
+        elif depth is None and idx == 0 and len(stack) < 10:
+            depth = len(stack)
+        else:
+            return None
+        stack.append((typ, idx))
+        solution.append((typ, idx, depth))
+
+    problem = _build_problem(marker_list, additional_constraints, solution)
+    if problem.getSolution():
+        return [solution]
+    return []
+
+
+class _Unsignable(Exception):
+    pass
+
+
+def _signature(value):
+    """A stable string describing a constraint (or value captured by a
+    constraint), so that we can use it as part of a cache key. Raises
+    _Unsignable if we can't describe it"""
+    if isinstance(value, types.FunctionType):
+        cells = [cell.cell_contents for cell in value.__closure__ or ()]
+        return '{}.{}({})'.format(value.__module__, value.__name__,
+                                  ','.join(map(_signature, cells)))
+    elif isinstance(value, (tuple, list)):
+        if id(value) in _TYPE_INDEX:
+            return 'types[{}]'.format(_TYPE_INDEX[id(value)])
+        return '[{}]'.format(','.join(map(_signature, value)))
+    elif value is None or isinstance(value, (basestring, int, float)):
+        return repr(value)
+    raise _Unsignable()
+
+
+class SolutionCache(object):
+    """Memoizes solutions to `derive_depths`, keyed by the (compressed)
+    marker list, a signature of the constraints and CACHE_VERSION. Solutions
+    are held in memory and, if `persist` has been called, on disk (so they
+    are shared between runs)"""
+    MAX_IN_MEMORY = 10000
+    # Bump whenever a change to this module or to the rules (markers,
+    # optional_rules, pair_rules, rules) could change the solutions found
+    CACHE_VERSION = 1
+
+    def __init__(self):
+        self.memory = {}
+        self.disk = None
+        self.hits, self.misses = 0, 0
+
+    def persist(self):
+        self.disk = DiskCache('depths')
+
+    def evict(self):
+        """Keep the on-disk cache within its size cap. Only needed if we've
+        added to it"""
+        if self.disk and self.misses:
+            self.disk.evict()
+
+    def key(self, marker_list, additional_constraints):
+        """Returns None if the constraints can't be described"""
+        try:
+            signature = ';'.join(map(_signature, additional_constraints))
+        except _Unsignable:
+            return None
+        return digest(str(self.CACHE_VERSION), signature, *marker_list)
+
+    def get(self, key):
+        if key in self.memory:
+            self.hits += 1
+            return self.memory[key]
+        if self.disk:
+            try:
+                solutions = self.disk[key]
+                self._remember(key, solutions)
+                self.hits += 1
+                return solutions
+            except KeyError:
+                pass
+        self.misses += 1
+
+    def set(self, key, solutions):
+        self._remember(key, solutions)
+        if self.disk:
+            self.disk[key] = solutions
+
+    def _remember(self, key, solutions):
+        if len(self.memory) >= self.MAX_IN_MEMORY:
+            self.memory = {}
+        self.memory[key] = solutions
+
+
+solution_cache = SolutionCache()
+
+
+def derive_depths(original_markers, additional_constraints=[]):
+    """Use constraint programming to derive the paragraph depths associated
+    with a list of paragraph markers. Additional constraints (e.g. expected
+    marker types, etc.) can also be added. Such constraints are functions of
+    two parameters, the constraint function (problem.addConstraint) and a
+    list of all variables.
+
+    As the same marker lists recur frequently, results are memoized in
+    `solution_cache`; common, unambiguous lists skip the search altogether
+    (see `_fast_path`)"""
+    if not original_markers:
+        return []
+    marker_list = _compress_markerless(original_markers)
+
+    key = solution_cache.key(marker_list, additional_constraints)
+    solutions = solution_cache.get(key) if key else None
+    if solutions is None:
+        solutions = _fast_path(marker_list, additional_constraints)
+        if solutions is None:
+            solutions = _solve(marker_list, additional_constraints)
+        if key:
+            solution_cache.set(key, solutions)
+
+    return [Solution(_decompress_markerless(
+        _to_assignment(solution), original_markers))
+        for solution in solutions]
+
 
-    solutions = []
-    for assignment in problem.getSolutionIter():
-        assignment = _decompress_markerless(assignment, original_markers)
-        solutions.append(Solution(assignment))
-    return solutions
+def _to_assignment(solution):
+    """Convert a list of (type index, idx, depth) triples into the dict
+    format used by the constraint solver"""
+    assignment = {}
+    for i, (typ, idx, depth) in enumerate(solution):
+        assignment['type{}'.format(i)] = markers.types[typ]
+        assignment['idx{}'.format(i)] = idx
+        assignment['depth{}'.format(i)] = depth
+    return assignment
 
 
 def debug_idx(markers, constraints=[]):
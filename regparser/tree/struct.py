@@ -1,12 +1,26 @@
+from collections import defaultdict
 import re
 from json import JSONEncoder
 import hashlib
+import weakref
 
 from lxml import etree
 
+from regparser.index.cache import digest
 from regparser.tree.depth.markers import MARKERLESS
 
 
+_interned = {}
+
+
+def intern_value(value):
+    """Large trees repeat the same label segments and node types many times
+    over. Share one copy of each. Unlike the `intern` builtin, this also
+    accepts unicode"""
+    # Keyed by type as u'1' == '1'; we don't want to change the value's type
+    return _interned.setdefault((type(value), value), value)
+
+
 class Node(object):
     APPENDIX = u'appendix'
     INTERP = u'interp'
@@ -20,6 +34,13 @@ class Node(object):
 
     MARKERLESS_REGEX = re.compile(r'p\d+')
 
+    # Nodes are numerous, so we avoid a per-instance __dict__. tagged_text
+    # and child_labels are optional; they are only present if set
+    __slots__ = ('text', 'children', 'label', 'title', 'node_type',
+                 'source_xml', 'tagged_text', 'child_labels', '_content_hash')
+    # Nodes are mutable, so (as before) they hash by identity
+    __hash__ = object.__hash__
+
     def __init__(self, text='', children=[], label=[], title=None,
                  node_type=REGTEXT, source_xml=None):
 
@@ -28,19 +49,101 @@ class Node(object):
         # defensive copy
         self.children = list(children)
 
-        self.label = [str(l) for l in label if l != '']
+        self.label = [intern_value(str(l)) for l in label if l != '']
         title = unicode(title or '')
         self.title = title or None
-        self.node_type = node_type
+        self.node_type = intern_value(node_type)
         self.source_xml = source_xml
 
+    def fields(self):
+        """Dictionary of the fields which have been set, (roughly) equivalent
+        to the __dict__ of a non-slotted object"""
+        return {field: getattr(self, field) for field in self.__slots__
+                if not field.startswith('_') and hasattr(self, field)}
+
+    def __getstate__(self):
+        return self.fields()
+
+    def __setstate__(self, state):
+        for field, value in state.items():
+            setattr(self, field, value)
+
     def __repr__(self):
         return (("Node( text = %s, children = %s, label = %s, title = %s, " +
                  "node_type = %s)") % (repr(self.text), repr(self.children),
                 repr(self.label), repr(self.title), repr(self.node_type)))
 
-    def __cmp__(self, other):
-        return cmp(repr(self), repr(other))
+    def __eq__(self, other):
+        """Compare field-by-field, recursing into the children. Identical
+        subtrees (e.g. those shared between compiled versions) are resolved
+        without recursing, as are children of nodes with cached content
+        hashes"""
+        if self is other:
+            return True
+        if not isinstance(other, Node):
+            return NotImplemented
+        if not (self.label == other.label and
+                self.node_type == other.node_type and
+                self.title == other.title and
+                self.text == other.text):
+            return False
+        hashes = (getattr(self, '_content_hash', None),
+                  getattr(other, '_content_hash', None))
+        if None not in hashes:
+            return hashes[0] == hashes[1]
+        return self.children == other.children
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def _sort_key(self):
+        return (self.label, self.node_type, self.title, self.text)
+
+    def __lt__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        lhs, rhs = self._sort_key(), other._sort_key()
+        if lhs != rhs:
+            return lhs < rhs
+        return self.children < other.children
+
+    def __gt__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return other < self
+
+    def __le__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return not other < self
+
+    def __ge__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return not self < other
+
+    def content_hash(self):
+        """Merkle hash of this node's fields and its children (see
+        FrozenNode). The hash is cached on each node of the subtree, which
+        also lets equality checks short-circuit, so only call this once the
+        subtree will no longer be modified (or `clear_content_hash` after).
+        Copies and pickles do not carry the cached value"""
+        if getattr(self, '_content_hash', None) is None:
+            # digest() delimits each field, so e.g. text can't run into the
+            # title
+            self._content_hash = digest(
+                self.text, self.title or '', self.label_id(), self.node_type,
+                *[child.content_hash() for child in self.children])
+        return self._content_hash
+
+    def clear_content_hash(self):
+        """Forget cached content hashes for this node and its descendants"""
+        to_clear = [self]
+        while to_clear:
+            node = to_clear.pop()
+            node._content_hash = None
+            to_clear.extend(node.children)
 
     def label_id(self):
         return '-'.join(self.label)
@@ -84,7 +187,7 @@ class NodeEncoder(JSONEncoder):
     """Custom JSON encoder to handle Node objects"""
     def default(self, obj):
         if isinstance(obj, Node):
-            fields = dict(obj.__dict__)
+            fields = obj.fields()
             if obj.title is None:
                 del fields['title']
             for field in ('tagged_text', 'source_xml', 'child_labels'):
@@ -142,31 +245,57 @@ def frozen_node_decode_hook(d):
     return d
 
 
+def iter_nodes(root, post_order=False):
+    """Lazily iterate over every node in the tree, pre-order by default.
+    Uses an explicit stack (of child iterators), so deep trees don't approach
+    the recursion limit and consumers can stop early. In pre-order, a node's
+    children are read after the node is yielded, so they may be modified by
+    the consumer"""
+    if post_order:
+        stack = [(root, iter(root.children))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                stack.append((child, iter(child.children)))
+                break
+            else:
+                stack.pop()
+                yield node
+    else:
+        yield root
+        stack = [iter(root.children)]
+        while stack:
+            for node in stack[-1]:
+                yield node
+                if node.children:
+                    stack.append(iter(node.children))
+                break
+            else:
+                stack.pop()
+
+
 def walk(node, fn):
     """Perform fn for every node in the tree. Pre-order traversal. fn must
     be a function that accepts a root node."""
-    result = fn(node)
-
-    if result is not None:
-        results = [result]
-    else:
-        results = []
-    for child in node.children:
-        results += walk(child, fn)
+    results = []
+    for descendant in iter_nodes(node):
+        result = fn(descendant)
+        if result is not None:
+            results.append(result)
     return results
 
 
 def filter_walk(node, fn):
     """Perform fn on the label for every node in the tree and return a
     list of nodes on which the function returns truthy."""
-    return walk(node, lambda n: n if fn(n.label) else None)
+    return [n for n in iter_nodes(node) if fn(n.label)]
 
 
 def find_first(root, predicate):
     """Walk the tree and find the first node which matches the predicate"""
-    response = walk(root, lambda n: n if predicate(n) else None)
-    if response:
-        return response[0]
+    for node in iter_nodes(root):
+        if predicate(node):
+            return node
 
 
 def find(root, label):
@@ -190,26 +319,22 @@ def find_parent(root, label):
 
 def join_text(node):
     """Join the text of this node and all children"""
-    bits = []
-    walk(node, lambda n: bits.append(n.text))
-    return ''.join(bits)
+    return ''.join(n.text for n in iter_nodes(node))
 
 
 def merge_duplicates(nodes):
     """Given a list of nodes with the same-length label, merge any
-    duplicates (by combining their children)"""
-    found_pair = None
-    for lidx, lhs in enumerate(nodes):
-        for ridx, rhs in enumerate(nodes[lidx + 1:], lidx + 1):
-            if lhs.label == rhs.label:
-                found_pair = (lidx, ridx)
-    if found_pair:
-        lidx, ridx = found_pair
-        lhs, rhs = nodes[lidx], nodes[ridx]
-        lhs.children.extend(rhs.children)
-        return merge_duplicates(nodes[:ridx] + nodes[ridx + 1:])
-    else:
-        return nodes
+    duplicates (by combining their children). The first of each label is
+    retained, in its original position"""
+    by_label, merged = {}, []
+    for node in nodes:
+        key = tuple(node.label)
+        if key in by_label:
+            by_label[key].children.extend(node.children)
+        else:
+            by_label[key] = node
+            merged.append(node)
+    return merged
 
 
 def treeify(nodes):
@@ -219,25 +344,27 @@ def treeify(nodes):
     if not nodes:
         return nodes
 
-    min_len, with_min = len(nodes[0].label), []
+    min_len = min(len(node.label) for node in nodes)
+    with_min = merge_duplicates(
+        [node for node in nodes if len(node.label) == min_len])
 
-    for node in nodes:
-        if len(node.label) == min_len:
-            with_min.append(node)
-        elif len(node.label) < min_len:
-            min_len = len(node.label)
-            with_min = [node]
-    with_min = merge_duplicates(with_min)
+    # Bucket the nodes by label prefix, once for each prefix length a root
+    # might need, rather than scanning all of the nodes for every root
+    buckets = {}
+    for prefix_len in set(len(root.label) - (root.label[-1] ==
+                                             Node.INTERP_MARK)
+                          for root in with_min):
+        bucket = buckets[prefix_len] = defaultdict(list)
+        for node in nodes:
+            bucket[tuple(node.label[:prefix_len])].append(node)
 
     roots = []
     for root in with_min:
         label = root.label
         if root.label[-1] == Node.INTERP_MARK:
             label = root.label[:-1]
-
-        def is_child(node):
-            return node.label[:len(label)] == label
-        children = [n for n in nodes if n.label != root.label and is_child(n)]
+        children = [n for n in buckets[len(label)][tuple(label)]
+                    if n.label != root.label]
         root.children = root.children + treeify(children)
         roots.append(root)
     return roots
@@ -245,21 +372,30 @@ def treeify(nodes):
 
 class FrozenNode(object):
     """Immutable interface for nodes. No guarantees about internal state."""
-    _pool = {}    # collection of all FrozenNodes, keyed by hash
+    # Live FrozenNodes, keyed by hash. Entries disappear along with the last
+    # reference to their node, so the pool only grows with the trees in use
+    _pool = weakref.WeakValueDictionary()
+    _pool_hits, _pool_misses = 0, 0
+    __slots__ = ('_text', '_children', '_label', '_title', '_node_type',
+                 '_tagged_text', '_child_labels', '_label_id', '_hash',
+                 '__weakref__')
 
     def __init__(self, text='', children=(), label=(), title='',
                  node_type=Node.REGTEXT, tagged_text=''):
         self._text = text or ''
         self._children = tuple(children)
-        self._label = tuple(label)
+        self._label = tuple(intern_value(l) for l in label)
         self._title = title or ''
-        self._node_type = node_type
+        self._node_type = intern_value(node_type)
         self._tagged_text = tagged_text or ''
         self._child_labels = tuple(c.label_id for c in self.children)
         self._label_id = '-'.join(self.label)
         self._hash = self._generate_hash()
-        if self.hash not in FrozenNode._pool:
+        if FrozenNode._pool.get(self.hash) is None:
             FrozenNode._pool[self.hash] = self
+            FrozenNode._pool_misses += 1
+        else:
+            FrozenNode._pool_hits += 1
 
     @property
     def text(self):
@@ -345,8 +481,21 @@ class FrozenNode(object):
         """When we instantiate a FrozenNode, we add it to _pool if we've not
         seen an identical FrozenNode before. If we have, we want to work with
         that previously seen version instead. This method returns the _first_
-        FrozenNode with identical fields"""
-        return FrozenNode._pool[self.hash]  # note this may not be self
+        FrozenNode with identical fields which is still alive"""
+        existing = FrozenNode._pool.get(self.hash)
+        if existing is None:    # that version has since been collected
+            FrozenNode._pool[self.hash] = self
+            existing = self
+        return existing  # note this may not be self
+
+    @staticmethod
+    def pool_stats():
+        """Number of live nodes in the pool and how often newly instantiated
+        nodes matched one of them"""
+        hits, misses = FrozenNode._pool_hits, FrozenNode._pool_misses
+        return {'size': len(FrozenNode._pool), 'hits': hits,
+                'misses': misses,
+                'hit_rate': float(hits) / (hits + misses) if hits else 0.0}
 
     def clone(self, **kwargs):
         """Implement a namedtuple `_replace` style functionality, copying all
@@ -2,6 +2,7 @@ from copy import deepcopy
 
 from lxml import etree
 
+from regparser import metrics
 from regparser.plugins import class_paths_to_classes
 import settings
 
@@ -31,7 +32,8 @@ class XMLWrapper(object):
         tend to instead use the files in settings.LOCAL_XML_PATHS"""
 
         for preprocessor in class_paths_to_classes(settings.PREPROCESSORS):
-            preprocessor().transform(self.xml)
+            with metrics.timed('preprocessor', preprocessor.__name__):
+                preprocessor().transform(self.xml)
 
         return self
 
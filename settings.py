@@ -63,6 +63,11 @@ DEFAULT_IMAGE_URL = (
     'https://s3.amazonaws.com/images.federalregister.gov/' +
     '%s/original.gif')
 
+# Resolved image urls are cached in the index for this many seconds (0
+# disables the cache). Uncached images are checked with this many threads
+GRAPHICS_CACHE_TTL = 7 * 24 * 60 * 60
+GRAPHICS_WORKERS = 8
+
 # dict: string->[string]: List of phrases which shouldn't contain defined
 # terms. Keyed by CFR part or 'ALL'.
 IGNORE_DEFINITIONS_IN = plugins.update_dictionary(
@@ -110,6 +115,26 @@ APPENDIX_IGNORE_SUBHEADER_LABEL = {}
 # defines where it should find those edits
 XML_REPO = 'https://github.com/eregs/fr-notices.git'
 
+# Which algorithm to use when computing word-level text diffs. One of the
+# keys of regparser.diff.text.MATCHERS: 'difflib' or 'patience'
+DIFF_TEXT_MATCHER = 'difflib'
+
+# Where HTTP responses (from the Federal Register, GPO, etc.) are cached.
+# Unlike the index, this is only removed by `eregs clear --http-cache`
+HTTP_CACHE_DIR = 'http_cache'
+
+# Seconds for which cached HTTP responses are used without asking the server
+# whether they've changed, by domain. The most specific domain wins; None
+# applies to all others. Afterwards, a conditional GET re-downloads only
+# documents which have changed
+HTTP_CACHE_TTLS = {
+    None: 3 * 24 * 60 * 60,
+    # New rules may appear in search results any day
+    'federalregister.gov': 24 * 60 * 60,
+    # Annual editions don't change once published
+    'gpo.gov': 30 * 24 * 60 * 60,
+}
+
 # A dictionary of agency-specific external citations
 # @todo - move ATF citations to an extension
 CUSTOM_CITATIONS = {
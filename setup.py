@@ -4,6 +4,7 @@ setup(
     name="regparser",
     version="2.0.0",
     packages=find_packages(),
+    package_data={'regparser.test_utils': ['fixtures/*.xml']},
     classifiers=[
         'License :: Public Domain',
         'License :: CC0 1.0 Universal (CC0 1.0) Public Domain Dedication'
@@ -19,8 +20,7 @@ setup(
         "networkx",
         "pyparsing",
         "python-constraint",
-        "requests",
-        "requests-cache"
+        "requests"
     ],
     entry_points={"console_scripts": ["eregs=eregs:main"]}
 )
@@ -1,15 +1,21 @@
+import BaseHTTPServer
+import gzip
 import json
 import os
 import shutil
 import tempfile
+import zlib
 from unittest import TestCase
 
+from mock import patch
+
 from regparser.api_writer import (
-    APIWriteContent, Client, FSWriteContent, GitWriteContent, Repo)
+    APIWriteContent, Archive, ArchiveWriteContent, Client, FSWriteContent,
+    GitWriteContent, read_archive, Repo, Uploader)
 from regparser.tree.struct import Node
 from regparser.notice.amdparser import Amendment, DesignateAmendment
 import settings
-from tests.http_mixin import HttpMixin
+from tests.http_stub import StubServerMixin
 
 
 class FSWriteContentTest(TestCase):
@@ -66,16 +72,191 @@ class FSWriteContentTest(TestCase):
                          ['action', [['label']], 'destination'])
 
 
-class APIWriteContentTest(HttpMixin, TestCase):
+class UploadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Records each POST and responds with the next status queued for its
+    path in the server's `statuses` (201 by default). A queued None drops the
+    connection without responding"""
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, self.headers, body))
+        queued = self.server.statuses.get(self.path)
+        status = queued.pop(0) if queued else 201
+        if status is None:
+            self.close_connection = 1
+            return
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UploadServerMixin(StubServerMixin):
+    handler_class = UploadHandler
+
+    def setUp(self):
+        super(UploadServerMixin, self).setUp()
+        self.server.statuses = {}
+
+    def paths_requested(self):
+        return [path for path, _, _ in self.server.requests]
+
+
+class APIWriteContentTest(UploadServerMixin, TestCase):
     def test_write(self):
-        writer = APIWriteContent("http://example.com", "a", "path")
+        writer = APIWriteContent(self.base, "a", "path")
         data = {"testing": ["body", 1, 2]}
-        self.expect_json_http(method='POST', uri='http://example.com/a/path')
         writer.write(data)
 
-        self.assertEqual(self.last_http_headers()['content-type'],
-                         'application/json')
-        self.assertEqual(self.last_http_body(), data)
+        (path, headers, body), = self.server.requests
+        self.assertEqual(path, '/a/path')
+        self.assertEqual(headers['content-type'], 'application/json')
+        self.assertEqual(json.loads(body), data)
+
+
+class UploaderTest(UploadServerMixin, TestCase):
+    def test_post_gzip(self):
+        """Bodies can be gzip-compressed"""
+        uploader = Uploader(compress=True)
+        uploader.post(self.base + '/a', {'some': 'data'})
+
+        (_, headers, body), = self.server.requests
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(
+            json.loads(zlib.decompress(body, 16 + zlib.MAX_WBITS)),
+            {'some': 'data'})
+        summary = uploader.finish()
+        self.assertEqual(summary['documents'], 1)
+        self.assertEqual(summary['bytes'], len(body))
+        self.assertEqual(summary['failures'], [])
+
+    @patch('regparser.api_writer.metrics.count')
+    @patch('regparser.api_writer.time.sleep')
+    def test_post_retries(self, sleep, count):
+        """Server errors are retried with backoff; client errors are not.
+        Each attempt is counted"""
+        self.server.statuses = {'/a': [503, 503, 503], '/b': [400],
+                                '/c': [None]}
+        uploader = Uploader(retries=2, backoff=1)
+        uploader.post(self.base + '/a', {})
+        self.assertEqual(self.paths_requested(), ['/a'] * 3)
+        self.assertEqual([call[0][0] for call in sleep.call_args_list],
+                         [1, 2])
+
+        del self.server.requests[:]
+        uploader.post(self.base + '/b', {})
+        self.assertEqual(self.paths_requested(), ['/b'])
+
+        # the dropped connection is retried
+        del self.server.requests[:]
+        uploader.post(self.base + '/c', {})
+        self.assertEqual(self.paths_requested(), ['/c'] * 2)
+
+        summary = uploader.finish()
+        self.assertEqual(summary['documents'], 1)
+        self.assertEqual(summary['failures'], [
+            (self.base + '/a', 'HTTP 503'), (self.base + '/b', 'HTTP 400')])
+        self.assertEqual(count.call_args_list,
+                         [(('http.requests',),)] * (3 + 1 + 2))
+
+    def test_post_concurrent(self):
+        """With multiple threads, all documents are sent by the time
+        `finish` returns"""
+        uploader = Uploader(threads=4)
+        for idx in range(20):
+            uploader.post('{}/{}'.format(self.base, idx), {'idx': idx})
+        summary = uploader.finish()
+
+        self.assertEqual(summary['documents'], 20)
+        self.assertEqual(sorted(self.paths_requested()),
+                         sorted('/{}'.format(idx) for idx in range(20)))
+
+    @patch('regparser.api_writer.gzip_compress')
+    def test_post_unexpected_error(self, gzip_compress):
+        """Unexpected errors in a worker thread are reported as failures
+        rather than lost"""
+        gzip_compress.side_effect = [ValueError('oops'), 'compressed']
+        uploader = Uploader(threads=2, compress=True)
+        uploader.post(self.base + '/a', {})
+        uploader.post(self.base + '/b', {})
+        summary = uploader.finish()
+
+        self.assertEqual(summary['documents'], 1)
+        self.assertEqual(len(summary['failures']), 1)
+        self.assertIn('oops', summary['failures'][0][1])
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'out', 'export.ndjson.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        """Documents and a manifest are written in a single file"""
+        archive = Archive(self.path)
+        ArchiveWriteContent(self.path, 'regulation', '1000', 'v1',
+                            archive=archive).write(Node('Content'))
+        ArchiveWriteContent(self.path, 'layer', 'terms', 'cfr', 'v1/1000',
+                            archive=archive).write({'a': 1})
+        ArchiveWriteContent(self.path, 'layer', 'meta', 'cfr', 'v1/1000',
+                            archive=archive).write({'b': 2})
+        self.assertFalse(os.path.exists(self.path))
+        summary = archive.finish()
+
+        self.assertEqual(summary['documents'], 3)
+        self.assertEqual(summary['failures'], [])
+        records = list(read_archive(self.path))
+        self.assertEqual([path for path, _ in records],
+                         ['regulation/1000/v1', 'layer/terms/cfr/v1/1000',
+                          'layer/meta/cfr/v1/1000'])
+        self.assertEqual(records[0][1]['text'], 'Content')
+        self.assertEqual(records[2][1], {'b': 2})
+
+        with gzip.open(self.path) as f:
+            manifest = json.loads(f.readlines()[-1])['manifest']
+        self.assertEqual(manifest['counts'], {'regulation': 1, 'layer': 2})
+
+    def test_incomplete(self):
+        """Archives without a matching manifest are rejected"""
+        path = os.path.join(self.tmpdir, 'partial.ndjson.gz')
+        with gzip.open(path, 'wb') as f:
+            f.write('{"path": "notice/1", "data": {}}\n')
+        with self.assertRaises(ValueError):
+            list(read_archive(path))
+
+    def test_write_failure(self):
+        """A failed write closes and removes the temporary file"""
+        archive = Archive(self.path)
+        archive.write('notice/1', {})
+        with self.assertRaises(TypeError):
+            archive.write('notice/2', {'unserializable': object()})
+        self.assertTrue(archive._file.closed)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+
+    def test_lazy(self):
+        """Nothing is created until the first write, so a client which
+        fails before writing leaves nothing behind"""
+        client = Client(self.path)
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+        client.abort()
+        self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+
+    def test_finish_empty(self):
+        """An archive with no documents still has a manifest"""
+        summary = Archive(self.path).finish()
+        self.assertEqual(summary['documents'], 0)
+        self.assertEqual(list(read_archive(self.path)), [])
+
+    def test_abort(self):
+        archive = Archive(self.path)
+        ArchiveWriteContent(self.path, 'notice', '1',
+                            archive=archive).write({})
+        archive.abort()
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
 
 
 class GitWriteContentTest(TestCase):
@@ -266,3 +447,19 @@ class ClientTest(TestCase):
         client = Client()
         self.assertEqual('http://example.com/', client.base)
         self.assertEqual(APIWriteContent, client.writer_class)
+
+    def test_writer_class_archive(self):
+        """Uses ArchiveWriteContent if the base ends in .ndjson.gz"""
+        path = os.path.join(self.tmpdir, 'export.ndjson.gz')
+        client = Client(path)
+        self.assertEqual(ArchiveWriteContent, client.writer_class)
+        client.notice('docdoc').write({'some': 'notice'})
+        self.assertEqual(client.finish()['documents'], 1)
+        self.assertEqual(list(read_archive(path)),
+                         [('notice/docdoc', {'some': 'notice'})])
+
+    def test_finish(self):
+        """Only API clients have an upload summary"""
+        self.assertIsNone(Client('/path/to/somewhere').finish())
+        summary = Client('http://example.com', threads=2).finish()
+        self.assertEqual(summary['documents'], 0)
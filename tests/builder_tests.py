@@ -1,10 +1,12 @@
 import os.path
+import shutil
 import tempfile
 from unittest import TestCase
 
 from lxml import etree
 from mock import patch
 
+from regparser.api_writer import read_archive
 from regparser.builder import (
     Builder, Checkpointer, NullCheckpointer)
 from regparser.tree.struct import Node
@@ -106,6 +108,25 @@ class BuilderTests(TestCase):
         self.assertEqual(cccc['document_number'],
                          merge_changes.call_args[0][0])
 
+    @patch.object(Builder, '__init__')
+    def test_write_notices(self, init):
+        """Notices are written (minus their meta data) and the writer is
+        finished, so archives are moved into place"""
+        init.return_value = None
+        b = Builder()   # Don't need parameters as init's been mocked out
+        b.notices = [{'document_number': 'aaaa', 'meta': {}},
+                     {'document_number': 'bbbb'}]
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'notices.ndjson.gz')
+        with patch.multiple('settings', API_BASE='', OUTPUT_DIR=path):
+            summary = b.write_notices()
+
+        self.assertEqual(summary['documents'], 2)
+        self.assertEqual(list(read_archive(path)), [
+            ('notice/aaaa', {'document_number': 'aaaa'}),
+            ('notice/bbbb', {'document_number': 'bbbb'})])
+
 
 class CheckpointerTests(TestCase):
     def test_basic_serialization(self):
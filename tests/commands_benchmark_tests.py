@@ -0,0 +1,209 @@
+from datetime import date
+import json
+from unittest import TestCase
+
+from click.testing import CliRunner
+from lxml import etree
+from mock import patch
+
+from regparser.commands.benchmark import benchmark, deep_size
+from regparser.history.versions import Version
+from regparser.index import entry
+from regparser.layer import graphics
+from regparser.test_utils import synthetic
+from regparser.tree.struct import Node
+from tests import reference
+
+
+class CommandsBenchmarkTests(TestCase):
+    def setUp(self):
+        self.cli = CliRunner()
+
+    def test_diffs(self):
+        """Should report timings for both implementations"""
+        with self.cli.isolated_filesystem():
+            tree_dir = entry.Tree('12', '1000')
+            (tree_dir / 'v1').write(Node('V1', label=['1000'], children=[
+                Node('a', label=['1000', '1'])]))
+            (tree_dir / 'v2').write(Node('V2', label=['1000'], children=[
+                Node('b', label=['1000', '2'])]))
+            result = self.cli.invoke(benchmark,
+                                     ['diffs', '12', '1000', '--repeat', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('(1 pairs)', result.output)
+            self.assertIn('reference', result.output)
+
+            result = self.cli.invoke(benchmark, ['diffs', '12', '1000',
+                                                 '--all-pairs'])
+            self.assertIn('(4 pairs)', result.output)
+
+    def test_diffs_no_trees(self):
+        with self.cli.isolated_filesystem():
+            result = self.cli.invoke(benchmark, ['diffs', '12', '1000'])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_memory(self):
+        """Should report the size of each representation"""
+        with self.cli.isolated_filesystem():
+            entry.Tree('12', '1000', 'v1').write(
+                Node('Root', label=['1000'], children=[
+                    Node('a', label=['1000', '1']),
+                    Node('b', label=['1000', '2'])]))
+            result = self.cli.invoke(benchmark, ['memory', '12', '1000'])
+            self.assertEqual(result.exit_code, 0)
+            for representation in ('reference.Node', 'Node', 'FrozenNode'):
+                self.assertIn('{}: 3 nodes'.format(representation),
+                              result.output)
+
+    def test_depths(self):
+        """Should derive depths for each section's markers"""
+        with self.cli.isolated_filesystem():
+            section = Node(label=['1000', '1'], children=[
+                Node(label=['1000', '1', 'a'], children=[
+                    Node(label=['1000', '1', 'a', '1']),
+                    Node(label=['1000', '1', 'a', '2'])]),
+                Node(label=['1000', '1', 'b'])])
+            entry.Tree('12', '1000', 'v1').write(
+                Node(label=['1000'], children=[section]))
+            entry.Tree('12', '1000', 'v2').write(
+                Node(label=['1000'], children=[section]))
+            result = self.cli.invoke(benchmark,
+                                     ['depths', '12', '1000', '--repeat', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('(2 marker lists)', result.output)
+            self.assertIn('1 hits, 1 misses', result.output)
+
+    def test_compile(self):
+        """Should compile each tree which has a preceding tree and rule, in
+        both modes"""
+        with self.cli.isolated_filesystem():
+            version_dir = entry.Version('12', '1000')
+            for idx, version_id in enumerate(['v1', 'v2', 'v3']):
+                (version_dir / version_id).write(
+                    Version(version_id, date(2001, 1, idx + 1),
+                            date(2001, 1, idx + 1)))
+            entry.Tree('12', '1000', 'v1').write(
+                Node('V1', label=['1000'], children=[
+                    Node('a', label=['1000', '1'])]))
+            entry.RuleChanges('v2').write({'changes': {'1000-1': [{
+                'action': 'PUT', 'field': '[text]',
+                'node': {'text': 'b', 'label': ['1000', '1'],
+                         'node_type': 'regtext'}}]}})
+            result = self.cli.invoke(
+                benchmark, ['compile', '12', '1000', '--repeat', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('copying (1 rules, 1 labels)', result.output)
+            self.assertIn('sharing (1 rules, 1 labels)', result.output)
+
+            result = self.cli.invoke(benchmark, ['compile', '12', '1001'])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_traversal(self):
+        with self.cli.isolated_filesystem():
+            entry.Tree('12', '1000', 'v1').write(
+                Node('Root', label=['1000'], children=[
+                    Node('a', label=['1000', '1'], children=[
+                        Node('b', label=['1000', '1', 'a'])])]))
+            result = self.cli.invoke(benchmark, ['traversal', '12', '1000',
+                                                 '--repeat', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('tree.struct.walk (3 nodes)', result.output)
+            self.assertIn('tree.struct.join_text', result.output)
+
+    def test_treeify(self):
+        """Should double the number of nodes until reaching the whole tree"""
+        with self.cli.isolated_filesystem():
+            entry.Tree('12', '1000', 'v1').write(
+                Node('Root', label=['1000'], children=[
+                    Node('a', label=['1000', '1'], children=[
+                        Node('b', label=['1000', '1', 'a']),
+                        Node('c', label=['1000', '1', 'b'])]),
+                    Node('d', label=['1000', '2'])]))
+            result = self.cli.invoke(benchmark, ['treeify', '12', '1000',
+                                                 '--repeat', '1'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('tree.struct.treeify (2 nodes)', result.output)
+            self.assertIn('tree.struct.treeify (4 nodes)', result.output)
+            self.assertIn('tree.struct.merge_duplicates (4 nodes)',
+                          result.output)
+            self.assertNotIn('(8 nodes)', result.output)
+
+    def test_deep_size(self):
+        """Compact nodes take less memory than the original representation"""
+        def tree(node_class):
+            return node_class('Root', label=['1000'], children=[
+                node_class('Paragraph {}'.format(idx), label=['1000', '1', c])
+                for idx, c in enumerate('abcdefgh')])
+
+        compact_size, compact_nodes = deep_size([tree(Node)], (Node,))
+        original_size, original_nodes = deep_size([tree(reference.Node)],
+                                                  (reference.Node,))
+        self.assertEqual(compact_nodes, 9)
+        self.assertEqual(original_nodes, 9)
+        self.assertLess(compact_size, original_size)
+
+    def test_suite(self):
+        """Should time each stage, saving and comparing against a
+        baseline"""
+        args = ['suite', '--sections', '3', '--depth', '2', '--interps', '1',
+                '--appendices', '1', '--amendments', '3', '--repeat', '1',
+                '--baseline', 'baseline.json']
+        with self.cli.isolated_filesystem():
+            result = self.cli.invoke(benchmark, args + ['--save-baseline'])
+            self.assertEqual(result.exit_code, 0)
+            for stage in ('startup', 'preprocess', 'build_tree',
+                          'derive_depths', 'layers.terms',
+                          'compile_regulation.copying', 'compile_regulation',
+                          'changes_between'):
+                self.assertIn(stage + ': ', result.output)
+
+            result = self.cli.invoke(benchmark, args + ['--threshold', '100'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('baseline', result.output)
+
+            with open('baseline.json') as f:
+                stored = json.load(f)
+            stored['stages']['build_tree']['seconds'] = 0
+            with open('baseline.json', 'w') as f:
+                json.dump(stored, f)
+            result = self.cli.invoke(benchmark, args)
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('build_tree', result.output.splitlines()[-1])
+
+            result = self.cli.invoke(benchmark, args + ['--seed', '1'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn('different parameters', result.output)
+
+    def test_suite_fixtures(self):
+        """The checked-in regulation XML should make it through each
+        stage"""
+        with self.cli.isolated_filesystem():
+            result = self.cli.invoke(benchmark, [
+                'suite', '--fixtures', '--amendments', '5', '--repeat', '1',
+                '--baseline', 'baseline.json', '--save-baseline'])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('changes_between: ', result.output)
+            with open('baseline.json') as f:
+                params = json.load(f)['params']
+        self.assertEqual(params['fixtures'], ['1005.xml', '1026.xml'])
+        self.assertNotIn('sections', params)
+
+    @patch('regparser.layer.graphics.check_url')
+    def test_suite_offline(self, check_url):
+        """Images in the provided XML aren't looked up on the image server"""
+        check_url.side_effect = AssertionError("Touched the network")
+        xml = synthetic.regulation_xml(sections=2, depth=1, breadth=1,
+                                       interps=0, appendices=1)
+        appendix = xml.xpath('//APPENDIX')[0]
+        appendix.append(etree.fromstring('<GPH><GID>ER01JA01.000</GID></GPH>'))
+        resolve_gid = graphics.resolve_gid
+        with self.cli.isolated_filesystem():
+            with open('reg.xml', 'w') as f:
+                f.write(etree.tostring(xml))
+            result = self.cli.invoke(benchmark, [
+                'suite', '--xml', 'reg.xml', '--amendments', '1',
+                '--repeat', '1'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('layers.graphics', result.output)
+        self.assertFalse(check_url.called)
+        self.assertIs(graphics.resolve_gid, resolve_gid)
@@ -4,7 +4,9 @@ from unittest import TestCase
 from click.testing import CliRunner
 
 from regparser.commands.clear import clear
+from regparser.fetch import Fetcher
 from regparser.index import entry
+import settings
 
 
 class CommandsClearTests(TestCase):
@@ -28,6 +30,19 @@ class CommandsClearTests(TestCase):
             self.cli.invoke(clear, ['--http-cache'])
             self.assertFalse(os.path.exists('fr_cache.sqlite'))
 
+    def test_deletes_http_cache(self):
+        with self.cli.isolated_filesystem():
+            fetcher = Fetcher()
+            fetcher.enable_cache()
+            fetcher.responses['key'] = {'some': 'value'}
+            self.assertTrue(os.path.exists(settings.HTTP_CACHE_DIR))
+
+            self.cli.invoke(clear)
+            self.assertTrue(os.path.exists(settings.HTTP_CACHE_DIR))
+
+            self.cli.invoke(clear, ['--http-cache'])
+            self.assertFalse(os.path.exists(settings.HTTP_CACHE_DIR))
+
     def test_deletes_index(self):
         with self.cli.isolated_filesystem():
             entry.Entry('aaa', 'bbb').write('ccc')
@@ -1,10 +1,15 @@
 from contextlib import contextmanager
+from datetime import date
 from time import time
 import os
 from unittest import TestCase
 
 from click.testing import CliRunner
+from mock import patch
+
+from regparser.commands import diffs as diffs_module
 from regparser.commands.diffs import diffs
+from regparser.history.versions import Version
 from regparser.index import entry
 from regparser.tree.struct import Node
 
@@ -51,3 +56,88 @@ class CommandsDiffsTests(TestCase):
             os.utime(str(self.tree_dir / 'v1'), (time() + 1000, time() + 1000))
             self.cli.invoke(diffs, ['12', '1000'])
             self.assert_diff_keys('v1', 'v2', ['1000'])
+
+    def test_diffs_window(self):
+        """Only pairs within the window should be computed"""
+        with self.integration_setup():
+            (self.tree_dir / 'v3').write(Node(text='V3V3V3', label=['1000']))
+            self.cli.invoke(diffs, ['12', '1000', '--window', '1'])
+            self.assert_diff_keys('v1', 'v2', ['1000'])
+            self.assert_diff_keys('v3', 'v2', ['1000'])
+            self.assertFalse((self.diff_dir / 'v1' / 'v3').exists())
+            self.assertFalse((self.diff_dir / 'v3' / 'v1').exists())
+
+    def test_diffs_workers(self):
+        """Diffs computed in a process pool should match the serial output"""
+        with self.integration_setup():
+            self.cli.invoke(diffs, ['12', '1000'])
+            serial = {(lhs, rhs): (self.diff_dir / lhs / rhs).read()
+                      for lhs in ('v1', 'v2') for rhs in ('v1', 'v2')}
+            os.utime(str(self.tree_dir / 'v1'), (time() + 1000, time() + 1000))
+            os.utime(str(self.tree_dir / 'v2'), (time() + 1000, time() + 1000))
+            result = self.cli.invoke(diffs, ['12', '1000', '--workers', '2'])
+            self.assertEqual(result.exit_code, 0)
+            for (lhs, rhs), expected in serial.items():
+                self.assertEqual((self.diff_dir / lhs / rhs).read(), expected)
+
+    def test_diffs_window_chronological(self):
+        """Windows should be measured in date order, not filename order"""
+        with self.integration_setup():
+            version_dir = entry.Version('12', '1000')
+            for idx, version_id in enumerate(
+                    ['2012-9999', '2012-10000', '2013-00001']):
+                (version_dir / version_id).write(
+                    Version(version_id, date(2012, 1, idx + 1),
+                            date(2012, 1, idx + 1)))
+                (self.tree_dir / version_id).write(
+                    Node(text=version_id, label=['1000']))
+            self.cli.invoke(diffs, ['12', '1000', '--window', '1'])
+            self.assert_diff_keys('2012-9999', '2012-10000', ['1000'])
+            self.assert_diff_keys('2012-10000', '2013-00001', ['1000'])
+            self.assertFalse(
+                (self.diff_dir / '2012-9999' / '2013-00001').exists())
+
+    def test_ordered_version_ids(self):
+        """Versions should be in date order, followed by any trees without
+        a version"""
+        with self.integration_setup():
+            version_dir = entry.Version('12', '1000')
+            (version_dir / '2012-10000').write(
+                Version('2012-10000', date(2012, 2, 2), date(2012, 2, 2)))
+            (version_dir / '2012-9999').write(
+                Version('2012-9999', date(2012, 1, 1), date(2012, 1, 1)))
+            (version_dir / 'no-tree').write(
+                Version('no-tree', date(2012, 1, 5), date(2012, 1, 5)))
+            for version_id in ('2012-10000', '2012-9999'):
+                (self.tree_dir / version_id).write(
+                    Node(text=version_id, label=['1000']))
+            self.assertEqual(
+                diffs_module.ordered_version_ids(12, 1000, self.tree_dir),
+                ['2012-9999', '2012-10000', 'v1', 'v2'])
+
+    def test_tree_cache(self):
+        """Only the most recently used trees should be retained"""
+        with self.integration_setup():
+            (self.tree_dir / 'v3').write(Node(text='V3V3V3', label=['1000']))
+            trees = diffs_module.TreeCache(entry.FrozenTree('12', '1000'), 2)
+            with patch.object(entry.FrozenTree, 'read') as read:
+                for version_id in ('v1', 'v2', 'v1', 'v3', 'v1', 'v2'):
+                    trees[version_id]
+                self.assertEqual(read.call_count, 4)
+                self.assertEqual(trees.reads, 4)
+
+    def test_schedule(self):
+        """Pairs should be grouped into blocks of versions"""
+        version_ids = ['1', '2', '3', '4']
+        pairs = diffs_module.windowed_pairs(version_ids)
+        self.assertEqual(len(pairs), 16)
+        self.assertEqual(
+            diffs_module.schedule(pairs, version_ids, cache_size=4),
+            [('1', '1'), ('1', '2'), ('2', '1'), ('2', '2'),
+             ('1', '3'), ('1', '4'), ('2', '3'), ('2', '4'),
+             ('3', '3'), ('3', '4'), ('4', '3'), ('4', '4'),
+             ('3', '1'), ('3', '2'), ('4', '1'), ('4', '2')])
+        self.assertEqual(
+            diffs_module.windowed_pairs(version_ids, window=1),
+            [('1', '1'), ('1', '2'), ('2', '1'), ('2', '2'), ('2', '3'),
+             ('3', '2'), ('3', '3'), ('3', '4'), ('4', '3'), ('4', '4')])
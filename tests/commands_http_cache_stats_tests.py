@@ -0,0 +1,21 @@
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from regparser.commands.http_cache_stats import http_cache_stats
+from regparser.fetch import Fetcher
+
+
+class CommandsHttpCacheStatsTests(TestCase):
+    def test_stats(self):
+        cli = CliRunner()
+        with cli.isolated_filesystem():
+            fetcher = Fetcher()
+            fetcher.enable_cache()
+            fetcher.responses['key'] = {'some': 'value'}
+            fetcher.blobs.write(['a' * 10, 'b' * 5])
+
+            result = cli.invoke(http_cache_stats)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn('Responses: 1 (', result.output)
+            self.assertIn('Large bodies: 1 (15 bytes)', result.output)
@@ -65,3 +65,31 @@ class CommandsLayersTests(TestCase):
 
             self.assertTrue(
                 entry.Layer.preamble('111_222', 'graphics').exists())
+
+    def test_layers_workers_match_serial(self):
+        """Building layers in a process pool should write exactly the same
+        output as building them serially"""
+        def build(workers):
+            with self.cli.isolated_filesystem():
+                for version_id in ('v1', 'v2'):
+                    entry.Version(12, 1000, version_id).write(
+                        Version(version_id, date.today(), date.today()))
+                    entry.Tree(12, 1000, version_id).write(Node(
+                        'Some text ' + version_id, label=['1000'],
+                        children=[Node('(a) More', label=['1000', '1'])]))
+                result = self.cli.invoke(
+                    layers.layers, ['--cfr_part', '1000',
+                                    '--workers', str(workers)])
+                self.assertEqual(result.exit_code, 0)
+                layer_dir = entry.Layer.cfr(12, 1000)
+                return {
+                    (version_id, layer_name): open(
+                        str(layer_dir / version_id / layer_name)).read()
+                    for version_id in layer_dir
+                    for layer_name in layer_dir / version_id}
+
+        with patch('regparser.commands.layers.ImageUrlCache') as cache:
+            serial = build(workers=1)
+            self.assertTrue(cache.return_value.evict.called)
+        self.assertEqual(len(serial), 2 * len(layers.LAYER_CLASSES['cfr']))
+        self.assertEqual(serial, build(workers=2))
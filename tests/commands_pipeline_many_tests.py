@@ -0,0 +1,145 @@
+import os
+from unittest import TestCase
+
+import click
+from click.testing import CliRunner
+from mock import patch
+
+from regparser.commands import pipeline_many
+
+
+@click.command()
+def fake_stage(**params):
+    """Records its invocation in the current directory; fails for part 2"""
+    with open('invoked', 'a') as f:
+        f.write('{} {}\n'.format(click.get_current_context().info_name,
+                                 sorted(params.items())))
+    if params.get('cfr_part') == 2 and 'output' not in params:
+        raise ValueError("Bad part")
+
+
+def fake_commands():
+    commands = {}
+    for name in pipeline_many.COMMANDS:
+        command = click.Command(name, callback=fake_stage.callback)
+        commands[name] = command
+    return commands
+
+
+class CommandsPipelineManyTests(TestCase):
+    def test_parse_part(self):
+        self.assertEqual(pipeline_many.parse_part('12:1026'), (12, 1026))
+        self.assertEqual(pipeline_many.parse_part(' 12 1026\n'), (12, 1026))
+        for text in ('1026', '12:10:26', 'a:b'):
+            with self.assertRaises(click.BadParameter):
+                pipeline_many.parse_part(text)
+
+    def test_build_tasks(self):
+        tasks = pipeline_many.build_tasks([(12, 1000), (12, 2000)], False)
+        self.assertEqual(tasks[pipeline_many.SYNC], set())
+        self.assertEqual(tasks[((12, 1000), 'versions')],
+                         set([pipeline_many.SYNC]))
+        self.assertEqual(tasks[((12, 2000), 'write_to')], set([
+            ((12, 2000), 'layers'), ((12, 2000), 'sxs_layers'),
+            ((12, 2000), 'diffs')]))
+        self.assertEqual(len(tasks), 1 + 2 * len(pipeline_many.FULL_STAGES))
+
+        tasks = pipeline_many.build_tasks([(12, 1000)], True)
+        self.assertEqual(tasks[((12, 1000), 'current_version')],
+                         set([pipeline_many.SYNC]))
+        self.assertNotIn(((12, 1000), 'versions'), tasks)
+
+    def test_build_tasks_sxs_after_trees(self):
+        """sxs_layers covers every tree, so must follow all of the stages
+        which write trees"""
+        def ancestors(tasks, task):
+            found, to_visit = set(), list(tasks[task])
+            while to_visit:
+                dep = to_visit.pop()
+                if dep not in found:
+                    found.add(dep)
+                    to_visit.extend(tasks[dep])
+            return set(stage for _, stage in found)
+
+        part = (12, 1000)
+        tasks = pipeline_many.build_tasks([part], False)
+        self.assertTrue(ancestors(tasks, (part, 'sxs_layers')).issuperset(
+            ['versions', 'annual_editions', 'fill_with_rules']))
+        tasks = pipeline_many.build_tasks([part], True)
+        self.assertIn('current_version',
+                      ancestors(tasks, (part, 'sxs_layers')))
+
+    def test_run_dag_order_and_failures(self):
+        """Tasks should run after their dependencies. Failures skip the
+        tasks which depend on them, but nothing else"""
+        deps = {'a': '', 'b': 'a', 'c': 'a', 'd': 'bc', 'e': 'd', 'f': ''}
+        tasks = {('p', stage): set(('p', dep) for dep in stage_deps)
+                 for stage, stage_deps in deps.items()}
+        run_order = []
+
+        def run_task(stage):
+            run_order.append(stage)
+            return 1, ('Broken' if stage == 'c' else None)
+
+        with patch.object(pipeline_many, 'run_task', run_task):
+            results = pipeline_many.run_dag(tasks, lambda task: task[1])
+        self.assertEqual(sorted(run_order), ['a', 'b', 'c', 'f'])
+        self.assertLess(run_order.index('a'), run_order.index('b'))
+        self.assertEqual(results[('p', 'c')], (1, 'Broken'))
+        self.assertEqual(results[('p', 'd')][1], 'Skipped; c failed')
+        self.assertEqual(results[('p', 'e')][1], 'Skipped; d failed')
+        self.assertEqual(results[('p', 'f')], (1, None))
+
+    def test_run_dag_worker_dies(self):
+        """If a worker process dies, its task should fail promptly, without
+        holding up the others"""
+        tasks = {('p', 'a'): set(), ('p', 'dies'): set(),
+                 ('p', 'b'): set([('p', 'dies')]),
+                 ('p', 'c'): set([('p', 'a')])}
+
+        def run_task(stage):
+            if stage == 'dies':
+                os._exit(1)
+            return 1, None
+
+        with patch.object(pipeline_many, 'run_task', run_task):
+            results = pipeline_many.run_dag(tasks, lambda task: task[1],
+                                            workers=2)
+        self.assertEqual(results[('p', 'dies')][1], 'Worker process died')
+        self.assertEqual(results[('p', 'b')][1], 'Skipped; dies failed')
+        self.assertEqual(results[('p', 'a')], (1, None))
+        self.assertEqual(results[('p', 'c')], (1, None))
+
+    def test_pipeline_many(self):
+        """Every stage of every part should be invoked, in worker
+        processes. Failures are reported without stopping other parts"""
+        cli = CliRunner()
+        with cli.isolated_filesystem():
+            with open('parts.txt', 'w') as f:
+                f.write('# A comment\n12 1\n\n12:1\n')
+            with patch.dict(pipeline_many.COMMANDS, fake_commands()):
+                result = cli.invoke(pipeline_many.pipeline_many, [
+                    'some/output', '12:2', '--parts-file', 'parts.txt',
+                    '--workers', '2', '--xml-ttl', '10'])
+            with open('invoked') as f:
+                invoked = f.read().splitlines()
+
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('1 of 2 parts failed', result.output)
+        self.assertIn('12 CFR 1: ok', result.output)
+        self.assertIn('12 CFR 2: failed', result.output)
+        self.assertIn('versions: ValueError: Bad part', result.output)
+        self.assertIn('write_to: Skipped;', result.output)
+
+        self.assertEqual(invoked.count("sync_xml [('xml_ttl', 10)]"), 1)
+        part_one = [line for line in invoked if "('cfr_part', 1)" in line]
+        self.assertEqual(len(part_one), len(pipeline_many.FULL_STAGES))
+        self.assertTrue(any(line.startswith('write_to') and
+                            'some/output' in line for line in part_one))
+        self.assertEqual(
+            len([line for line in invoked if "('cfr_part', 2)" in line]), 1)
+
+    def test_pipeline_many_no_parts(self):
+        result = CliRunner().invoke(pipeline_many.pipeline_many, ['out'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('No parts provided', result.output)
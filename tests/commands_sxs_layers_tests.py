@@ -2,6 +2,7 @@ from datetime import date
 from unittest import TestCase
 
 from click.testing import CliRunner
+from mock import patch
 
 from regparser.commands import sxs_layers
 from regparser.history.versions import Version
@@ -51,3 +52,16 @@ class CommandsSxSLayersTests(TestCase):
 
             entry.Entry('tree', 11, 222, 'aaa').write('')
             self.assertTrue(sxs_layers.is_stale(11, 222, 'aaa'))
+
+    @patch('regparser.commands.sxs_layers.federalregister.meta_data_many')
+    def test_prefetch_meta_data(self, meta_data_many):
+        """Meta data for versions without SxS is requested in one go"""
+        with CliRunner().isolated_filesystem():
+            sxs_layers.prefetch_meta_data(11, 222)
+            self.assertFalse(meta_data_many.called)
+
+            self.create_versions()
+            entry.Entry('sxs', 'bbb').write('')
+            sxs_layers.prefetch_meta_data(11, 222)
+            doc_numbers, _ = meta_data_many.call_args[0]
+            self.assertEqual(doc_numbers, ['aaa', 'ccc'])
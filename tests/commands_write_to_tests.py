@@ -5,7 +5,9 @@ import shutil
 from unittest import TestCase
 
 from click.testing import CliRunner
+from mock import patch
 
+from regparser.api_writer import read_archive
 from regparser.commands.write_to import write_to
 from regparser.index import entry
 from regparser.tree.struct import Node
@@ -138,3 +140,27 @@ class CommandsWriteToTests(TestCase):
             self.assert_file_exists('diff', '1000', 'v3', 'v1')
             self.assert_file_exists('notice', 'v0')
             self.assert_file_exists('notice', 'v1')
+
+    def test_archive(self):
+        """Integration test that all local files are written to an archive"""
+        with self.integration() as cli:
+            path = os.path.join(self.tmpdir, 'export.ndjson.gz')
+            result = cli.invoke(write_to, [path])
+            self.assertEqual(result.exit_code, 0)
+
+            paths = [doc_path for doc_path, _ in read_archive(path)]
+            self.assertIn('regulation/1000/v5', paths)
+            self.assertIn('layer/layer5/preamble/555_55', paths)
+            self.assertIn('diff/1000/v3/v1', paths)
+            self.assertIn('notice/v0', paths)
+
+    @patch('regparser.commands.write_to.write_notices')
+    def test_archive_failure(self, write_notices):
+        """If the export fails part way through, no archive (complete or
+        otherwise) is left behind"""
+        write_notices.side_effect = IOError
+        with self.integration() as cli:
+            path = os.path.join(self.tmpdir, 'export.ndjson.gz')
+            result = cli.invoke(write_to, [path])
+            self.assertIsInstance(result.exception, IOError)
+            self.assertEqual(os.listdir(self.tmpdir), [])
@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+from mock import Mock, patch
+
 from regparser.diff import text as difftext
 
 
@@ -62,3 +64,54 @@ class DiffTextTests(TestCase):
         self.assertEqual(
             ['This', '\n', 'is', '\t\t', 'a', ' ', 'test', '\n\t', 'pattern'],
             words)
+
+    def apply_opcodes(self, text, opcodes):
+        """Convert the char-based opcodes back into the new text"""
+        flattened = []
+        for op in opcodes:
+            flattened.extend(op if isinstance(op, list) else [op])
+        result, position = '', 0
+        for op in flattened:
+            result += text[position:op[1]]    # empty after a delete
+            if op[0] == 'delete':
+                position = op[2]
+            else:
+                result += op[2]
+                position = max(position, op[1])
+        return result + text[position:]
+
+    def test_matchers_round_trip(self):
+        """Both matchers should produce opcodes which convert old to new"""
+        old = ("The first paragraph of a table, with (a) many words and "
+               "(b) many repeated words: the the the the end")
+        pairs = [
+            (old, old.replace('first', 'second')),
+            (old, old.replace('the the', 'a a a') + ' Appended.'),
+            (old, 'Completely different'),
+            (old, ''),
+            ('', old),
+            (old, ' '.join(reversed(old.split(' ')))),
+        ]
+        for matcher in difftext.MATCHERS.values():
+            for lhs, rhs in pairs:
+                codes = difftext.get_opcodes(lhs, rhs, matcher=matcher)
+                self.assertEqual(rhs, self.apply_opcodes(lhs, codes))
+
+    def test_patience_anchors(self):
+        """Unique words should anchor the patience diff, even when difflib
+        would prefer matching repeated words"""
+        old, new = ['b', 'x', 'x', 'c'], ['x', 'b', 'c', 'x']
+        self.assertEqual(difftext.patience_opcodes(old, new),
+                         [('insert', 0, 0, 0, 1),
+                          ('equal', 0, 1, 1, 2),    # b
+                          ('delete', 1, 3, 2, 2),
+                          ('equal', 3, 4, 2, 3),    # c
+                          ('insert', 4, 4, 3, 4)])
+
+    def test_matcher_setting(self):
+        """The configured matcher should be used by default"""
+        with patch.object(difftext.settings, 'DIFF_TEXT_MATCHER', 'patience'):
+            with patch.dict(difftext.MATCHERS, {'patience': Mock()}):
+                difftext.MATCHERS['patience'].return_value = []
+                difftext.get_opcodes('a', 'b')
+                self.assertTrue(difftext.MATCHERS['patience'].called)
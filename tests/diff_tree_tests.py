@@ -1,9 +1,11 @@
 # vim: set encoding=utf-8
+from random import Random
 from unittest import TestCase
 
 from regparser.tree import reg_text
 from regparser.tree.struct import FrozenNode
 from regparser.diff import tree as difftree
+from tests import reference
 
 
 class DiffTreeTest(TestCase):
@@ -98,3 +100,35 @@ class DiffTreeTest(TestCase):
              'text': [('insert', len("Root"), " modified")],
              'child_ops': [('equal', 0, 1),   # 1111-a
                            ('delete', 1, 2)]})
+
+    def test_matches_reference(self):
+        """The optimized implementation should produce exactly the same
+        changes (in the same order) as the reference implementation"""
+        rng = Random(1234)
+
+        def random_tree(label, depth):
+            children = []
+            if depth:
+                for idx in range(rng.randint(0, 6)):
+                    children.append(random_tree(
+                        label + [str(idx)], depth - 1))
+            return FrozenNode(rng.choice(['a b c', 'a b d', 'x']),
+                              label=label, children=children)
+
+        def mutate(node):
+            children = [mutate(c) for c in node.children
+                        if rng.random() > 0.1]
+            if rng.random() < 0.2:
+                children.reverse()
+            if rng.random() < 0.1:
+                children.append(random_tree(list(node.label) + ['new'], 1))
+            text = node.text if rng.random() > 0.2 else node.text + ' e'
+            return node.clone(children=children, text=text)
+
+        for _ in range(20):
+            lhs = random_tree(['1000'], 4)
+            rhs = mutate(lhs)
+            self.assertEqual(difftree.changes_between(lhs, rhs),
+                             reference.changes_between(lhs, rhs))
+            self.assertEqual(difftree.changes_between(rhs, lhs),
+                             reference.changes_between(rhs, lhs))
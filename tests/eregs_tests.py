@@ -0,0 +1,63 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+import eregs
+from regparser.commands.dependency_resolver import resolvers_for
+from regparser.index import entry
+
+
+class LazyGroupTests(TestCase):
+    def test_list_commands(self):
+        """Only modules defining a command of the same name are listed"""
+        names = eregs.cli.list_commands(None)
+        self.assertIn('clear', names)
+        self.assertIn('benchmark', names)
+        self.assertNotIn('dependency_resolver', names)
+        self.assertNotIn('utils', names)
+
+    def test_get_command(self):
+        command = eregs.cli.get_command(None, 'diffs')
+        self.assertEqual(command.name, 'diffs')
+        self.assertIs(eregs.cli.get_command(None, 'diffs'), command)
+        self.assertIsNone(eregs.cli.get_command(None, 'utils'))
+        self.assertIsNone(eregs.cli.get_command(None, 'nonexistent'))
+
+    def test_help(self):
+        """Help text matches the commands' own"""
+        result = CliRunner().invoke(eregs.cli, ['--help'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('clear', result.output)
+        self.assertIn(eregs.cli.get_command(None, 'clear').short_help,
+                      result.output)
+
+    def test_import_is_light(self):
+        """Importing the entry point shouldn't load the commands or their
+        dependencies"""
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, eregs; print("\\n".join(sys.modules))']).split()
+        self.assertNotIn('regparser.commands.pipeline', modules)
+        self.assertNotIn('regparser.grammar.amdpar', modules)
+        self.assertNotIn('lxml', modules)
+        self.assertNotIn('git', modules)
+
+    def test_amendment_grammar_is_deferred(self):
+        """Commands which could parse amendments (but haven't) shouldn't
+        have built the amendment grammar"""
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, eregs; eregs.cli.get_command(None, "versions"); '
+            'print("\\n".join(sys.modules))']).split()
+        self.assertIn('regparser.notice.changes', modules)
+        self.assertNotIn('regparser.grammar.amdpar', modules)
+
+    def test_resolvers_for(self):
+        """Resolvers are found, even if their commands haven't been
+        imported"""
+        resolvers = resolvers_for(str(entry.Annual(12, 1000, 2001)))
+        self.assertEqual([type(r).__name__ for r in resolvers],
+                         ['AnnualEditionResolver'])
+        self.assertEqual(resolvers_for('not/an/entry'), [])
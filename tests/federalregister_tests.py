@@ -1,7 +1,10 @@
+import json
 import re
+import time
 from unittest import TestCase
 
-from mock import patch
+import httpretty
+from mock import Mock, patch
 
 from regparser import federalregister
 from tests.http_mixin import HttpMixin
@@ -43,3 +46,128 @@ class FederalRegisterTest(HttpMixin, TestCase):
         """If a document isn't present, expect an exception"""
         self.expect_json_http(status=404)
         self.assertRaises(Exception, federalregister.meta_data, 'doc-num')
+
+    def expect_pages(self, pages, total_pages=True):
+        """Serve each of `pages` (lists of results) based on the `page`
+        parameter, as the API does"""
+        def callback(request, uri, headers):
+            page = int(request.querystring.get('page', ['1'])[0])
+            body = {'results': pages[page - 1]}
+            if total_pages:
+                body['total_pages'] = len(pages)
+            if page < len(pages):
+                body['next_page_url'] = (
+                    federalregister.API_BASE + 'articles?page={}'.format(
+                        page + 1))
+            return 200, headers, json.dumps(body)
+        httpretty.register_uri(httpretty.GET, re.compile('.*/articles.*'),
+                               body=callback, content_type='text/json')
+
+    def requested_pages(self):
+        return sorted(int(request.querystring.get('page', ['1'])[0])
+                      for request in httpretty.HTTPretty.latest_requests)
+
+    # httpretty isn't thread safe
+    @patch('regparser.federalregister.WORKERS', 1)
+    def test_fetch_notice_json_pages(self):
+        """All pages are fetched; results are in order"""
+        pages = [[{'document_number': str(page * 10 + idx)}
+                  for idx in range(3)] for page in range(5)]
+        self.expect_pages(pages)
+        results = federalregister.fetch_notice_json(12, 1026)
+        self.assertEqual(results, [result for page in pages
+                                   for result in page])
+        self.assertEqual(self.requested_pages(), [1, 2, 3, 4, 5])
+
+    @patch('regparser.federalregister.fetch.get')
+    def test_fetch_notice_json_concurrent(self, get):
+        """Pages after the first are requested concurrently, but results
+        remain in order"""
+        def fake_get(url, params):
+            page = params.get('page', 1)
+            time.sleep(0.01 * (10 - page))  # later pages finish first
+            response = Mock()
+            response.json.return_value = {
+                'total_pages': 10, 'results': [{'document_number': page}]}
+            return response
+        get.side_effect = fake_get
+        results = federalregister.fetch_notice_json(12, 1026)
+        self.assertEqual([r['document_number'] for r in results],
+                         range(1, 11))
+
+    def test_fetch_notice_json_next_page(self):
+        """Without a page count, we follow the next_page_urls"""
+        pages = [[{'document_number': '1'}], [{'document_number': '2'}]]
+        self.expect_pages(pages, total_pages=False)
+        results = federalregister.fetch_notice_json(12, 1026)
+        self.assertEqual(results, pages[0] + pages[1])
+        self.assertEqual(self.requested_pages(), [1, 2])
+
+    def test_fetch_notice_json_memoized(self):
+        """Identical searches are only requested once, and their results
+        serve later meta data requests"""
+        self.expect_json_http({'results': [
+            {'document_number': '111', 'effective_on': '2001-01-01',
+             'volume': 22}]})
+        first = federalregister.fetch_notice_json(12, 1026, only_final=True)
+        second = federalregister.fetch_notice_json(12, 1026, only_final=True)
+        self.assertEqual(first, second)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 1)
+
+        federalregister.fetch_notice_json(12, 1026)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 2)
+
+        self.assertEqual(
+            federalregister.meta_data('111', ['effective_on', 'volume']),
+            {'effective_on': '2001-01-01', 'volume': 22})
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 2)
+
+        federalregister.memo.clear()
+        federalregister.fetch_notice_json(12, 1026, only_final=True)
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 3)
+
+    def test_meta_data_memoized(self):
+        self.expect_json_http({'volume': 22},
+                              uri=re.compile(".*/articles/1234-56"))
+        for _ in range(2):
+            self.assertEqual(federalregister.meta_data('1234-56', ['volume']),
+                             {'volume': 22})
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 1)
+
+    @patch('regparser.federalregister.BATCH_SIZE', 2)
+    @patch('regparser.federalregister.WORKERS', 1)
+    def test_meta_data_many(self):
+        """Documents are requested in batches; those which aren't found are
+        omitted"""
+        def callback(request, uri, headers):
+            doc_nums = uri.split('/')[-1].split('?')[0].split(',')
+            results = [{'document_number': doc_num, 'volume': int(doc_num)}
+                       for doc_num in doc_nums if doc_num != '4']
+            if len(doc_nums) == 1:
+                return 200, headers, json.dumps(results[0])
+            return 200, headers, json.dumps({'results': results})
+        httpretty.register_uri(httpretty.GET, re.compile('.*/articles/.*'),
+                               body=callback, content_type='text/json')
+
+        found = federalregister.meta_data_many(
+            ['1', '2', '3', '4', '5', '1'], ['volume'])
+        self.assertEqual(found, {'1': {'volume': 1}, '2': {'volume': 2},
+                                 '3': {'volume': 3}, '5': {'volume': 5}})
+        paths = sorted(request.path.split('?')[0] for request
+                       in httpretty.HTTPretty.latest_requests)
+        self.assertEqual(paths, ['/api/v1/articles/1,2',
+                                 '/api/v1/articles/3,4',
+                                 '/api/v1/articles/5'])
+        params = httpretty.HTTPretty.latest_requests[0].querystring
+        self.assertEqual(params['fields[]'], ['document_number', 'volume'])
+
+        # Now memoized
+        self.assertEqual(federalregister.meta_data('3', ['volume']),
+                         {'volume': 3})
+        self.assertEqual(len(httpretty.HTTPretty.latest_requests), 3)
+
+    def test_meta_data_many_failure(self):
+        """Failed batches are left out"""
+        self.expect_json_http(status=500)
+        self.assertEqual(
+            federalregister.meta_data_many(['1', '2'], ['volume']), {})
@@ -0,0 +1,183 @@
+import BaseHTTPServer
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+import requests
+
+from regparser import fetch
+from tests.http_stub import StubServerMixin
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the server's `documents` (path -> (body, etag)), honoring
+    If-None-Match"""
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers))
+        if self.path not in self.server.documents:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body, etag = self.server.documents[self.path]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FetcherTests(StubServerMixin, TestCase):
+    handler_class = StubHandler
+
+    def setUp(self):
+        super(FetcherTests, self).setUp()
+        self.server.documents = {}
+        self.root = tempfile.mkdtemp()
+        self.fetcher = fetch.Fetcher()
+        self.fetcher.enable_cache(self.root)
+        ttls = patch.dict(fetch.settings.HTTP_CACHE_TTLS,
+                          {None: 60 * 60, '127.0.0.1': 60 * 60})
+        ttls.start()
+        self.addCleanup(ttls.stop)
+
+    def tearDown(self):
+        super(FetcherTests, self).tearDown()
+        shutil.rmtree(self.root)
+
+    def paths_requested(self):
+        return [path for path, _ in self.server.requests]
+
+    def test_disabled(self):
+        """Without a cache, every request hits the server"""
+        self.server.documents['/doc'] = ('<ROOT/>', '"v1"')
+        self.fetcher.disable_cache()
+        for _ in range(2):
+            self.assertEqual(self.fetcher.get(self.base + '/doc').content,
+                             '<ROOT/>')
+        self.assertEqual(self.paths_requested(), ['/doc', '/doc'])
+        self.assertEqual(self.fetcher.stats(), {'uncached': 2})
+
+    def test_fresh(self):
+        """Fresh responses are served without contacting the server"""
+        self.server.documents['/doc?a=1'] = ('<ROOT/>', '"v1"')
+        first = self.fetcher.get(self.base + '/doc', params={'a': 1})
+        second = self.fetcher.get(self.base + '/doc', params={'a': 1})
+        self.assertEqual(self.paths_requested(), ['/doc?a=1'])
+        for response in (first, second):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, '<ROOT/>')
+            self.assertEqual(response.text, u'<ROOT/>')
+            self.assertEqual(response.encoding, 'utf-8')
+            self.assertEqual(response.headers['ETag'], '"v1"')
+            self.assertNotIn('Content-Length', response.headers)
+        stats = self.fetcher.stats()
+        self.assertEqual(stats['downloaded'], 1)
+        self.assertEqual(stats['fresh'], 1)
+        self.assertEqual(stats['responses'], 1)
+        self.assertEqual(stats['blobs'], 0)
+
+        # Different parameters are a different resource
+        self.fetcher.get(self.base + '/doc', params={'a': 2})
+        self.assertEqual(self.paths_requested(), ['/doc?a=1', '/doc?a=2'])
+
+    @patch('regparser.fetch.metrics.count')
+    def test_metrics(self, count):
+        """Requests sent to the server are counted, as are the outcomes"""
+        self.server.documents['/doc'] = ('<ROOT/>', '"v1"')
+        self.fetcher.get(self.base + '/doc')
+        self.fetcher.get(self.base + '/doc')
+        self.fetcher.disable_cache()
+        self.fetcher.get(self.base + '/doc')
+        names = [call[0][0] for call in count.call_args_list]
+        self.assertEqual([name for name in names if name.startswith('http')], [
+            'http.requests', 'http.downloaded', 'http.fresh',
+            'http.uncached', 'http.requests'])
+
+    def test_revalidate(self):
+        """Once stale, responses are revalidated with a conditional GET and
+        only downloaded again if they've changed"""
+        fetch.settings.HTTP_CACHE_TTLS['127.0.0.1'] = 0
+        self.server.documents['/doc'] = ('<ROOT/>', '"v1"')
+        self.fetcher.get(self.base + '/doc')
+        response = self.fetcher.get(self.base + '/doc')
+        self.assertEqual(response.content, '<ROOT/>')
+        self.assertEqual(
+            self.server.requests[-1][1].get('If-None-Match'), '"v1"')
+        self.assertEqual(self.fetcher.stats()['revalidated'], 1)
+
+        self.server.documents['/doc'] = ('<CHANGED/>', '"v2"')
+        response = self.fetcher.get(self.base + '/doc')
+        self.assertEqual(response.content, '<CHANGED/>')
+        self.assertEqual(response.headers['ETag'], '"v2"')
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.fetcher.stats()['downloaded'], 2)
+
+    def test_errors_not_cached(self):
+        self.server.documents['/doc'] = ('<ROOT/>', '"v1"')
+        for _ in range(2):
+            response = self.fetcher.get(self.base + '/missing')
+            self.assertEqual(response.status_code, 404)
+            self.assertRaises(requests.HTTPError, response.raise_for_status)
+        self.assertEqual(self.paths_requested(), ['/missing', '/missing'])
+        self.assertEqual(self.fetcher.stats()['uncached'], 2)
+
+    def test_stale_when_unreachable(self):
+        """If the server can't be reached, stale responses are used"""
+        fetch.settings.HTTP_CACHE_TTLS['127.0.0.1'] = 0
+        self.server.documents['/doc'] = ('<ROOT/>', '"v1"')
+        self.fetcher.get(self.base + '/doc')
+        self.stop_server()
+
+        self.assertEqual(self.fetcher.get(self.base + '/doc').content,
+                         '<ROOT/>')
+        self.assertRaises(requests.ConnectionError, self.fetcher.get,
+                          self.base + '/other')
+        self.assertEqual(self.fetcher.stats()['stale'], 1)
+
+    def test_blobs(self):
+        """Large bodies are stored once per unique content and can be
+        streamed"""
+        body = '\n'.join('<P>Line {}</P>'.format(i) for i in range(10000))
+        self.assertTrue(len(body) > fetch.BLOB_THRESHOLD)
+        self.server.documents['/one'] = (body, '"one"')
+        self.server.documents['/two'] = (body, '"two"')
+        self.assertEqual(self.fetcher.get(self.base + '/one').content, body)
+        self.assertEqual(self.fetcher.get(self.base + '/two').content, body)
+
+        response = self.fetcher.get(self.base + '/one', stream=True)
+        self.assertEqual(next(response.iter_lines()), '<P>Line 0</P>')
+        response.close()
+        self.assertEqual(self.fetcher.get(self.base + '/two').content, body)
+        self.assertEqual(len(self.server.requests), 2)
+        stats = self.fetcher.stats()
+        self.assertEqual(stats['responses'], 2)
+        self.assertEqual(stats['blobs'], 1)
+        self.assertEqual(stats['blobs_bytes'], len(body))
+
+        # Missing blobs are fetched again
+        shutil.rmtree(self.fetcher.blobs.root)
+        self.assertEqual(self.fetcher.get(self.base + '/one').content, body)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertTrue(os.path.exists(self.fetcher.blobs.root))
+
+
+class TtlForTests(TestCase):
+    @patch.dict(fetch.settings.HTTP_CACHE_TTLS, {
+        None: 1, 'example.com': 2, 'sub.example.com': 3}, clear=True)
+    def test_ttl_for(self):
+        """The most specific domain wins"""
+        self.assertEqual(fetch.ttl_for('https://other.org/path'), 1)
+        self.assertEqual(fetch.ttl_for('https://example.com/path'), 2)
+        self.assertEqual(fetch.ttl_for('http://www.example.com:80/path'), 2)
+        self.assertEqual(fetch.ttl_for('https://sub.example.com/path'), 3)
+        self.assertEqual(fetch.ttl_for('https://a.sub.example.com/'), 3)
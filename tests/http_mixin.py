@@ -3,12 +3,15 @@ import re
 
 import httpretty
 
+from regparser import federalregister
+
 
 class HttpMixin(object):
     """Mixin for tests which perform mocked http interactions"""
     def setUp(self):
         super(HttpMixin, self).setUp()
         httpretty.enable()
+        federalregister.memo.clear()
 
     def tearDown(self):
         super(HttpMixin, self).tearDown()
@@ -0,0 +1,28 @@
+import BaseHTTPServer
+import threading
+
+
+class StubServerMixin(object):
+    """Mixin for tests which talk to a real HTTP server on localhost.
+    Subclasses set `handler_class`; handlers can keep state on
+    `self.server`, which starts with an empty list of `requests`"""
+    handler_class = BaseHTTPServer.BaseHTTPRequestHandler
+
+    def setUp(self):
+        super(StubServerMixin, self).setUp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                self.handler_class)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def tearDown(self):
+        super(StubServerMixin, self).tearDown()
+        self.stop_server()
+
+    def stop_server(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.server.server_close()
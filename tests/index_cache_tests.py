@@ -0,0 +1,99 @@
+import os
+from time import time
+from unittest import TestCase
+
+from click.testing import CliRunner
+from mock import patch
+
+from regparser.index.cache import digest, DiskCache
+
+
+class DiskCacheTests(TestCase):
+    def test_round_trip(self):
+        """Values should be persisted between instances; misses raise a
+        KeyError. Both are counted"""
+        with CliRunner().isolated_filesystem():
+            cache = DiskCache('testing')
+            key = digest(u'some', 'key')
+            self.assertRaises(KeyError, cache.__getitem__, key)
+            cache[key] = [{'a': 1}, None]
+
+            cache = DiskCache('testing')
+            self.assertEqual(cache[key], [{'a': 1}, None])
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+            self.assertRaises(KeyError, cache.__getitem__, digest('other'))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_digest(self):
+        """Parts are delimited, so different splits produce different keys"""
+        self.assertNotEqual(digest('ab', 'c'), digest('a', 'bc'))
+        self.assertEqual(digest(u'ab'), digest('ab'))
+
+    def test_evict(self):
+        """The least recently used entries should be removed first"""
+        with CliRunner().isolated_filesystem():
+            cache = DiskCache('testing', max_bytes=25)
+            keys = [digest(str(i)) for i in range(5)]
+            for idx, key in enumerate(keys):
+                cache[key] = 'value'   # 7 bytes each
+                os.utime(cache._path(key), (idx, idx))
+            cache[keys[0]]  # touched; now most recent
+            self.assertEqual(cache.evict(), 2)
+            for key in (keys[0], keys[3], keys[4]):
+                self.assertEqual(cache[key], 'value')
+            for key in (keys[1], keys[2]):
+                self.assertRaises(KeyError, cache.__getitem__, key)
+
+    def test_evict_concurrent_removal(self):
+        """Entries removed by another process mid-walk should be skipped"""
+        with CliRunner().isolated_filesystem():
+            cache = DiskCache('testing', max_bytes=7)
+            keys = [digest(str(i)) for i in range(4)]
+            for idx, key in enumerate(keys):
+                cache[key] = 'value'   # 7 bytes each
+                os.utime(cache._path(key), (idx, idx))
+            real_stat, real_remove = os.stat, os.remove
+
+            def stat(path):
+                if path == cache._path(keys[1]):
+                    real_remove(path)
+                return real_stat(path)
+
+            def remove(path):
+                if path == cache._path(keys[0]):
+                    real_remove(path)
+                real_remove(path)
+
+            with patch('os.stat', stat), patch('os.remove', remove):
+                self.assertEqual(cache.evict(), 1)
+            for key in keys[:3]:
+                self.assertRaises(KeyError, cache.__getitem__, key)
+            self.assertEqual(cache[keys[3]], 'value')
+
+    def test_get_concurrent_removal(self):
+        """An entry evicted just after being read is still a hit"""
+        with CliRunner().isolated_filesystem():
+            cache = DiskCache('testing')
+            key = digest('key')
+            cache[key] = 'value'
+            with patch('os.utime', side_effect=OSError):
+                self.assertEqual(cache[key], 'value')
+            self.assertEqual(cache.hits, 1)
+
+    def test_evict_skips_temp_files(self):
+        """Values still being written shouldn't be evicted, though abandoned
+        ones should"""
+        with CliRunner().isolated_filesystem():
+            cache = DiskCache('testing', max_bytes=1)
+            dirname = os.path.dirname(cache._path(digest('key')))
+            os.makedirs(dirname)
+            in_flight = os.path.join(dirname, DiskCache.TMP_PREFIX + 'a')
+            abandoned = os.path.join(dirname, DiskCache.TMP_PREFIX + 'b')
+            for path in (in_flight, abandoned):
+                with open(path, 'w') as f:
+                    f.write('partial')
+            old = time() - DiskCache.TMP_MAX_AGE - 1
+            os.utime(abandoned, (old, old))
+            self.assertEqual(cache.evict(), 1)
+            self.assertTrue(os.path.exists(in_flight))
+            self.assertFalse(os.path.exists(abandoned))
@@ -4,6 +4,8 @@ from time import time
 from unittest import TestCase
 
 from click.testing import CliRunner
+from mock import patch
+import networkx
 
 from regparser.index import dependency, entry
 
@@ -31,6 +33,14 @@ class DependencyGraphTests(TestCase):
             # shouldn't raise an exception; all dependencies are up to date
             dgraph.validate_for(self.depender)
 
+    def test_unknown_entries_are_not_stale(self):
+        """Entries with no recorded dependencies aren't stale, whether or not
+        they exist"""
+        with self.dependency_graph() as dgraph:
+            self.assertFalse(dgraph.is_stale(self.depender))
+            self.dependency.write('value')
+            self.assertFalse(dgraph.is_stale(self.dependency))
+
     def test_nonexistant_deps_are_stale(self):
         """If a dependency is not present, we're stale"""
         with self.dependency_graph() as dgraph:
@@ -124,3 +134,45 @@ class DependencyGraphTests(TestCase):
             self._touch(c, 3000)
             # C and D have been updated, but C's been updated after D
             self.assert_rebuilt_state(graph, path, a='', b='', c='', d='c')
+
+    def test_batch(self):
+        """Edges added in a batch should be visible to other instances once
+        the batch completes"""
+        with self.dependency_graph() as dgraph:
+            with dgraph.batch():
+                dgraph.add(self.depender, self.dependency / '1')
+                dgraph.add(self.depender, self.dependency / '2')
+                dgraph.add(self.depender, self.dependency / '1')
+                self.assertEqual(
+                    dgraph.dependencies(self.depender),
+                    [str(self.dependency / 1), str(self.dependency / 2)])
+            self.assertEqual(
+                dependency.Graph().dependencies(self.depender),
+                [str(self.dependency / 1), str(self.dependency / 2)])
+
+    def test_staleness_is_lazy(self):
+        """Only the requested entry and its ancestors should be inspected.
+        Modification times of existing files are cached until rebuild()"""
+        with self.dependency_graph() as dgraph:
+            self.dependency.write('value')
+            self.depender.write('value2')
+            dgraph.add(self.depender, self.dependency)
+            dgraph.add(entry.Entry('other', 'out'), entry.Entry('other', 'in'))
+
+            with patch('regparser.index.dependency.os.path.getmtime',
+                       wraps=os.path.getmtime) as getmtime:
+                self.assertFalse(dgraph.is_stale(self.depender))
+                self.assertFalse(dgraph.is_stale(self.depender))
+                self.assertItemsEqual(
+                    [call[0][0] for call in getmtime.call_args_list],
+                    [str(self.depender), str(self.dependency)])
+
+    def test_imports_gml(self):
+        """If a GML graph from a previous version is present, its edges
+        should be imported"""
+        with CliRunner().isolated_filesystem():
+            os.makedirs(entry.ROOT)
+            graph = networkx.DiGraph()
+            graph.add_edge('in', 'out')
+            networkx.write_gml(graph, dependency.Graph.GML_FILE)
+            self.assertEqual(dependency.Graph().dependencies('out'), ['in'])
@@ -0,0 +1,62 @@
+# vim: set encoding=utf-8
+from datetime import date
+import json
+from unittest import TestCase
+
+from click.testing import CliRunner
+from mock import Mock
+
+from regparser.commands.layers import LAYER_CLASSES
+from regparser.history.versions import Version
+from regparser.layer.cache import LayerCache
+from regparser.tree.struct import Node
+
+
+class LayerCacheTests(TestCase):
+    def tree(self, extra_text=''):
+        return Node(label=['1000'], title='Part 1000 - Stuff', children=[
+            Node(label=['1000', '1'], title=u'\xa7 1000.1 Defs', children=[
+                Node(u'(a) A “widget” means a thing. See '
+                     u'\xa7 1000.1(b) and 12 CFR 1000.1(a).',
+                     label=['1000', '1', 'a']),
+                Node(u'(b) Each widget is a thing.' + extra_text,
+                     label=['1000', '1', 'b'])])])
+
+    def build_all(self, tree, cache):
+        version = Version('v1', date(2001, 1, 1), date(2001, 1, 1))
+        return json.dumps({
+            name: cls(tree, cfr_title=12, version=version).build(cache)
+            for name, cls in LAYER_CLASSES['cfr'].items()}, sort_keys=True)
+
+    def test_output_unchanged(self):
+        """Cached and uncached layers should serialize identically"""
+        with CliRunner().isolated_filesystem():
+            uncached = self.build_all(self.tree(), None)
+            cache = LayerCache()
+            self.assertEqual(self.build_all(self.tree(), cache), uncached)
+            self.assertEqual(cache.hits, 0)
+            misses = cache.misses
+
+            self.assertEqual(self.build_all(self.tree(), cache), uncached)
+            self.assertEqual(cache.hits, misses)
+            self.assertEqual(cache.misses, misses)
+
+    def test_only_changes_processed(self):
+        """Modifying a paragraph should only require reprocessing it and its
+        ancestors"""
+        with CliRunner().isolated_filesystem():
+            cache = LayerCache()
+            layer_cls = LAYER_CLASSES['cfr']['paragraph-markers']
+            layer_cls(self.tree()).build(cache)
+            self.assertEqual((cache.hits, cache.misses), (0, 4))
+            layer_cls(self.tree(' Changed')).build(cache)
+            self.assertEqual((cache.hits, cache.misses), (1, 7))
+
+    def test_uncacheable(self):
+        """Layers with no context aren't cached"""
+        layer = Mock(shorthand='mock')
+        layer.cache_context.return_value = None
+        layer.process.return_value = 'result'
+        cache = LayerCache()
+        self.assertEqual(cache.fetch_or_process(layer, Node()), 'result')
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
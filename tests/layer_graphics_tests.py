@@ -1,8 +1,10 @@
 from unittest import TestCase
 
+from click.testing import CliRunner
 from mock import patch
 
-from regparser.layer.graphics import gid_to_url, Graphics
+from regparser.layer.graphics import (
+    gid_to_url, Graphics, ImageUrlCache, resolve_gid)
 from regparser.tree.struct import Node
 import settings
 from tests.http_mixin import HttpMixin
@@ -112,3 +114,103 @@ class LayerGraphicsTest(HttpMixin, TestCase):
 
         self.assertEqual(gid_to_url('ABCD123'),
                          'http://example.com/abcd123.png')
+
+
+class ImageUrlCacheTests(TestCase):
+    def setUp(self):
+        self.cli = CliRunner()
+
+    @patch('regparser.layer.graphics.resolve_gid')
+    def test_resolve_all(self, resolve_gid):
+        """Only unknown gids are probed; results persist between runs"""
+        resolve_gid.side_effect = lambda gid, overrides: (gid + '.gif', None)
+        with self.cli.isolated_filesystem():
+            self.assertEqual(
+                ImageUrlCache(ttl=60).resolve_all(['a', 'b', 'a'], 1),
+                {'a': ('a.gif', None), 'b': ('b.gif', None)})
+            self.assertEqual(resolve_gid.call_count, 2)
+
+            resolve_gid.reset_mock()
+            self.assertEqual(
+                ImageUrlCache(ttl=60).resolve_all(['a', 'b', 'c'], 1),
+                {'a': ('a.gif', None), 'b': ('b.gif', None),
+                 'c': ('c.gif', None)})
+            self.assertEqual(
+                [call[0][0] for call in resolve_gid.call_args_list], ['c'])
+
+    @patch('regparser.layer.graphics.content.ImageOverrides')
+    @patch('regparser.layer.graphics.resolve_gid')
+    def test_resolve_all_overrides(self, resolve_gid, ImageOverrides):
+        """Overrides are loaded once and are part of the cache key"""
+        resolve_gid.return_value = ('url', None)
+        ImageOverrides.return_value = {'b': 'http://example.com/b.png'}
+        with self.cli.isolated_filesystem():
+            ImageUrlCache(ttl=60).resolve_all(['a', 'b', 'c'], 1)
+            self.assertEqual(ImageOverrides.call_count, 1)
+            for call in resolve_gid.call_args_list:
+                self.assertIs(call[0][1], ImageOverrides.return_value)
+
+            resolve_gid.reset_mock()
+            ImageOverrides.return_value = {'b': 'http://example.com/b.gif'}
+            ImageUrlCache(ttl=60).resolve_all(['a', 'b', 'c'], 1)
+            self.assertEqual(
+                [call[0][0] for call in resolve_gid.call_args_list], ['b'])
+
+    @patch('regparser.layer.graphics.time.time')
+    @patch('regparser.layer.graphics.resolve_gid')
+    def test_resolve_all_expired(self, resolve_gid, time):
+        """Entries older than the TTL are probed again; a TTL of 0 disables
+        the cache entirely"""
+        resolve_gid.return_value = ('url', 'thumb')
+        with self.cli.isolated_filesystem():
+            time.return_value = 1000
+            ImageUrlCache(ttl=60).resolve_all(['a'], 1)
+            time.return_value = 1059
+            ImageUrlCache(ttl=60).resolve_all(['a'], 1)
+            self.assertEqual(resolve_gid.call_count, 1)
+            time.return_value = 1061
+            ImageUrlCache(ttl=60).resolve_all(['a'], 1)
+            self.assertEqual(resolve_gid.call_count, 2)
+
+            ImageUrlCache(ttl=0).resolve_all(['a'], 1)
+            self.assertEqual(resolve_gid.call_count, 3)
+
+    @patch('regparser.layer.graphics.resolve_gid')
+    def test_resolve_all_concurrent(self, resolve_gid):
+        """Misses can be probed from a thread pool"""
+        resolve_gid.side_effect = lambda gid, overrides: (gid + '.gif',
+                                                          gid + '.t.gif')
+        gids = [str(idx) for idx in range(20)]
+        with self.cli.isolated_filesystem():
+            resolved = ImageUrlCache(ttl=60).resolve_all(gids, workers=4)
+        self.assertEqual(resolved, {gid: (gid + '.gif', gid + '.t.gif')
+                                    for gid in gids})
+
+    @patch('regparser.layer.graphics.gid_to_url')
+    @patch('regparser.layer.graphics.check_url')
+    def test_resolve_gid(self, check_url, gid_to_url):
+        gid_to_url.return_value = 'http://example.com/a.gif'
+        check_url.return_value = None
+        self.assertEqual(resolve_gid('a'), ('http://example.com/a.gif', None))
+        self.assertEqual(check_url.call_args[0][0],
+                         'http://example.com/a.thumb.gif')
+
+    @patch('regparser.layer.graphics.ImageUrlCache')
+    @patch('regparser.layer.graphics.resolve_gid')
+    def test_build(self, resolve_gid, ImageUrlCache):
+        """The layer resolves all of the tree's gids before processing"""
+        ImageUrlCache.return_value.resolve_all.return_value = {
+            'a': ('a.gif', 'a.thumb.gif'), 'b': ('b.gif', None)}
+        tree = Node(children=[Node("![](a)", label=['1', '1']),
+                              Node("![x](b) ![](a)", label=['1', '2'])],
+                    label=['1'])
+        layer = Graphics(tree).build()
+
+        self.assertItemsEqual(
+            ImageUrlCache.return_value.resolve_all.call_args[0][0],
+            ['a', 'b', 'a'])
+        self.assertFalse(resolve_gid.called)
+        self.assertEqual(layer['1-1'], [{
+            'text': '![](a)', 'url': 'a.gif', 'alt': '',
+            'locations': [0], 'thumb_url': 'a.thumb.gif'}])
+        self.assertEqual(len(layer['1-2']), 2)
@@ -1,7 +1,12 @@
 # vim: set encoding=utf-8
 from unittest import TestCase
 
+from click.testing import CliRunner
+from mock import patch
+
+from regparser.citations import Label
 from regparser.layer import internal_citations
+from regparser.layer.cache import LayerCache
 from regparser.tree.struct import Node
 
 
@@ -386,3 +391,51 @@ class ParseTest(TestCase):
         self.assertEqual(['110', '21'], result[2]['citation'])
         offsets = result[2]['offsets'][0]
         self.assertEqual('110.21', text[offsets[0]:offsets[1]])
+
+
+class CitationCacheTests(TestCase):
+    def tree(self, *extra_sections):
+        sections = [Node(u'See \xa7 1000.2(a)', label=['1000', '1'])]
+        sections.extend(extra_sections)
+        return Node(label=['1000'], children=sections)
+
+    def test_only_new_text_parsed(self):
+        """A second version should only parse paragraphs which changed. As
+        the results are stored before filtering, citations to paragraphs new
+        to that version are still found"""
+        def build(tree, cache):
+            return internal_citations.InternalCitationParser(
+                tree, cfr_title=12).build(cache)
+
+        with CliRunner().isolated_filesystem():
+            new_section = Node(
+                'Paragraph (a) of this section', label=['1000', '2'],
+                children=[Node('(a) Stuff', label=['1000', '2', 'a'])])
+            expected = [build(self.tree(), None),
+                        build(self.tree(new_section), None)]
+            self.assertEqual(expected[0], {})
+            self.assertEqual(len(expected[1]), 2)
+
+            to_patch = 'regparser.layer.internal_citations.internal_citations'
+            with patch(to_patch, wraps=internal_citations.internal_citations
+                       ) as parse:
+                self.assertEqual(build(self.tree(), LayerCache()), expected[0])
+                first_count = parse.call_count
+                self.assertEqual(build(self.tree(new_section),
+                                       LayerCache()),
+                                 expected[1])
+                # Two new paragraphs; the first section is unchanged
+                self.assertEqual(parse.call_count - first_count, 2)
+
+    def test_key(self):
+        """Context matters"""
+        key = internal_citations.CitationCache.key
+        label = Label(part='1000', section='1')
+        self.assertEqual(key('text', label, '12'),
+                         key('text', Label(part='1000', section='1'), '12'))
+        self.assertNotEqual(key('text', label, '12'),
+                            key('text', label, '11'))
+        self.assertNotEqual(key('text', label, '12'),
+                            key('text', Label(part='1000', section='2'), '12'))
+        self.assertNotEqual(key('text', label, '12'),
+                            key('other', label, '12'))
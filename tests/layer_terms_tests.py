@@ -1,12 +1,16 @@
 # vim: set fileencoding=utf-8
+import random
+import re
 from unittest import TestCase
 
 from mock import patch
 
-from regparser.layer.terms import ParentStack, Terms
+from regparser.layer.terms import (
+    at_word_boundary, ParentStack, TermAutomaton, Terms)
 from regparser.layer.def_finders import Ref
 from regparser.tree.struct import Node
 import settings
+from tests import reference
 
 
 class LayerTermTest(TestCase):
@@ -326,6 +330,13 @@ class LayerTermTest(TestCase):
                                            label=['28', '9']))
         self.assertNotEqual([], excluded)
 
+    def test_word_regexes_per_instance(self):
+        """Compiled regexes are cached per layer, not shared between them"""
+        first, second = Terms(None), Terms(None)
+        self.assertEqual(first._word_matches('act', 'an act'), [(3, 6)])
+        self.assertIn('act', first._word_regexes)
+        self.assertEqual(second._word_regexes, {})
+
     def test_calculate_offsets(self):
         applicable_terms = [('rock band', 'a'), ('band', 'b'), ('drum', 'c'),
                             ('other thing', 'd')]
@@ -449,3 +460,60 @@ class LayerTermTest(TestCase):
         #   Term is defined in the first child
         self.assertEqual([], t.process(tree.children[0]))
         self.assertEqual(1, len(t.process(tree.children[1])))
+
+
+class TermAutomatonTests(TestCase):
+    def test_find_all(self):
+        automaton = TermAutomaton(['he', 'she', 'his', 'hers', ''])
+        self.assertEqual(list(automaton.find_all('ushers')), [
+            ('she', 1, 4), ('he', 2, 4), ('hers', 2, 6)])
+        self.assertEqual(list(TermAutomaton([]).find_all('ushers')), [])
+
+    def test_at_word_boundary(self):
+        """Should match the regex, which is not unicode-aware"""
+        text = u'a \xe9b_c, d'
+        self.assertEqual([idx for idx in range(len(text) + 1)
+                          if at_word_boundary(text, idx)],
+                         [match.start()
+                          for match in re.finditer(ur'\b', text)])
+        self.assertEqual([idx for idx in range(len(text) + 1)
+                          if at_word_boundary(text, idx)],
+                         [0, 1, 3, 6, 8, 9])
+
+    def test_matches_reference(self):
+        """Randomized comparison with the per-term regex implementation"""
+        rng = random.Random(4321)
+        words = ['band', 'bands', 'rock', 'drum', 'act', 'action', 'a',
+                 u'\xe9t\xe9', '(1)', '"', 'person', 'people', 'mad cow']
+        separators = [' ', ' ', ', ', '. ', '-', '']
+        terms = Terms(None)
+        for _ in range(300):
+            text = ''.join(rng.choice(words) + rng.choice(separators)
+                           for _ in range(rng.randint(0, 20)))
+            if rng.random() < 0.3:
+                text = text.upper()
+            applicable_terms = [
+                (' '.join(rng.choice(words)
+                          for _ in range(rng.randint(1, 2))),
+                 rng.choice('abc'))
+                for _ in range(rng.randint(1, 6))]
+            exclusions = [(start, start + rng.randint(0, 5))
+                          for start in rng.sample(range(100),
+                                                  rng.randint(0, 3))]
+            self.assertEqual(
+                terms.calculate_offsets(text, applicable_terms, exclusions),
+                reference.calculate_offsets(text, applicable_terms,
+                                            exclusions))
+
+    def test_scope_index_reused(self):
+        """Nodes sharing scopes share a single index"""
+        terms = Terms(None)
+        terms.scoped_terms = {
+            ('1000',): [Ref('widget', '1000-1-a', 0)],
+            ('1000', '2'): [Ref('gadget', '1000-2-a', 0)]}
+        with patch.object(terms, 'applicable_terms',
+                          wraps=terms.applicable_terms) as applicable_terms:
+            for label in (['1000', '1'], ['1000', '1', 'b'], ['1000', '3'],
+                          ['1000', '2'], ['1000', '2', 'b']):
+                terms.process(Node('A widget and a gadget', label=label))
+            self.assertEqual(applicable_terms.call_count, 2)
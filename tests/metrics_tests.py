@@ -0,0 +1,128 @@
+import json
+import os
+import pstats
+import threading
+from unittest import TestCase
+
+from click.testing import CliRunner
+from mock import patch
+
+from regparser.layer.layer import Layer
+from regparser.metrics import Recorder
+from regparser.tree.struct import Node
+
+
+class CountingLayer(Layer):
+    shorthand = 'counting'
+
+    def process(self, node):
+        return [len(node.text)]
+
+
+class RecorderTests(TestCase):
+    def setUp(self):
+        super(RecorderTests, self).setUp()
+        self.recorder = Recorder()
+
+    def tearDown(self):
+        self.recorder.disable()
+        super(RecorderTests, self).tearDown()
+
+    def test_disabled(self):
+        """Nothing is recorded until the recorder is enabled"""
+        with self.recorder.timed('command', 'stage'):
+            pass
+        self.recorder.count('event')
+        report = self.recorder.report()
+        self.assertEqual(report['timings'], {})
+        self.assertEqual(report['counters'], {})
+
+    def test_timed(self):
+        """Stages are grouped by category; repeated stages accumulate"""
+        self.recorder.enable()
+        for _ in range(3):
+            with self.recorder.timed('layer', 'Terms'):
+                sum(range(10000))
+        with self.recorder.timed('command', 'layers'):
+            pass
+
+        timings = self.recorder.report()['timings']
+        self.assertEqual(set(timings.keys()), {'layer', 'command'})
+        stats = timings['layer']['Terms']
+        self.assertEqual(stats['count'], 3)
+        self.assertTrue(stats['wall'] > 0)
+        self.assertTrue(stats['cpu'] >= 0)
+        self.assertTrue(stats['max_rss'] > 0)
+        self.assertIn('rss_growth', stats)
+
+    def test_timed_exception(self):
+        """Stages which raise are still recorded"""
+        self.recorder.enable()
+        with self.assertRaises(ValueError):
+            with self.recorder.timed('command', 'failing'):
+                raise ValueError()
+        self.assertEqual(
+            self.recorder.timings['command']['failing']['count'], 1)
+
+    def test_timed_function(self):
+        self.recorder.enable()
+
+        @self.recorder.timed_function('command')
+        def some_command(value):
+            return value * 2
+
+        self.assertEqual(some_command(3), 6)
+        self.assertEqual(some_command.__name__, 'some_command')
+        self.assertEqual(
+            self.recorder.timings['command']['some_command']['count'], 1)
+
+    def test_count(self):
+        """Events are only counted while enabled, from any thread"""
+        self.recorder.count('event')
+        self.recorder.enable()
+        threads = [threading.Thread(target=lambda: [
+            self.recorder.count('event') for _ in range(1000)])
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.recorder.count('event', 5)
+        self.assertEqual(self.recorder.counters['event'], 4005)
+
+        self.recorder.disable()
+        self.recorder.count('event')
+        self.assertEqual(self.recorder.counters['event'], 4005)
+
+    def test_layers_recorded(self):
+        """Layer.build records a stage per layer class"""
+        self.recorder.enable()
+        with patch('regparser.metrics.timed', self.recorder.timed):
+            CountingLayer(Node('abc', label=['1000'])).build()
+        self.assertEqual(
+            self.recorder.timings['layer']['CountingLayer']['count'], 1)
+
+    def test_write_and_profile(self):
+        """Metrics are written as JSON; only the named stage is profiled"""
+        with CliRunner().isolated_filesystem():
+            self.recorder.enable('chosen')
+            with self.recorder.timed('layer', 'other'):
+                pass
+            self.assertFalse(self.recorder.dump_profile('chosen.prof'))
+            with self.recorder.timed('layer', 'chosen'):
+                sorted(range(1000), reverse=True)
+            self.recorder.count('cache.citations.hits', 5)
+
+            self.recorder.write('metrics.json')
+            with open('metrics.json') as f:
+                report = json.load(f)
+            self.assertEqual(set(report['timings']['layer'].keys()),
+                             {'other', 'chosen'})
+            self.assertEqual(report['counters'],
+                             {'cache.citations.hits': 5})
+
+            self.assertTrue(self.recorder.dump_profile('chosen.prof'))
+            self.assertTrue(os.path.exists('chosen.prof'))
+            functions = [fn_name for _, _, fn_name
+                         in pstats.Stats('chosen.prof').stats]
+            self.assertIn('sorted', ''.join(functions))
@@ -1,9 +1,12 @@
 # vim: set encoding=utf-8
+from collections import Counter
+import random
 from random import randint
 from unittest import TestCase
 
 from regparser.notice import compiler
-from regparser.tree.struct import Node, find
+from regparser.tree.struct import Node, find, walk
+from tests import reference
 
 
 class CompilerTests(TestCase):
@@ -950,3 +953,136 @@ class CompilerTests(TestCase):
         sect5, sect7 = find(tree.tree, '111-5'), find(tree.tree, '111-7')
         self.assertEqual([sub_b], tree.tree.children)
         self.assertEqual([sect5, sect7], sub_b.children)
+
+
+class RegulationTreeIndexTests(TestCase):
+    """The indexed RegulationTree should behave exactly like one which
+    searches the whole tree"""
+    @staticmethod
+    def random_tree(rng):
+        def paragraphs(label, depth):
+            if depth == 3:
+                return []
+            markers = ['a', 'b', 'c'] if depth == 0 else ['1', '2']
+            return [Node('({}) text {}'.format(marker, rng.randint(0, 9)),
+                         label=label + [marker],
+                         children=paragraphs(label + [marker], depth + 1))
+                    for marker in markers[:rng.randint(0, len(markers))]]
+        sections = [Node('Section ' + str(i), label=['205', str(i)],
+                         children=paragraphs(['205', str(i)], 0))
+                    for i in range(1, rng.randint(2, 5))]
+        # Sections are split between (up to) two subparts
+        split = rng.randint(1, len(sections))
+        subparts = [Node('', label=['205', 'Subpart', letter],
+                         node_type=Node.SUBPART, children=children)
+                    for letter, children in (('A', sections[:split]),
+                                             ('B', sections[split:]))
+                    if children]
+        return Node('Root', label=['205'], children=subparts)
+
+    @staticmethod
+    def random_changes(rng, tree):
+        existing = walk(tree, lambda n: n.label)[2:]
+        labels = existing + [['205', str(rng.randint(1, 5)), 'd'],
+                             ['205', '2', 'a', '3']]
+        changes = {}
+        for _ in range(rng.randint(1, 8)):
+            label = rng.choice(labels)
+            node = {'text': 'new {}'.format(rng.randint(0, 9)),
+                    'label': label, 'node_type': Node.REGTEXT}
+            action = rng.choice(['PUT', 'PUT', 'POST', 'DELETE', 'MOVE',
+                                 'RESERVE', 'INSERT', 'KEEP', 'FIELD',
+                                 'DESIGNATE'])
+            if action == 'MOVE':
+                change = {'action': action,
+                          'destination': rng.choice(labels)}
+            elif action == 'DESIGNATE':
+                label = ['205', str(rng.randint(1, 4))]
+                change = {'action': action, 'destination': rng.choice(
+                    ['205-Subpart-A', '205-Subpart-B', '205-Subpart-C'])}
+            elif action == 'FIELD':
+                change = {'action': 'PUT', 'field': '[text]', 'node': node}
+            else:
+                change = {'action': action, 'node': node}
+            changes.setdefault('-'.join(label), []).append(change)
+        return changes
+
+    @staticmethod
+    def serialize(node):
+        return (node.label, node.text, node.title,
+                [RegulationTreeIndexTests.serialize(c)
+                 for c in node.children])
+
+    def assert_index_consistent(self, reg):
+        counts = Counter(walk(reg.tree, lambda n: n.label_id()))
+
+        def check(node, parent):
+            label_id = node.label_id()
+            if counts[label_id] == 1:
+                self.assertIs(reg.find_node(label_id), node)
+                self.assertIs(reg._parent_of(label_id), parent)
+            for child in node.children:
+                check(child, node)
+        check(reg.tree, None)
+
+    def test_equivalent_to_reference(self):
+        rng = random.Random(4321)
+        for _ in range(300):
+            tree = self.random_tree(rng)
+            changes = self.random_changes(rng, tree)
+            try:
+                expected = self.serialize(
+                    reference.compile_regulation(tree, changes))
+            except Exception as exc:
+                with self.assertRaises(type(exc)):
+                    compiler.compile_regulation(tree, changes)
+                continue
+            for share_structure in (False, True):
+                before = self.serialize(tree)
+                reg = compiler.RegulationTree(tree, share_structure)
+                compiler.apply_changes(reg, changes)
+                self.assertEqual(self.serialize(reg.tree), expected)
+                self.assertEqual(self.serialize(tree), before)
+                self.assert_index_consistent(reg)
+
+    def test_move_to_subpart_share_structure(self):
+        """Moving the last section out of a subpart deletes that subpart,
+        whether or not structure is shared"""
+        tree = Node('Root', label=['1000'], children=[
+            Node('', label=['1000', 'Subpart', 'A'], node_type=Node.SUBPART,
+                 children=[Node('S1', label=['1000', '1'])]),
+            Node('', label=['1000', 'Subpart', 'B'], node_type=Node.SUBPART,
+                 children=[Node('S2', label=['1000', '2'])])])
+        changes = {'1000-1': [{'action': 'DESIGNATE',
+                               'destination': '1000-Subpart-B'}]}
+        for share_structure in (False, True):
+            new_tree = compiler.compile_regulation(tree, changes,
+                                                   share_structure)
+            self.assertEqual(
+                [(c.label_id(), [g.label_id() for g in c.children])
+                 for c in new_tree.children],
+                [('1000-Subpart-B', ['1000-1', '1000-2'])])
+
+    def test_share_structure(self):
+        """Only the nodes on the path to a change are copied"""
+        tree = Node('Root', label=['205'], children=[
+            Node('S1', label=['205', '1'], children=[
+                Node('(a) a', label=['205', '1', 'a']),
+                Node('(b) b', label=['205', '1', 'b'])]),
+            Node('S2', label=['205', '2'], children=[
+                Node('(a) a', label=['205', '2', 'a'])])])
+        changes = {'205-1-b': [{
+            'action': 'PUT', 'field': '[text]',
+            'node': {'text': '(b) B', 'label': ['205', '1', 'b'],
+                     'node_type': Node.REGTEXT}}]}
+        new_tree = compiler.compile_regulation(tree, changes,
+                                               share_structure=True)
+
+        self.assertEqual(tree.children[0].children[1].text, '(b) b')
+        self.assertEqual(new_tree.children[0].children[1].text, '(b) B')
+        self.assertIsNot(new_tree, tree)
+        self.assertIsNot(new_tree.children[0], tree.children[0])
+        self.assertIs(new_tree.children[0].children[0],
+                      tree.children[0].children[0])
+        self.assertIs(new_tree.children[1], tree.children[1])
+        self.assertEqual(new_tree, compiler.compile_regulation(tree, changes))
@@ -0,0 +1,229 @@
+"""Earlier, simpler (and slower) implementations of algorithms which have
+since been optimized. These are retained so that we can verify the optimized
+versions produce identical results"""
+import re
+
+import inflection
+
+from regparser.diff.tree import (
+    _data_for_add, _data_for_delete, _local_changes)
+from regparser.notice import compiler
+from regparser.tree import struct
+from regparser.tree.depth.derive import (
+    _build_problem, _compress_markerless, _decompress_markerless, Solution)
+
+
+def _new_in_rhs(lhs_list, rhs_list):
+    """Compare the lhs and rhs lists to see if the rhs contains elements not
+    in the lhs"""
+    added = []
+    lhs_codes = tuple(map(lambda n: n.label_id, lhs_list))
+    for node in rhs_list:
+        if node.label_id not in lhs_codes:
+            added.append(node)
+    return added
+
+
+def walk(node, fn):
+    """See regparser.tree.struct.walk. Recursive, concatenating the results
+    of each subtree"""
+    result = fn(node)
+
+    if result is not None:
+        results = [result]
+    else:
+        results = []
+    for child in node.children:
+        results += walk(child, fn)
+    return results
+
+
+def find_first(root, predicate):
+    """See regparser.tree.struct.find_first. Collects every match before
+    returning the first"""
+    response = walk(root, lambda n: n if predicate(n) else None)
+    if response:
+        return response[0]
+
+
+def find(root, label):
+    """See regparser.tree.struct.find"""
+    return find_first(root, lambda n: n.label_id() == label)
+
+
+def join_text(node):
+    """See regparser.tree.struct.join_text"""
+    bits = []
+    walk(node, lambda n: bits.append(n.text))
+    return ''.join(bits)
+
+
+def changes_between(lhs, rhs):
+    """See regparser.diff.tree.changes_between. Matches children with a
+    nested loop"""
+    changes = []
+    if lhs == rhs:
+        return changes
+
+    changes.extend(_local_changes(lhs, rhs))
+
+    # Removed children. Note params reversed
+    removed_children = _new_in_rhs(rhs.children, lhs.children)
+    changes.extend(map(_data_for_delete, removed_children))
+    # grandchildren which appear to be deleted, but may just have been moved
+    possibly_moved = {}
+    for child in removed_children:
+        for grandchild in child.children:
+            possibly_moved[grandchild.label_id] = grandchild
+
+    # New children. Determine if they are added or moved
+    for added in _new_in_rhs(lhs.children, rhs.children):
+        changes.append(_data_for_add(added))
+        for grandchild in added.children:
+            if grandchild.label_id in possibly_moved:   # it *was* moved
+                changes.extend(changes_between(
+                    possibly_moved[grandchild.label_id], grandchild))
+                del possibly_moved[grandchild.label_id]
+            else:   # Not moved; recursively add all of it's children
+                changes.extend(walk(grandchild, _data_for_add))
+
+    # Remaining nodes weren't moved; they were *re*moved
+    for removed in possibly_moved.values():
+        changes.extend(walk(removed, _data_for_delete))
+
+    # Recurse on modified children. Again, this does *not* track reordering
+    for lhs_child in lhs.children:
+        for rhs_child in rhs.children:
+            if lhs_child.label_id == rhs_child.label_id:
+                changes.extend(changes_between(lhs_child, rhs_child))
+    return changes
+
+
+def derive_depths(original_markers, additional_constraints=[]):
+    """See regparser.tree.depth.derive.derive_depths. Searches for solutions
+    from scratch each time"""
+    if not original_markers:
+        return []
+    marker_list = _compress_markerless(original_markers)
+    problem = _build_problem(marker_list, additional_constraints)
+    return [Solution(_decompress_markerless(assignment, original_markers))
+            for assignment in problem.getSolutionIter()]
+
+
+class RegulationTree(compiler.RegulationTree):
+    """See regparser.notice.compiler.RegulationTree. Searches the whole tree
+    for each lookup rather than consulting the indexes"""
+    def find_node(self, label):
+        if isinstance(label, list):
+            label = '-'.join(label)
+        return find(self.tree, label)
+
+    def _parent_of(self, label_id):
+        return find_first(self.tree, lambda n: any(
+            c.label_id() == label_id for c in n.children))
+
+
+def compile_regulation(previous_tree, notice_changes):
+    """See regparser.notice.compiler.compile_regulation"""
+    return compiler.apply_changes(RegulationTree(previous_tree),
+                                  notice_changes)
+
+
+class Node(object):
+    """See regparser.tree.struct.Node. Fields are stored in a per-instance
+    __dict__ and label segments/node types are not interned"""
+    def __init__(self, text='', children=[], label=[], title=None,
+                 node_type=struct.Node.REGTEXT, source_xml=None):
+        self.text = unicode(text)
+        self.children = list(children)
+        self.label = [str(l) for l in label if l != '']
+        self.title = unicode(title or '') or None
+        self.node_type = node_type
+        self.source_xml = source_xml
+
+
+def merge_duplicates(nodes):
+    """See regparser.tree.struct.merge_duplicates. Searches for a pair of
+    duplicates, merges them and starts over"""
+    found_pair = None
+    for lidx, lhs in enumerate(nodes):
+        for ridx, rhs in enumerate(nodes[lidx + 1:], lidx + 1):
+            if lhs.label == rhs.label:
+                found_pair = (lidx, ridx)
+    if found_pair:
+        lidx, ridx = found_pair
+        lhs, rhs = nodes[lidx], nodes[ridx]
+        lhs.children.extend(rhs.children)
+        return merge_duplicates(nodes[:ridx] + nodes[ridx + 1:])
+    else:
+        return nodes
+
+
+def treeify(nodes):
+    """See regparser.tree.struct.treeify. Scans all of the nodes for the
+    children of each root"""
+    if not nodes:
+        return nodes
+
+    min_len, with_min = len(nodes[0].label), []
+
+    for node in nodes:
+        if len(node.label) == min_len:
+            with_min.append(node)
+        elif len(node.label) < min_len:
+            min_len = len(node.label)
+            with_min = [node]
+    with_min = merge_duplicates(with_min)
+
+    roots = []
+    for root in with_min:
+        label = root.label
+        if root.label[-1] == struct.Node.INTERP_MARK:
+            label = root.label[:-1]
+
+        def is_child(node):
+            return node.label[:len(label)] == label
+        children = [n for n in nodes if n.label != root.label and is_child(n)]
+        root.children = root.children + treeify(children)
+        roots.append(root)
+    return roots
+
+
+def calculate_offsets(text, applicable_terms, exclusions=[], inclusions=[]):
+    """See regparser.layer.terms.Terms.calculate_offsets. Searches the text
+    with a separate regex for each term"""
+    # don't modify the original
+    exclusions = list(exclusions)
+    inclusions = list(inclusions)
+
+    # add singulars and plurals to search terms
+    search_terms = set((inflection.singularize(t[0]), t[1])
+                       for t in applicable_terms)
+    search_terms |= set((inflection.pluralize(t[0]), t[1])
+                        for t in applicable_terms)
+
+    # longer terms first
+    search_terms = sorted(search_terms, key=lambda x: len(x[0]),
+                          reverse=True)
+
+    matches = []
+    for term, ref in search_terms:
+        re_term = ur'\b' + re.escape(term) + ur'\b'
+        offsets = [
+            (m.start(), m.end())
+            for m in re.finditer(re_term, text.lower())]
+        safe_offsets = []
+        for start, end in offsets:
+            #   Start is contained in an existing def
+            if any(start >= e[0] and start <= e[1] for e in exclusions):
+                continue
+            #   End is contained in an existing def
+            if any(end >= e[0] and end <= e[1] for e in exclusions):
+                continue
+            safe_offsets.append((start, end))
+        if not safe_offsets:
+            continue
+
+        exclusions.extend(safe_offsets)
+        matches.append((term, ref, safe_offsets))
+    return matches
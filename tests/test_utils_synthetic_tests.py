@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from lxml import etree
+
+from regparser.notice.compiler import compile_regulation
+from regparser.test_utils import synthetic
+from regparser.tree import struct
+from regparser.tree.xml_parser import reg_text
+
+
+class SyntheticTests(TestCase):
+    def test_deterministic(self):
+        """The same parameters produce the same XML; different seeds don't"""
+        def xml_str(**kwargs):
+            return etree.tostring(synthetic.regulation_xml(**kwargs))
+        self.assertEqual(xml_str(seed=1), xml_str(seed=1))
+        self.assertNotEqual(xml_str(seed=1), xml_str(seed=2))
+
+    def test_structure(self):
+        """The parser should recover the generated structure, down to the
+        emphasized paragraph levels"""
+        tree = reg_text.build_tree(synthetic.regulation_xml(
+            cfr_part=1234, sections=12, depth=6, breadth=2, interps=3,
+            appendices=2, seed=3))
+        self.assertEqual(tree.label, ['1234'])
+        labels = [node.label for node in struct.iter_nodes(tree)]
+        self.assertIn(['1234', 'Subpart', 'B'], labels)
+        sections = [label for label in labels
+                    if len(label) == 2 and label[1].isdigit()]
+        self.assertEqual(len(sections), 12)
+        self.assertIn(['1234', 'A'], labels)
+        self.assertIn(['1234', 'B'], labels)
+        self.assertIn(['1234', 'Interp'], labels)
+        self.assertIn(['1234', '3', 'a', 'Interp'], labels)
+        self.assertEqual(max(len(label) for label in labels
+                             if 'Interp' not in label), 2 + 6)
+        definitions = struct.find(tree, '1234-2-h')
+        self.assertTrue(definitions.text.startswith('(h) Widget means'))
+
+    def test_amendments(self):
+        """Amendments should apply cleanly to the tree they were generated
+        from"""
+        tree = reg_text.build_tree(synthetic.regulation_xml(sections=5))
+        changes = synthetic.amendments(tree, 20, seed=4)
+        self.assertEqual(len(changes), 20)
+        self.assertEqual(changes, synthetic.amendments(tree, 20, seed=4))
+        actions = set(change[0]['action'] for change in changes.values())
+        self.assertEqual(actions, {'PUT', 'POST', 'DELETE'})
+
+        compiled = compile_regulation(tree, changes)
+        for label_id, (change, ) in changes.items():
+            node = struct.find(compiled, label_id)
+            if change['action'] == 'DELETE':
+                self.assertIsNone(node)
+            else:
+                self.assertEqual(node.text, change['node']['text'])
@@ -1,8 +1,14 @@
+import random
 from unittest import TestCase
 
-from regparser.tree.depth import markers, optional_rules, rules
+from click.testing import CliRunner
+from mock import patch
+
+from regparser.index.cache import DiskCache
+from regparser.tree.depth import derive, markers, optional_rules, rules
 from regparser.tree.depth.derive import debug_idx, derive_depths
 from regparser.tree.depth.markers import INLINE_STARS, MARKERLESS, STARS_TAG
+from tests import reference
 
 
 class DeriveTests(TestCase):
@@ -262,3 +268,106 @@ class DeriveTests(TestCase):
             debug_idx(['1', 'a', '2', 'A'],
                       [optional_rules.depth_type_inverses]),
             3)
+
+
+class SolutionCacheTests(TestCase):
+    def setUp(self):
+        patcher = patch.object(derive, 'solution_cache',
+                               derive.SolutionCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def depths(solutions):
+        return [[par.depth for par in solution] for solution in solutions]
+
+    def test_memoized(self):
+        """The second request for the same markers doesn't search"""
+        marker_list = ['a', 'i', 'ii', 'b', MARKERLESS, MARKERLESS]
+        with patch.object(derive, '_solve', wraps=derive._solve) as solve:
+            first = derive_depths(marker_list)
+            second = derive_depths(marker_list)
+        self.assertEqual(solve.call_count, 1)
+        self.assertEqual(self.depths(first), self.depths(second))
+        self.assertEqual(len(second[0].assignment), 6)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # different constraints are cached separately
+        derive_depths(marker_list, [optional_rules.limit_sequence_gap(3)])
+        derive_depths(marker_list, [optional_rules.limit_sequence_gap(4)])
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_unsignable_constraints(self):
+        """Constraints we can't describe are not cached"""
+        class Constraint(object):
+            def __call__(self, constrain, all_variables):
+                pass
+        with patch.object(derive, '_solve', wraps=derive._solve) as solve:
+            derive_depths(['a', 'i'], [Constraint()])
+            derive_depths(['a', 'i'], [Constraint()])
+        self.assertEqual(solve.call_count, 2)
+
+    def test_persisted(self):
+        """Solutions can be shared between caches via the index"""
+        with CliRunner().isolated_filesystem():
+            self.cache.persist()
+            derive_depths(['a', 'i', 'ii'])
+            derive.solution_cache = derive.SolutionCache()
+            derive.solution_cache.persist()
+            with patch.object(derive, '_solve') as solve:
+                solutions = derive_depths(['a', 'i', 'ii'])
+            self.assertFalse(solve.called)
+            self.assertEqual(derive.solution_cache.hits, 1)
+        self.assertEqual(self.depths(solutions), [[0, 1, 1]])
+
+    def test_version_in_key(self):
+        """Bumping the version invalidates earlier solutions"""
+        key = self.cache.key(['a', 'i'], [])
+        with patch.object(derive.SolutionCache, 'CACHE_VERSION',
+                          derive.SolutionCache.CACHE_VERSION + 1):
+            self.assertNotEqual(self.cache.key(['a', 'i'], []), key)
+
+    def test_evict(self):
+        """The disk cache is only evicted if it was added to"""
+        with CliRunner().isolated_filesystem(), \
+                patch.object(DiskCache, 'evict') as evict:
+            self.cache.evict()      # not persisted
+            self.cache.persist()
+            self.cache.evict()
+            self.assertFalse(evict.called)
+            derive_depths(['a', 'i', 'ii', 'iii'])
+            self.cache.evict()
+            self.assertTrue(evict.called)
+
+    def test_fast_path(self):
+        """Unambiguous lists skip the search, but are still verified against
+        the constraints"""
+        with patch.object(derive, '_solve') as solve:
+            solutions = derive_depths(['a', '1', '2', 'b', 'c', '1'])
+            self.assertEqual(self.depths(solutions), [[0, 1, 1, 0, 0, 1]])
+            self.assertEqual(derive_depths(['A', 'B'], [
+                optional_rules.limit_paragraph_types(markers.lower)]), [])
+            self.assertFalse(solve.called)
+
+            derive_depths(['a', 'i'])   # ambiguous
+            derive_depths(['a', 'c'])   # gap
+            self.assertEqual(solve.call_count, 2)
+
+    def test_equivalent_to_reference(self):
+        """Randomized marker lists resolve to the same solutions as the
+        reference implementation"""
+        rng = random.Random(1234)
+        pool = ['a', 'b', 'c', 'i', 'ii', 'iii', '1', '2', '3', 'A', 'B',
+                markers.emphasize('1'), markers.emphasize('2'), MARKERLESS,
+                STARS_TAG, INLINE_STARS]
+        constraint_sets = [
+            [], [optional_rules.depth_type_inverses,
+                 optional_rules.limit_sequence_gap(3)]]
+        for _ in range(200):
+            marker_list = [rng.choice(pool)
+                           for _ in range(rng.randint(1, 6))]
+            for constraints in constraint_sets:
+                self.assertEqual(
+                    self.depths(derive_depths(marker_list, constraints)),
+                    self.depths(reference.derive_depths(marker_list,
+                                                        constraints)))
@@ -1,8 +1,12 @@
+import gc
 import json
+import pickle
+import random
 from unittest import TestCase
 
 from regparser.tree import struct
 from regparser.tree.depth.markers import MARKERLESS
+from tests import reference
 
 
 class NodeTest(TestCase):
@@ -42,6 +46,91 @@ class NodeTest(TestCase):
         self.assertTrue(struct.Node("", label=['111', '22']).is_section())
         self.assertTrue(struct.Node("", label=['111', '22a']).is_section())
 
+    def test_compact(self):
+        """Nodes have no per-instance __dict__; label segments and node
+        types are shared between nodes"""
+        first = struct.Node(label=['111', u'22'], node_type=u're' + u'gtext')
+        second = struct.Node(label=['111', '22', 'a'])
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIs(first.label[1], second.label[1])
+        self.assertIs(first.node_type, second.node_type)
+
+    def test_fields(self):
+        node = struct.Node('text', label=['111', '22'], title='Title')
+        self.assertEqual(node.fields(), {
+            'text': 'text', 'children': [], 'label': ['111', '22'],
+            'title': 'Title', 'node_type': struct.Node.REGTEXT,
+            'source_xml': None})
+        node.tagged_text = 'tagged'
+        self.assertEqual(node.fields()['tagged_text'], 'tagged')
+
+    def test_pickle(self):
+        node = struct.Node('text', label=['111', '22'], children=[
+            struct.Node('child', label=['111', '22', 'a'])])
+        node.tagged_text = 'tagged'
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            result = pickle.loads(pickle.dumps(node, protocol))
+            self.assertEqual(result, node)
+            self.assertEqual(result.tagged_text, 'tagged')
+            self.assertEqual(result.children[0].text, 'child')
+
+    def test_eq(self):
+        def tree(leaf_text):
+            return struct.Node('root', label=['111'], children=[
+                struct.Node('sect', label=['111', '1'], children=[
+                    struct.Node(leaf_text, label=['111', '1', 'a'])])])
+        self.assertEqual(tree('a'), tree('a'))
+        self.assertNotEqual(tree('a'), tree('b'))
+        self.assertFalse(tree('a') != tree('a'))
+        self.assertNotEqual(tree('a'), 'a string')
+        self.assertNotEqual(struct.Node(label=['111'], title='t'),
+                            struct.Node(label=['111']))
+
+    def test_ordering(self):
+        first = struct.Node('b', label=['111', '1'])
+        second = struct.Node('a', label=['111', '2'])
+        third = struct.Node('a', label=['111', '2'], children=[first])
+        self.assertEqual(sorted([third, second, first]),
+                         [first, second, third])
+        self.assertTrue(first <= first)
+        self.assertTrue(third > second)
+        self.assertTrue(third >= second)
+
+    def test_content_hash(self):
+        """Content hashes match for equal trees and are cached, letting
+        equality skip the comparison of children"""
+        lhs = struct.Node('root', label=['111'], children=[
+            struct.Node('child', label=['111', '1'])])
+        rhs = struct.Node('root', label=['111'], children=[
+            struct.Node('child', label=['111', '1'])])
+        self.assertEqual(lhs.content_hash(), rhs.content_hash())
+        self.assertEqual(lhs.children[0]._content_hash,
+                         rhs.children[0].content_hash())
+
+        rhs.children[0].text = 'modified'
+        self.assertEqual(lhs, rhs)  # stale; relies on the cached hashes
+        rhs.clear_content_hash()
+        self.assertNotEqual(lhs, rhs)
+        self.assertNotEqual(lhs.content_hash(), rhs.content_hash())
+
+        copied = pickle.loads(pickle.dumps(lhs, pickle.HIGHEST_PROTOCOL))
+        self.assertIsNone(getattr(copied, '_content_hash', None))
+        self.assertNotIn('_content_hash', lhs.fields())
+
+    def test_content_hash_fields_delimited(self):
+        """Moving characters between fields changes the hash, and equality
+        doesn't change once hashes are cached"""
+        lhs = struct.Node('ab', label=['1'])
+        rhs = struct.Node('a', label=['1'], title='b')
+        self.assertNotEqual(lhs, rhs)
+        self.assertNotEqual(lhs.content_hash(), rhs.content_hash())
+        self.assertNotEqual(lhs, rhs)
+
+        lhs = struct.Node('a', label=['1', '2'])
+        rhs = struct.Node('a', label=['1-2'])
+        lhs.content_hash(), rhs.content_hash()
+        self.assertNotEqual(lhs, rhs)
+
 
 class DepthTreeTest(TestCase):
     def test_walk(self):
@@ -63,6 +152,48 @@ class DepthTreeTest(TestCase):
         self.assertEqual([n1, n2, n4, n3], order)
         self.assertEqual(["1", "4", "3"], ret_val)
 
+    def test_iter_nodes(self):
+        n7 = struct.Node('7')
+        n6 = struct.Node('6', children=[n7])
+        n5 = struct.Node('5')
+        n4 = struct.Node('4', children=[n5, n6])
+        n3 = struct.Node('3')
+        n2 = struct.Node('2', children=[n3])
+        n1 = struct.Node('1', children=[n2, n4])
+        self.assertEqual(
+            ''.join(n.text for n in struct.iter_nodes(n1)), '1234567')
+        self.assertEqual(
+            ''.join(n.text for n in struct.iter_nodes(n1, post_order=True)),
+            '3257641')
+
+        # children may be modified during a pre-order traversal
+        texts = []
+        for node in struct.iter_nodes(n1):
+            texts.append(node.text)
+            if node is n4:
+                node.children = [n6]
+        self.assertEqual(''.join(texts), '123467')
+
+    def test_iter_nodes_deep(self):
+        """Deep trees shouldn't hit the recursion limit; lazy iteration
+        allows stopping early"""
+        root = struct.Node('0')
+        node = root
+        for idx in range(1, 5000):
+            child = struct.Node(str(idx))
+            node.children.append(child)
+            node = child
+        self.assertEqual(len(struct.walk(root, lambda n: n.text)), 5000)
+        seen = []
+
+        def predicate(node):
+            seen.append(node)
+            return node.text == '10'
+        self.assertEqual(struct.find_first(root, predicate).text, '10')
+        self.assertEqual(len(seen), 11)
+        self.assertEqual(
+            next(struct.iter_nodes(root, post_order=True)).text, '4999')
+
     def test_filter_walk(self):
         node = struct.Node(label="1", children=[struct.Node(label="3"),
                                                 struct.Node(label="5")])
@@ -200,6 +331,58 @@ class DepthTreeTest(TestCase):
             ])
         ])
 
+    def test_treeify_matches_reference(self):
+        """Randomized comparison against the original implementation,
+        including duplicates, interpretations and missing intermediate
+        labels"""
+        rng = random.Random(1234)
+
+        def random_label():
+            label = [rng.choice('12')]
+            label.extend(rng.choice('ab') for _ in range(rng.randint(0, 3)))
+            if rng.random() < 0.2:
+                label.append(struct.Node.INTERP_MARK)
+            return label
+
+        def nodes(specs):
+            """Fresh nodes each time; treeify modifies them"""
+            return [struct.Node('-'.join(label), label=label,
+                                children=[struct.Node('existing')]
+                                if has_child else [])
+                    for label, has_child in specs]
+
+        for _ in range(300):
+            specs = [(random_label(), rng.random() < 0.1)
+                     for _ in range(rng.randint(0, 15))]
+            self.assertEqual(struct.treeify(nodes(specs)),
+                             reference.treeify(nodes(specs)))
+
+            specs = [(label[:2], has_child) for label, has_child in specs]
+            self.assertEqual(struct.merge_duplicates(nodes(specs)),
+                             reference.merge_duplicates(nodes(specs)))
+
+    def test_traversal_matches_reference(self):
+        """Randomized comparison of walk, find and join_text against the
+        original implementations"""
+        rng = random.Random(4321)
+
+        def random_tree(label, depth):
+            children = [random_tree(label + [str(idx)], depth - 1)
+                        for idx in range(rng.randint(0, 3) if depth else 0)]
+            return struct.Node('-'.join(label), label=label,
+                               children=children)
+
+        for _ in range(50):
+            tree = random_tree(['1000'], 4)
+            labels = struct.walk(tree, struct.Node.label_id)
+            self.assertEqual(labels,
+                             reference.walk(tree, struct.Node.label_id))
+            for label in labels + ['1000-missing']:
+                self.assertEqual(struct.find(tree, label),
+                                 reference.find(tree, label))
+            self.assertEqual(struct.join_text(tree),
+                             reference.join_text(tree))
+
 
 class FrozenNodeTests(TestCase):
     def test_comparison(self):
@@ -278,6 +461,52 @@ class FrozenNodeTests(TestCase):
         self.assertEqual(same1.hash, same2.hash)
         self.assertNotEqual(same1.hash, diff.hash)
 
+    def test_pool_weak(self):
+        """The pool does not keep nodes alive. Once the original is gone, an
+        identical node becomes the prototype"""
+        args = {'text': 'pool text', 'label': ['1111', '2']}
+        first = struct.FrozenNode(**args)
+        first_hash = first.hash
+        second = struct.FrozenNode(**args)
+        self.assertIs(second.prototype(), first)
+
+        del first
+        gc.collect()
+        self.assertNotIn(first_hash, struct.FrozenNode._pool)
+        self.assertIs(second.prototype(), second)
+        self.assertIs(struct.FrozenNode(**args).prototype(), second)
+
+    def test_pool_stats(self):
+        before = struct.FrozenNode.pool_stats()
+        kept = [struct.FrozenNode(text='stats', label=['1111', '3'])
+                for _ in range(3)]
+        after = struct.FrozenNode.pool_stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertTrue(0 < after['hit_rate'] <= 1)
+        self.assertIn(kept[0].hash, struct.FrozenNode._pool)
+
+    def test_pool_plateau(self):
+        """Processing one part after another shouldn't accumulate nodes from
+        parts we are no longer using"""
+        def part_tree(part):
+            return struct.Node(label=[part], children=[
+                struct.Node('Section {}'.format(idx), label=[part, str(idx)],
+                            children=[struct.Node(
+                                'Paragraph {}'.format(par),
+                                label=[part, str(idx), par])
+                                for par in 'abcde'])
+                for idx in range(1, 20)])
+
+        sizes = []
+        for part in range(1000, 1010):
+            frozen = struct.FrozenNode.from_node(part_tree(str(part)))
+            self.assertEqual(frozen.prototype(), frozen)
+            del frozen
+            gc.collect()
+            sizes.append(struct.FrozenNode.pool_stats()['size'])
+        self.assertEqual(len(set(sizes)), 1)
+
 
 class NodeTests(TestCase):
     def test_is_markerless_label(self):